@@ -0,0 +1,116 @@
+"""
+End-to-end scenario throughput on the gamma_cross net.
+
+Runs a fixed set of parameter rows through GammaCrossScenario and reports
+seconds per scenario and per simulation step. Uses SUMO when it is on the
+PATH; --standin runs the same rows on the scripted TraCI stand-in instead,
+and --replay serves a log recorded by benchmarks.replay_check, which
+isolates the client-side cost of the scenario loop. Run from the
+repository root:
+    python -m benchmarks.bench_e2e [--rows N] [--standin | --replay LOG]
+        [--baseline FILE]
+"""
+import argparse
+import shutil
+import time
+
+import pandas as pd
+
+import constants
+import scenarios
+import traci_standin
+from benchmarks import fixtures, harness
+
+def run_rows(rows : list, repeat : int, rewind = None) -> dict:
+    """
+    Runs every row in @rows, @repeat times, counting simulation steps.
+    @rewind, if given, is called before each repeat.
+    """
+    traci = scenarios.traci
+    step = traci.simulationStep
+    n_steps = [0]
+    def counting_step(*args, **kwargs):
+        n_steps[0] += 1
+        return step(*args, **kwargs)
+    traci.simulationStep = counting_step
+
+    per_scenario = []
+    try:
+        for i in range(repeat):
+            n_steps[0] = 0
+            if rewind is not None:
+                rewind()
+            start = time.perf_counter()
+            for params in rows:
+                scenarios.GammaCrossScenario(params)
+                continue
+            elapsed = time.perf_counter() - start
+            per_scenario.append(elapsed / len(rows))
+            continue
+    finally:
+        traci.simulationStep = step
+
+    per_scenario.sort()
+    median = per_scenario[len(per_scenario) // 2]
+    return {
+        "scenario" : {
+            "median_s" : median,
+            "min_s" : per_scenario[0],
+            "repeat" : repeat,
+            "number" : len(rows),
+            "scenarios_per_s" : 1 / median,
+        },
+        "step" : {
+            "median_s" : median * len(rows) / n_steps[0],
+            "min_s" : per_scenario[0] * len(rows) / n_steps[0],
+            "repeat" : repeat,
+            "number" : n_steps[0]
+        }
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    harness.add_arguments(parser)
+    parser.add_argument("--rows", type=int, default=20,
+        help="Number of fixed parameter rows.")
+    parser.add_argument("--standin", action="store_true",
+        help="Run on the scripted TraCI stand-in instead of SUMO.")
+    parser.add_argument("--replay", default=None,
+        help="Replay this TraCI log instead of running a simulation.")
+    args = parser.parse_args()
+
+    if args.replay is not None:
+        replay, meta = traci_standin.TraCIReplay.load(args.replay)
+        rows = [pd.Series(params) for params in meta["rows"]]
+        with traci_standin.install(replay):
+            # Skip the client start up of logs recorded on SUMO
+            if meta["backend"] == "sumo":
+                import traci_clients
+                traci_clients.GenericClient(constants.traci.gamma_cross.config)
+            i_first = replay.n_replayed
+            results = run_rows(rows, args.repeat,
+                lambda : replay.rewind(i_first))
+        suite = "e2e-replay"
+    elif args.standin:
+        rows = fixtures.fixed_params(args.rows)
+        with traci_standin.install(traci_standin.ScriptedTraCI()):
+            results = run_rows(rows, args.repeat)
+        suite = "e2e-standin"
+    elif shutil.which("sumo") is None:
+        results = {"scenario" : {"skipped" : "sumo is not on the PATH"}}
+        suite = "e2e"
+    else:
+        import traci_clients
+        rows = fixtures.fixed_params(args.rows)
+        client = traci_clients.GenericClient(constants.traci.gamma_cross.config)
+        try:
+            results = run_rows(rows, args.repeat)
+        finally:
+            client.close()
+        suite = "e2e"
+
+    harness.report(suite, results, args)
+    return
+
+if __name__ == "__main__":
+    main()
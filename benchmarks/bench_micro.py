@@ -0,0 +1,75 @@
+"""
+Per-call cost of the scenario metrics, the polygon helper and the AI step.
+
+Runs against the scripted TraCI stand-in, so SUMO is not needed and the
+timings cover only the Python side of each call. Run from the repository
+root:
+    python -m benchmarks.bench_micro [--repeat N] [--number N] [--baseline FILE]
+"""
+import argparse
+
+import constants
+import scenarios
+import traci_standin
+import utils
+from benchmarks import fixtures, harness
+
+def bench_passenger_polygon(args) -> dict:
+    return harness.measure(
+        lambda : utils.passenger_polygon(37.5, (12.0, -4.0)),
+        args.repeat, args.number)
+
+def bench_approach(args) -> dict:
+    """
+    Metrics measured while the DUT waits in the approach lane, behind two
+    vehicles.
+    """
+    scenario = fixtures.prepared_scenario(fixtures.dense_params())
+    ai = scenarios.GammaCrossAI()
+    return {
+        "find_vehicle_in_front_of_dut" : harness.measure(
+            scenario.find_vehicle_in_front_of_dut, args.repeat, args.number),
+        "foe_in_front_metrics" : harness.measure(
+            scenario.foe_in_front_metrics, args.repeat, args.number),
+        "dtc_approach_metrics" : harness.measure(
+            scenario.dtc_approach_metrics, args.repeat, args.number),
+        "braking_force_metrics" : harness.measure(
+            scenario.braking_force_metrics, args.repeat, args.number),
+        "GammaCrossAI.on_step" : harness.measure(
+            ai.on_step, args.repeat, args.number),
+    }
+
+def bench_intersection(args) -> dict:
+    """
+    Metrics measured while the DUT crosses the intersection.
+    """
+    scenario = fixtures.prepared_scenario(fixtures.dense_params())
+    traci = scenarios.traci
+    in_intersection = fixtures.step_until(
+        lambda : traci.vehicle.getLaneID(constants.DUT)[0] == ":")
+    if not in_intersection:
+        return {"dtc_intersection_metrics" :
+            {"error" : "DUT never reached the intersection"}}
+    return {
+        "dtc_intersection_metrics" : harness.measure(
+            scenario.dtc_intersection_metrics, args.repeat, args.number),
+        "get_foes_in_intersection" : harness.measure(
+            scenario.get_foes_in_intersection, args.repeat, args.number),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    harness.add_arguments(parser)
+    parser.add_argument("--number", type=int, default=200,
+        help="Calls per repeat.")
+    args = parser.parse_args()
+
+    results = {"passenger_polygon" : bench_passenger_polygon(args)}
+    with traci_standin.install(traci_standin.ScriptedTraCI()):
+        results.update(bench_approach(args))
+        results.update(bench_intersection(args))
+    harness.report("micro", results, args)
+    return
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Startup time of worker processes and CLI entry points.
+
+Run from the repository root:
+    python -m benchmarks.bench_startup [--repeat N] [--baseline FILE]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import param_spec
+from benchmarks import harness
+
+# Modules a headless worker or short CLI run imports first
+MODULES = ["utils", "param_spec", "traci_clients", "scenarios", "dino"]
+
+def time_import(module : str, repeat : int) -> dict:
+    """
+    Wall time of importing @module in a fresh interpreter, @repeat times.
+    """
+    times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, "-c", "import %s" % module],
+            capture_output = True
+        )
+        times.append(time.perf_counter() - start)
+        if result.returncode != 0:
+            return {"error" : result.stderr.decode().strip().splitlines()[-1]}
+        continue
+    return {
+        "median_s" : statistics.median(times),
+        "min_s" : min(times),
+        "repeat" : repeat,
+        "number" : 1
+    }
+
+def time_param_spec(repeat : int) -> dict:
+    """
+    Parsing the xlsx parameter spec vs. loading the compiled cache.
+    """
+    cache_fn = os.path.join(tempfile.mkdtemp(), "params.pkl")
+    return {
+        "param_spec xlsx" : harness.measure(
+            lambda : param_spec.compile_spec(cache_fn = cache_fn), repeat),
+        "param_spec cached" : harness.measure(
+            lambda : param_spec.load_spec(cache_fn = cache_fn), repeat)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    harness.add_arguments(parser)
+    args = parser.parse_args()
+
+    results = {"import %s" % m : time_import(m, args.repeat) for m in MODULES}
+    results.update(time_param_spec(args.repeat))
+    harness.report("startup", results, args)
+    return
+
+if __name__ == "__main__":
+    main()
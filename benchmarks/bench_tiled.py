@@ -0,0 +1,138 @@
+"""
+Throughput of tiled multi-scenario runs and their agreement with single runs.
+
+Runs the same parameter rows one test per SUMO instance and K tests per
+instance on tiled networks, then reports tests per second for each K and
+checks every tiled score against its single-run score. Run from the
+repository root:
+    python -m benchmarks.bench_tiled [--rows N] [--tiles 1,2,4,8] [--standin]
+"""
+import argparse
+import math
+import shutil
+import sys
+import time
+
+import pandas as pd
+
+import constants
+import scenarios
+import tiled_net
+import traci_standin
+from benchmarks import fixtures, harness
+
+# Tiles sit at different coordinates and start on a different clock, so
+# distances and times agree to float rounding, not bit for bit.
+TOLERANCE = 1e-6
+
+def connect(config : dict, init_state_fn : str, standin : bool):
+    """
+    A context with TraCI connected to the network in @config.
+    """
+    if standin:
+        return traci_standin.install(traci_standin.ScriptedTraCI(
+            config["--net-file"], config["--route-files"]))
+
+    import contextlib
+    import traci_clients
+
+    @contextlib.contextmanager
+    def client():
+        c = traci_clients.GenericClient(config, init_state_fn)
+        try:
+            yield c
+        finally:
+            c.close()
+    return client()
+
+def run_single(rows : list) -> list[pd.Series]:
+    return [scenarios.GammaCrossScenario(params).score for params in rows]
+
+def run_tiled(rows : list, k : int, net_file : str) -> list[pd.Series]:
+    scores = []
+    for i in range(0, len(rows), k):
+        scores += scenarios.TiledGammaCrossScenario(rows[i:i+k], net_file).scores
+        continue
+    return scores
+
+def same_value(x, y) -> bool:
+    """
+    Equality of score values, with floats compared to TOLERANCE.
+    """
+    if isinstance(x, float) and isinstance(y, float):
+        return math.isclose(x, y, rel_tol=TOLERANCE, abs_tol=TOLERANCE)
+    if isinstance(x, dict) and isinstance(y, dict):
+        return x.keys() == y.keys() \
+            and all(same_value(x[k], y[k]) for k in x)
+    if isinstance(x, list) and isinstance(y, list):
+        return len(x) == len(y) \
+            and all(same_value(a, b) for a, b in zip(x, y))
+    return x == y
+
+def same_score(a : pd.Series, b : pd.Series) -> bool:
+    return same_value(a.to_dict(), b.to_dict())
+
+def timed(fn) -> tuple:
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    harness.add_arguments(parser)
+    parser.add_argument("--rows", type=int, default=32)
+    parser.add_argument("--tiles", default="1,2,4,8",
+        help="Comma separated tile counts.")
+    parser.add_argument("--standin", action="store_true",
+        help="Run on the scripted TraCI stand-in instead of SUMO.")
+    args = parser.parse_args()
+
+    if not args.standin and shutil.which("sumo") is None:
+        print("sumo is not on the PATH, use --standin.")
+        sys.exit(1)
+
+    rows = fixtures.fixed_params(args.rows)
+    results = {}
+
+    with connect(constants.traci.gamma_cross.config,
+            constants.sumo.init_state_file, args.standin):
+        single, elapsed = timed(lambda : run_single(rows))
+    results["single"] = {
+        "median_s" : elapsed / len(rows),
+        "min_s" : elapsed / len(rows),
+        "repeat" : 1,
+        "number" : len(rows),
+        "tests_per_s" : len(rows) / elapsed
+    }
+
+    failed = False
+    for k in [int(x) for x in args.tiles.split(",")]:
+        config = tiled_net.build(k)
+        with connect(config, constants.traci.tiled_gamma_cross.init_state_file,
+                args.standin):
+            tiled, elapsed = timed(
+                lambda : run_tiled(rows, k, config["--net-file"]))
+        mismatch = [i for i in range(len(rows)) \
+            if not same_score(single[i], tiled[i])]
+        failed |= len(mismatch) > 0
+        results["tiled x%d" % k] = {
+            "median_s" : elapsed / len(rows),
+            "min_s" : elapsed / len(rows),
+            "repeat" : 1,
+            "number" : len(rows),
+            "tests_per_s" : len(rows) / elapsed,
+            "speedup" : results["single"]["median_s"] * len(rows) / elapsed,
+            "mismatch" : mismatch
+        }
+        print("x%d: %.2f tests/s, %.2fx single, %d mismatched scores %s" % (
+            k, len(rows) / elapsed, results["tiled x%d" % k]["speedup"],
+            len(mismatch), mismatch))
+        continue
+
+    harness.report("tiled-standin" if args.standin else "tiled", results, args)
+    if failed:
+        sys.exit(1)
+    return
+
+if __name__ == "__main__":
+    main()
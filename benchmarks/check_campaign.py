@@ -0,0 +1,89 @@
+"""
+End-to-end check of campaign.py with several workers on this host.
+
+Starts a coordinator, launches --workers worker pools on the scripted TraCI
+stand-in, kills one pool part way through and checks that every job still
+finishes exactly once with the score a local run gives. Run from the
+repository root:
+    python -m benchmarks.check_campaign [--rows N] [--workers W] [--procs P]
+"""
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+import campaign
+import scenarios
+import traci_standin
+from benchmarks import fixtures
+
+def start_worker(port : int, procs : int) -> subprocess.Popen:
+    # A session of its own, so the pool and its processes die together
+    return subprocess.Popen(
+        [sys.executable, "campaign.py", "worker", "--port", str(port),
+            "--procs", str(procs), "--standin"],
+        start_new_session = True,
+        stdout = subprocess.DEVNULL
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=60)
+    parser.add_argument("--workers", type=int, default=3)
+    parser.add_argument("--procs", type=int, default=2)
+    parser.add_argument("--batch-size", type=int, default=20)
+    args = parser.parse_args()
+
+    rows = fixtures.fixed_params(args.rows)
+    with traci_standin.install(traci_standin.ScriptedTraCI()):
+        expected = [scenarios.GammaCrossScenario(p).score for p in rows]
+
+    results_file = os.path.join(tempfile.mkdtemp(), "results.pkl")
+    coordinator = campaign.Coordinator(port=0, results_file=results_file,
+        lease_timeout_s=3.0)
+    port = coordinator.address[1]
+    workers = [start_worker(port, args.procs) for i in range(args.workers)]
+
+    start = time.perf_counter()
+    scores = []
+    try:
+        for i in range(0, len(rows), args.batch_size):
+            if i > 0 and workers[0].poll() is None:
+                print("Killing worker pool %d" % workers[0].pid)
+                os.killpg(workers[0].pid, signal.SIGKILL)
+            scores += coordinator.evaluate(rows[i:i+args.batch_size])
+            print("%d / %d tests, %s" % (len(scores), len(rows),
+                coordinator.board.stats()))
+            continue
+    finally:
+        coordinator.close()
+        for proc in workers:
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                os.killpg(proc.pid, signal.SIGKILL)
+            continue
+    elapsed = time.perf_counter() - start
+
+    streamed = list(campaign.read_results(results_file))
+    job_ids = [r[0] for r in streamed]
+    # Pickles made in different processes share objects differently, so
+    # compare the values rather than the bytes
+    dump = lambda ss : repr([s.to_dict() for s in ss])
+    checks = {
+        "scores match local runs" : dump(scores) == dump(expected),
+        "every job streamed once" : sorted(job_ids) == list(range(len(rows))),
+    }
+    print("%.2f tests/s" % (len(rows) / elapsed))
+    for name, ok in checks.items():
+        print("%-26s %s" % (name, "ok" if ok else "FAILED"))
+        continue
+    if not all(checks.values()):
+        sys.exit(1)
+    return
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Check of the target_classifiers reductions on collision columns of every
+shape a campaign writes: no contact in the whole frame (list<null> once in
+Arrow), legacy records without a duration (one record per contact step)
+and contact events with a duration. Each case must give the same values
+per Series, per DataFrame and per Arrow table. N_COLLISIONS must also
+count the events a capped test dropped. Run from the repository root:
+    python -m benchmarks.check_classifiers
+"""
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+import constants
+import target_classifiers
+
+def legacy_record(time : float) -> dict:
+    return {"lane" : "1si_0", "other id" : "foe_0", "other speed" : 5.0,
+        "other type" : "Car", "pos" : 10.0, "speed" : 3.0,
+        "status" : "collider", "time" : time}
+
+def event(duration : float) -> dict:
+    return {"pos" : 10.0, "onset" : 1.0, "duration" : duration, "n steps" : 1}
+
+CASES = {
+    "no contact" : ([[], [], []], [0., 0., 0.]),
+    "legacy" : (
+        [[legacy_record(0.1 * i) for i in range(120)], [], [legacy_record(0.)]],
+        [120 * constants.sumo.step_length, 0., constants.sumo.step_length]),
+    "events" : ([[event(11.0), event(0.5)], [], [event(2.0)]],
+        [11.5, 0., 2.0])
+}
+
+def check(name : str, collisions : list, expected : list[float]):
+    df = pd.DataFrame({"collisions" : collisions})
+    table = pa.table({"collisions" : pa.array(collisions)})
+    values = {
+        "series" : np.array([target_classifiers.CONTACT_TIME(row) \
+            for _, row in df.iterrows()], dtype=float),
+        "frame" : target_classifiers.CONTACT_TIME.frame(df).astype(float),
+        "arrow" : target_classifiers.CONTACT_TIME.arrow(table)\
+            .to_numpy(zero_copy_only=False)
+    }
+    for form, value in values.items():
+        assert np.allclose(value, expected), (name, form, value, expected)
+        continue
+
+    labels = target_classifiers.COLLISION.frame(df)
+    assert (labels == (np.array(expected) \
+        > constants.collision_target_contact_s)).all(), (name, labels)
+    assert (target_classifiers.COLLISION.arrow(table).to_numpy(
+        zero_copy_only=False) == labels).all(), name
+    print("%-12s ok %s" % (name, values["frame"]))
+    return
+
+def check_dropped():
+    n_kept = constants.max_collision_events
+    collisions = [[event(1.0)] * n_kept, [], [event(1.0)]]
+    expected = [n_kept + 90, 0, 1]
+    df = pd.DataFrame({"collisions" : collisions,
+        "n collisions dropped" : [90, 0, 0]})
+    table = pa.Table.from_pandas(df)
+    values = {
+        "series" : [target_classifiers.N_COLLISIONS(row) \
+            for _, row in df.iterrows()],
+        "frame" : target_classifiers.N_COLLISIONS.frame(df),
+        "arrow" : target_classifiers.N_COLLISIONS.arrow(table)\
+            .to_numpy(zero_copy_only=False),
+        # Campaigns from before the cap have no dropped count
+        "no count" : target_classifiers.N_COLLISIONS.frame(
+            df.drop(columns=["n collisions dropped"])) \
+            + df["n collisions dropped"].to_numpy()
+    }
+    for form, value in values.items():
+        assert np.array_equal(value, expected), ("dropped", form, value)
+        continue
+    assert target_classifiers.MANY_COLLISIONS.frame(df).tolist() \
+        == [True, False, False]
+    print("%-12s ok %s" % ("dropped", values["frame"]))
+    return
+
+def main():
+    for name, (collisions, expected) in CASES.items():
+        check(name, collisions, expected)
+        continue
+    check_dropped()
+
+    # Records that are neither events nor legacy ones are an error
+    measure = target_classifiers.Measure("collisions",
+        target_classifiers.SUM, "duration")
+    try:
+        measure.arrow(pa.table({"collisions" : pa.array([[{"pos" : 1.0}]])}))
+    except ValueError as e:
+        print("%-12s ok %s" % ("no default", e))
+    else:
+        raise AssertionError("A missing field without default must raise")
+    return
+
+if __name__ == "__main__":
+    main()
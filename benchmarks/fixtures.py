@@ -0,0 +1,65 @@
+"""
+Deterministic parameter rows and half-built scenarios for the benchmarks.
+"""
+import numpy as np
+import pandas as pd
+import scenarioxp as sxp
+
+import constants
+import param_spec
+import scenarios
+
+def manager() -> sxp.ScenarioManager:
+    return sxp.ScenarioManager(param_spec.load_spec())
+
+def fixed_params(n : int, seed : int = constants.seed) -> list[pd.Series]:
+    """
+    @n parameter rows drawn from a fixed seed, so every run of a benchmark
+    sees the same tests.
+    """
+    man = manager()
+    rng = np.random.RandomState(seed)
+    return [man.project(rng.random_sample(len(man.params))) \
+        for i in range(n)]
+
+def dense_params() -> pd.Series:
+    """
+    A parameter row with every traffic slot filled and the light at the
+    start of its cycle, the busiest case for the per-step metrics.
+    """
+    spec = param_spec.load_spec()
+    params = pd.Series(30.0, index=spec["feat"].values)
+    params["time0"] = 0
+    for feat in params.index:
+        if feat.startswith("vtype_"):
+            params[feat] = 1
+        continue
+    return params
+
+def prepared_scenario(params : pd.Series) -> scenarios.GammaCrossScenario:
+    """
+    A GammaCrossScenario initialized like the constructor does, stopped
+    before the simulation loop so single methods can be timed.
+    Call it with a TraCI connection (or stand-in) installed.
+    """
+    traci = scenarios.traci
+    scenario = scenarios.GammaCrossScenario(params, run=False)
+    traci.simulation.loadState(constants.sumo.init_state_file)
+    scenario.idle_until_start_time()
+    scenario.add_vehicles()
+    scenario.clear_polygons()
+    scenario.add_passenger_polygons()
+    scenario.start()
+    return scenario
+
+def step_until(condition, max_steps : int = 10000) -> bool:
+    """
+    Steps the simulation until @condition() holds.
+    """
+    traci = scenarios.traci
+    for i in range(max_steps):
+        if condition():
+            return True
+        traci.simulationStep()
+        continue
+    return False
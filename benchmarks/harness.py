@@ -0,0 +1,141 @@
+"""
+Shared timing, storage and regression checks for the benchmark scripts.
+
+Each run is stored as benchmarks/results/<suite>-<commit>.json. Passing
+--baseline compares the run against an earlier file and exits with status 1
+when any benchmark's median got slower by more than --tolerance.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+RESULTS_DIR = "benchmarks/results"
+
+def git_revision() -> str:
+    """
+    Short hash of the checked-out commit, with a "+dirty" suffix for
+    uncommitted changes.
+    """
+    try:
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "-uno"],
+            capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    if dirty:
+        rev += "+dirty"
+    return rev
+
+def measure(fn, repeat : int = 5, number : int = 1) -> dict:
+    """
+    Times @number calls of @fn, @repeat times.
+
+    :: Return ::
+        Seconds per call: the median and minimum over the repeats.
+    """
+    times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        for j in range(number):
+            fn()
+            continue
+        times.append((time.perf_counter() - start) / number)
+        continue
+    return {
+        "median_s" : statistics.median(times),
+        "min_s" : min(times),
+        "repeat" : repeat,
+        "number" : number
+    }
+
+def add_arguments(parser : argparse.ArgumentParser):
+    """
+    Options every benchmark script shares.
+    """
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--out", default=None,
+        help="Result file. Defaults to %s/<suite>-<commit>.json" % RESULTS_DIR)
+    parser.add_argument("--baseline", default=None,
+        help="Earlier result file to compare against.")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+        help="Allowed slowdown of a median before it counts as a regression.")
+    return
+
+def save(suite : str, benchmarks : dict, out : str = None) -> str:
+    """
+    Writes @benchmarks with the commit and machine they were measured on.
+
+    :: Return ::
+        The path of the result file.
+    """
+    revision = git_revision()
+    if out is None:
+        out = os.path.join(RESULTS_DIR, "%s-%s.json" % (suite, revision))
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w") as f:
+        json.dump({
+            "suite" : suite,
+            "revision" : revision,
+            "time" : time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python" : platform.python_version(),
+            "machine" : platform.node(),
+            "benchmarks" : benchmarks
+        }, f, indent=2)
+    return out
+
+def compare(benchmarks : dict, baseline_fn : str, tolerance : float) -> list:
+    """
+    Benchmarks whose median is more than @tolerance slower than in the
+    result file @baseline_fn.
+
+    :: Return ::
+        A list of (name, baseline median, current median).
+    """
+    with open(baseline_fn) as f:
+        baseline = json.load(f)["benchmarks"]
+
+    regressions = []
+    for name, r in benchmarks.items():
+        if not "median_s" in r or not "median_s" in baseline.get(name, {}):
+            continue
+        before = baseline[name]["median_s"]
+        if r["median_s"] > before * (1 + tolerance):
+            regressions.append((name, before, r["median_s"]))
+        continue
+    return regressions
+
+def report(suite : str, benchmarks : dict, args : argparse.Namespace):
+    """
+    Prints and saves the results of a suite, then compares them with the
+    baseline, exiting with status 1 on a regression.
+    """
+    for name, r in benchmarks.items():
+        if "error" in r:
+            print("%-32s failed: %s" % (name, r["error"]))
+        elif "skipped" in r:
+            print("%-32s skipped: %s" % (name, r["skipped"]))
+        else:
+            print("%-32s %10.3f ms" % (name, 1000 * r["median_s"]))
+        continue
+
+    out = save(suite, benchmarks, args.out)
+    print("Results written to %s" % out)
+
+    if args.baseline is None:
+        return
+
+    regressions = compare(benchmarks, args.baseline, args.tolerance)
+    for name, before, after in regressions:
+        print("REGRESSION %s: %.3f ms -> %.3f ms (+%.0f%%)" % (
+            name, 1000 * before, 1000 * after, 100 * (after / before - 1)))
+        continue
+    if regressions:
+        sys.exit(1)
+    print("No regressions against %s" % args.baseline)
+    return
@@ -0,0 +1,121 @@
+"""
+Record the TraCI traffic of fixed GammaCrossScenario runs, then replay it
+with no simulation behind it.
+
+    python -m benchmarks.replay_check record [--rows N] [--standin] [--log FILE]
+    python -m benchmarks.replay_check check [--lenient] [--log FILE]
+
+record runs the rows on SUMO (or the scripted stand-in) and saves every
+request, response and final score. check replays the log and exits with
+status 1 unless the scores are byte-identical to the recorded ones, which
+makes it a SUMO-free regression test for changes to the metric code.
+"""
+import argparse
+import os
+import pickle
+import shutil
+import sys
+import time
+
+import pandas as pd
+
+import constants
+import scenarios
+import traci_standin
+from benchmarks import fixtures
+
+LOG_FILE = "benchmarks/results/gamma_cross-replay.pkl"
+
+def score_bytes(scores : list[pd.Series]) -> bytes:
+    return pickle.dumps([s.to_dict() for s in scores],
+        protocol=pickle.HIGHEST_PROTOCOL)
+
+def run(rows : list[pd.Series]) -> list[pd.Series]:
+    return [scenarios.GammaCrossScenario(params).score for params in rows]
+
+def record(args):
+    rows = fixtures.fixed_params(args.rows)
+
+    if args.standin:
+        backend = traci_standin.ScriptedTraCI()
+    elif shutil.which("sumo") is None:
+        print("sumo is not on the PATH, use --standin to record the stand-in.")
+        sys.exit(1)
+    else:
+        import traci
+        backend = traci
+
+    recorder = traci_standin.TraCIRecorder(backend)
+    with traci_standin.install(recorder):
+        if not args.standin:
+            import traci_clients
+            client = traci_clients.GenericClient(
+                constants.traci.gamma_cross.config)
+        scores = run(rows)
+        if not args.standin:
+            client.close()
+
+    os.makedirs(os.path.dirname(args.log) or ".", exist_ok=True)
+    recorder.save(args.log, {
+        "backend" : "standin" if args.standin else "sumo",
+        "rows" : [params.to_dict() for params in rows],
+        "scores" : score_bytes(scores)
+    })
+    print("Recorded %d calls over %d tests to %s" % (
+        len(recorder.calls), len(rows), args.log))
+    return
+
+def check(args):
+    replay, meta = traci_standin.TraCIReplay.load(args.log,
+        strict = not args.lenient)
+    rows = [pd.Series(params) for params in meta["rows"]]
+
+    # The log opens with the client start up when it was recorded on SUMO
+    with traci_standin.install(replay):
+        if meta["backend"] == "sumo":
+            import traci_clients
+            traci_clients.GenericClient(constants.traci.gamma_cross.config)
+        start = time.perf_counter()
+        scores = run(rows)
+        elapsed = time.perf_counter() - start
+
+    print("Replayed %d tests (%d calls) in %.3f s, %.1f ms per test" % (
+        len(rows), replay.n_replayed, elapsed, 1000 * elapsed / len(rows)))
+
+    if score_bytes(scores) != meta["scores"]:
+        recorded = pickle.loads(meta["scores"])
+        for i, (before, after) in enumerate(zip(recorded, scores)):
+            after = after.to_dict()
+            diff = [k for k in before if pickle.dumps(before[k]) != \
+                pickle.dumps(after.get(k))]
+            if diff:
+                print("Test %d differs in %s" % (i, ", ".join(diff)))
+            continue
+        sys.exit(1)
+    print("Scores are byte-identical to the recording.")
+    return
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    p = commands.add_parser("record")
+    p.add_argument("--rows", type=int, default=20)
+    p.add_argument("--standin", action="store_true",
+        help="Record the scripted TraCI stand-in instead of SUMO.")
+    p.add_argument("--log", default=LOG_FILE)
+
+    p = commands.add_parser("check")
+    p.add_argument("--lenient", action="store_true",
+        help="Allow requests within a step to be reordered or dropped.")
+    p.add_argument("--log", default=LOG_FILE)
+
+    args = parser.parse_args()
+    if args.command == "record":
+        record(args)
+    else:
+        check(args)
+    return
+
+if __name__ == "__main__":
+    main()
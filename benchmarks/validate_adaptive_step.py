@@ -0,0 +1,110 @@
+"""
+Accuracy and step savings of adaptive stepping against fixed steps.
+
+Runs the same parameter rows with constants.sumo.adaptive_step off and on,
+then reports per-metric differences and the number of client steps saved.
+Exits with status 1 when more than --max-mismatch of the tests disagree on
+an outcome (collisions, red light, side move, TL state). Run from the
+repository root:
+    python -m benchmarks.validate_adaptive_step [--rows N] [--standin]
+"""
+import argparse
+import shutil
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+import constants
+import scenarios
+import traci_standin
+from benchmarks import fixtures
+
+NUMERIC = ["speed (on enter)", "braking force", "dtc (front)", "ttc (front)",
+    "dtc (inter)", "dtc (approach)", "time (on enter)", "time (end)",
+    "n stops"]
+
+def outcomes(score : pd.Series) -> tuple:
+    """
+    The parts of a score the campaigns classify tests by.
+    """
+    return (
+        len(score["collisions"]) > 0,
+        bool(score["run red light"]),
+        score["side move"] >= 0,
+        score["tl state (on enter)"]
+    )
+
+def run(rows : list, adaptive : bool) -> tuple:
+    """
+    Scores and client step counts of @rows with adaptive stepping on or off.
+    """
+    constants.sumo.adaptive_step = adaptive
+    scores = []
+    n_steps = []
+    start = time.perf_counter()
+    for params in rows:
+        scenario = scenarios.GammaCrossScenario(params)
+        scores.append(scenario.score)
+        n_steps.append(scenario.n_steps)
+        continue
+    return pd.DataFrame(scores), np.array(n_steps), time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=50)
+    parser.add_argument("--standin", action="store_true",
+        help="Run on the scripted TraCI stand-in instead of SUMO.")
+    parser.add_argument("--max-mismatch", type=float, default=0.02,
+        help="Allowed fraction of tests with a different outcome.")
+    args = parser.parse_args()
+
+    rows = fixtures.fixed_params(args.rows)
+    adaptive = constants.sumo.adaptive_step
+
+    if args.standin:
+        with traci_standin.install(traci_standin.ScriptedTraCI()):
+            fixed_df, fixed_steps, fixed_s = run(rows, False)
+            adapt_df, adapt_steps, adapt_s = run(rows, True)
+    elif shutil.which("sumo") is None:
+        print("sumo is not on the PATH, use --standin.")
+        sys.exit(1)
+    else:
+        import traci_clients
+        client = traci_clients.GenericClient(constants.traci.gamma_cross.config)
+        fixed_df, fixed_steps, fixed_s = run(rows, False)
+        adapt_df, adapt_steps, adapt_s = run(rows, True)
+        client.close()
+    constants.sumo.adaptive_step = adaptive
+
+    print("%-22s %12s %12s" % ("metric", "mean |diff|", "max |diff|"))
+    for feat in NUMERIC:
+        a = fixed_df[feat].astype(float)
+        b = adapt_df[feat].astype(float)
+        # Sentinels mean "not measured", compare them as outcomes instead
+        valid = (a >= 0) & (a < 9999) & (b >= 0) & (b < 9999)
+        diff = (a[valid] - b[valid]).abs()
+        if len(diff) == 0:
+            print("%-22s %12s %12s" % (feat, "-", "-"))
+        else:
+            print("%-22s %12.4f %12.4f" % (feat, diff.mean(), diff.max()))
+        continue
+
+    mismatch = [i for i in range(len(rows)) \
+        if outcomes(fixed_df.iloc[i]) != outcomes(adapt_df.iloc[i])]
+    rate = len(mismatch) / len(rows)
+    print()
+    print("Outcome mismatches: %d of %d tests (%.1f%%) %s" % (
+        len(mismatch), len(rows), 100 * rate, mismatch))
+    print("Client steps: %d fixed, %d adaptive (%.1f%% saved)" % (
+        fixed_steps.sum(), adapt_steps.sum(),
+        100 * (1 - adapt_steps.sum() / fixed_steps.sum())))
+    print("Wall time: %.2f s fixed, %.2f s adaptive" % (fixed_s, adapt_s))
+
+    if rate > args.max_mismatch:
+        sys.exit(1)
+    return
+
+if __name__ == "__main__":
+    main()
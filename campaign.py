@@ -0,0 +1,533 @@
+"""
+Coordinator/worker distribution of GammaCrossScenario runs.
+
+The coordinator owns the explorers and their RNG (dino.Runner) and serves a
+JobBoard over TCP with a multiprocessing manager. Workers on any host
+connect to it, each running a pool of processes with one SUMO instance
+apiece, pull one job at a time and push the score back as soon as it is
+done. Processes heartbeat while they work; the jobs of a process that
+goes silent for constants.campaign.lease_timeout_s are put back on the
+queue. Every result is appended to a stream on the coordinator as it
+arrives, so a lost coordinator keeps what was finished.
+
+    python campaign.py coordinator [--port P] [--batch-size N]
+    python campaign.py worker --host H [--port P] [--procs N] [--standin]
+
+Several workers can share one box; every process picks its own free SUMO
+port and initial state file.
+
+The manager exchanges pickles, so anyone holding the authkey can run code
+on the coordinator. Campaigns on any host other than the loopback must
+share a secret through the CAMPAIGN_AUTHKEY environment variable; loopback
+ones fall back to constants.campaign.authkey_file.
+"""
+import argparse
+import collections
+import contextlib
+import os
+import pickle
+import socket
+import threading
+import time
+import traceback
+from multiprocessing import Process
+from multiprocessing.managers import BaseManager
+
+import pandas as pd
+
+import constants
+
+LOOPBACK_HOSTS = ["127.0.0.1", "localhost", "::1"]
+
+def load_authkey(host : str) -> bytes:
+    """
+    Shared secret of a campaign served on or connecting to @host:
+    CAMPAIGN_AUTHKEY, or for the loopback the per-user key of
+    constants.campaign.authkey_file.
+    """
+    key = os.environ.get("CAMPAIGN_AUTHKEY")
+    if key:
+        return key.encode()
+    if not host in LOOPBACK_HOSTS:
+        raise RuntimeError("Set CAMPAIGN_AUTHKEY to a shared secret to run "
+            "a campaign on %s" % host)
+
+    fn = constants.campaign.authkey_file
+    if not os.path.exists(fn):
+        os.makedirs(os.path.dirname(fn) or ".", exist_ok=True)
+        tmp_fn = "%s.%d" % (fn, os.getpid())
+        fd = os.open(tmp_fn, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as f:
+            f.write(os.urandom(32).hex())
+        try:
+            # Fails when another process created the key first
+            os.link(tmp_fn, fn)
+        except FileExistsError:
+            pass
+        os.remove(tmp_fn)
+    with open(fn) as f:
+        return f.read().strip().encode()
+
+class JobFailed(Exception):
+    def __init__(self, job_id : int, error : str):
+        """
+        A job failed on constants.campaign.max_attempts workers.
+        """
+        self.job_id = job_id
+        self.error = error
+        super().__init__("Job %d failed:\n%s" % (job_id, error))
+        return
+
+class JobBoard:
+    def __init__(self,
+            lease_timeout_s : float = constants.campaign.lease_timeout_s,
+            max_attempts : int = constants.campaign.max_attempts
+        ):
+        """
+        Queue of jobs, their leases and their results. Lives in the
+        coordinator and is shared with workers through the manager, which
+        calls it from one thread per connection.
+
+        :: Parameters ::
+            lease_timeout_s : float
+                Seconds without a heartbeat before a worker is lost.
+            max_attempts : int
+                Times a job is handed out before it counts as failed.
+        """
+        self._lease_timeout_s = lease_timeout_s
+        self._max_attempts = max_attempts
+        self._cond = threading.Condition()
+        self._next_id = 0
+        self._queue = collections.deque()
+        self._params = {}
+        self._attempts = {}
+        self._leases = {}
+        self._seen = {}
+        self._done = set()
+        self._results = collections.deque()
+        self._n_requeued = 0
+        self._shutdown = False
+        return
+
+    def submit(self, params_list : list[pd.Series]) -> list[int]:
+        """
+        Queues @params_list, returning the job ids.
+        """
+        with self._cond:
+            ids = []
+            for params in params_list:
+                job_id = self._next_id
+                self._next_id += 1
+                self._params[job_id] = params
+                self._attempts[job_id] = 0
+                self._queue.append(job_id)
+                ids.append(job_id)
+                continue
+            self._cond.notify_all()
+        return ids
+
+    def pull(self, worker : str, timeout : float) -> tuple:
+        """
+        Leases the next job to @worker, waiting up to @timeout seconds for
+        one.
+
+        :: Return ::
+            (job id, params), or None on timeout or shutdown.
+        """
+        with self._cond:
+            self._seen[worker] = time.monotonic()
+            self._cond.wait_for(
+                lambda : self._shutdown or len(self._queue) > 0, timeout)
+            if self._shutdown or len(self._queue) == 0:
+                return None
+            job_id = self._queue.popleft()
+            self._attempts[job_id] += 1
+            self._leases[job_id] = worker
+            return job_id, self._params[job_id]
+
+    def push(self, worker : str, job_id : int, score : pd.Series,
+            elapsed_s : float = 0, n_steps : int = 0):
+        """
+        Result of @job_id from @worker, which took @elapsed_s seconds over
+        @n_steps simulation steps. Late duplicates of a re-queued job are
+        dropped.
+        """
+        with self._cond:
+            self._seen[worker] = time.monotonic()
+            self._finish(job_id, worker, score, None, elapsed_s, n_steps)
+        return
+
+    def fail(self, worker : str, job_id : int, error : str):
+        """
+        @job_id raised @error on @worker. It is re-queued until it has
+        failed max_attempts times.
+        """
+        with self._cond:
+            if job_id in self._done:
+                return
+            self._leases.pop(job_id, None)
+            if self._attempts[job_id] < self._max_attempts:
+                self._queue.appendleft(job_id)
+                self._n_requeued += 1
+                self._cond.notify_all()
+            else:
+                self._finish(job_id, worker, None, error, 0, 0)
+        return
+
+    def _finish(self, job_id : int, worker : str, score, error,
+            elapsed_s : float, n_steps : int):
+        if job_id in self._done:
+            return
+        self._done.add(job_id)
+        self._leases.pop(job_id, None)
+        if job_id in self._queue:
+            self._queue.remove(job_id)
+        params = self._params.pop(job_id)
+        self._results.append(
+            (job_id, worker, params, score, error, elapsed_s, n_steps))
+        self._cond.notify_all()
+        return
+
+    def heartbeat(self, worker : str):
+        with self._cond:
+            self._seen[worker] = time.monotonic()
+        return
+
+    def requeue_lost(self) -> list[str]:
+        """
+        Puts the leased jobs of workers without a recent heartbeat back at
+        the front of the queue, failing those already handed out
+        max_attempts times: a job that crashes its SUMO process would
+        otherwise take down every worker in turn.
+
+        :: Return ::
+            The lost workers.
+        """
+        with self._cond:
+            now = time.monotonic()
+            lost = [w for w, t in self._seen.items() \
+                if now - t > self._lease_timeout_s]
+            for worker in lost:
+                del self._seen[worker]
+                continue
+            for job_id, worker in list(self._leases.items()):
+                if not worker in lost:
+                    continue
+                del self._leases[job_id]
+                if self._attempts[job_id] < self._max_attempts:
+                    self._queue.appendleft(job_id)
+                    self._n_requeued += 1
+                else:
+                    self._finish(job_id, worker, None,
+                        "Worker lost while running the job, %d times" \
+                            % self._attempts[job_id], 0, 0)
+                continue
+            if len(lost) > 0:
+                self._cond.notify_all()
+        return lost
+
+    def collect(self, timeout : float) -> list[tuple]:
+        """
+        Results that arrived since the last call, waiting up to @timeout
+        seconds for the first.
+
+        :: Return ::
+            (job id, worker, params, score, error, elapsed_s, n_steps)
+            tuples. Score is None when error is set.
+        """
+        with self._cond:
+            self._cond.wait_for(lambda : len(self._results) > 0, timeout)
+            results = list(self._results)
+            self._results.clear()
+        return results
+
+    def shutdown(self):
+        with self._cond:
+            self._shutdown = True
+            self._cond.notify_all()
+        return
+
+    def is_shutdown(self) -> bool:
+        return self._shutdown
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "queued" : len(self._queue),
+                "leased" : len(self._leases),
+                "done" : len(self._done),
+                "requeued" : self._n_requeued,
+                "workers" : len(self._seen)
+            }
+
+class _CoordinatorManager(BaseManager):
+    pass
+
+class _WorkerManager(BaseManager):
+    pass
+
+_WorkerManager.register("board")
+
+class ResultWriter:
+    def __init__(self, fn : str):
+        """
+        Appends (job id, worker, params, score) records to @fn as pickle
+        frames, flushed one by one.
+        """
+        os.makedirs(os.path.dirname(fn) or ".", exist_ok=True)
+        self._fn = fn
+        self._f = open(fn, "ab")
+        return
+
+    @property
+    def fn(self) -> str:
+        return self._fn
+
+    def write(self, job_id : int, worker : str, params : pd.Series,
+            score : pd.Series):
+        pickle.dump((job_id, worker, params, score), self._f,
+            protocol=pickle.HIGHEST_PROTOCOL)
+        self._f.flush()
+        return
+
+    def close(self):
+        self._f.close()
+        return
+
+def read_results(fn : str):
+    """
+    Yields the (job id, worker, params, score) records in @fn, ignoring a
+    partly written last record.
+    """
+    with open(fn, "rb") as f:
+        while True:
+            try:
+                yield pickle.load(f)
+            except (EOFError, pickle.UnpicklingError):
+                break
+            continue
+    return
+
+class Coordinator:
+    def __init__(self,
+            host : str = constants.campaign.host,
+            port : int = constants.campaign.port,
+            authkey : bytes = None,
+            results_file : str = constants.campaign.results_file,
+            lease_timeout_s : float = constants.campaign.lease_timeout_s,
+            telemetry = None
+        ):
+        """
+        Serves a JobBoard to workers and evaluates batches of parameters on
+        them. Use evaluate() as dino.Runner's evaluate().
+
+        :: Parameters ::
+            host : str
+                Address to listen on. Use "0.0.0.0" for workers on other
+                hosts.
+            port : int
+                TCP port to listen on, 0 for any free port.
+            authkey : bytes
+                Shared secret of coordinator and workers,
+                load_authkey(@host) by default.
+            results_file : str
+                Stream every result is appended to.
+            lease_timeout_s : float
+                Seconds without a heartbeat before a worker is lost.
+            telemetry : telemetry.Telemetry
+                Receives the timing of every test and the queue sizes.
+        """
+        if authkey is None:
+            authkey = load_authkey(host)
+        self._board = JobBoard(lease_timeout_s)
+        self._telemetry = telemetry
+        if telemetry is not None:
+            telemetry.add_source(self._board.stats)
+        _CoordinatorManager.register("board", callable=lambda : self._board)
+        self._manager = _CoordinatorManager(address=(host, port),
+            authkey=authkey)
+        self._server = self._manager.get_server()
+        self._thread = threading.Thread(target=self._server.serve_forever,
+            daemon=True)
+        self._thread.start()
+        self._writer = ResultWriter(results_file)
+        return
+
+    @property
+    def board(self) -> JobBoard:
+        return self._board
+
+    @property
+    def address(self) -> tuple:
+        return self._server.address
+
+    def evaluate(self, params_list : list[pd.Series]) -> list[pd.Series]:
+        """
+        Runs @params_list on the workers, streaming each result to the
+        results file as it arrives.
+
+        :: Return ::
+            Scores in the order of @params_list.
+        """
+        ids = self.board.submit(params_list)
+        scores = {}
+        while len(scores) < len(ids):
+            for worker in self.board.requeue_lost():
+                print("\nLost worker %s, re-queued its jobs." % worker)
+                continue
+            for job_id, worker, params, score, error, elapsed_s, n_steps \
+                    in self.board.collect(constants.campaign.heartbeat_s):
+                if error is not None:
+                    raise JobFailed(job_id, error)
+                if self._telemetry is not None:
+                    self._telemetry.observe_test(worker, elapsed_s, n_steps)
+                self._writer.write(job_id, worker, params, score)
+                scores[job_id] = score
+                continue
+            continue
+        return [scores[job_id] for job_id in ids]
+
+    def close(self):
+        """
+        Tells the workers to stop and closes the results file.
+        """
+        self.board.shutdown()
+        # Give pulling workers a moment to see the shutdown
+        time.sleep(constants.campaign.heartbeat_s)
+        self._writer.close()
+        return
+
+def _heartbeat(board, name : str, stop : threading.Event):
+    while not stop.wait(constants.campaign.heartbeat_s):
+        try:
+            board.heartbeat(name)
+        except (EOFError, OSError):
+            break
+        continue
+    return
+
+def _work_loop(board, name : str, init_state_fn : str = None):
+    import scenarios
+
+    while True:
+        job = board.pull(name, constants.campaign.heartbeat_s)
+        if job is None:
+            if board.is_shutdown():
+                break
+            continue
+        job_id, params = job
+        start = time.perf_counter()
+        try:
+            scenario = scenarios.GammaCrossScenario(params,
+                init_state_fn = init_state_fn)
+        except Exception:
+            # The simulation is in an unknown state, leave it to a fresh
+            # process
+            board.fail(name, job_id, traceback.format_exc())
+            raise
+        board.push(name, job_id, scenario.score,
+            time.perf_counter() - start, scenario.n_steps)
+        continue
+    return
+
+def work(address : tuple, authkey : bytes, standin : bool = False):
+    """
+    One worker process: connects to the coordinator at @address, starts a
+    SUMO instance (or the scripted stand-in) and runs jobs until the
+    coordinator shuts down or goes away.
+    """
+    import traci_standin
+
+    manager = _WorkerManager(address=address, authkey=authkey)
+    manager.connect()
+    board = manager.board()
+    name = "%s-%d" % (socket.gethostname(), os.getpid())
+
+    init_state_fn = None
+    with contextlib.ExitStack() as stack:
+        if standin:
+            stack.enter_context(
+                traci_standin.install(traci_standin.ScriptedTraCI()))
+        else:
+            import traci_clients
+            client = traci_clients.WorkerClient(
+                constants.traci.gamma_cross.config, name)
+            stack.callback(client.close)
+            init_state_fn = client.init_state_fn
+
+        stop = threading.Event()
+        stack.callback(stop.set)
+        threading.Thread(target=_heartbeat, args=(board, name, stop),
+            daemon=True).start()
+        try:
+            _work_loop(board, name, init_state_fn)
+        except (EOFError, ConnectionError):
+            # The coordinator is gone
+            pass
+    return
+
+def run_worker(host : str, port : int, authkey : bytes, n_procs : int,
+        standin : bool = False):
+    """
+    Keeps @n_procs worker processes running until the coordinator shuts
+    down. Processes that crash are replaced.
+    """
+    address = (host, port)
+    start = lambda : Process(target=work, args=(address, authkey, standin))
+    procs = [start() for i in range(n_procs)]
+    for proc in procs:
+        proc.start()
+        continue
+
+    while len(procs) > 0:
+        time.sleep(constants.campaign.heartbeat_s)
+        for i, proc in enumerate(list(procs)):
+            if proc.is_alive():
+                continue
+            procs.remove(proc)
+            if proc.exitcode != 0:
+                print("Worker process %d exited with %d, restarting." % (
+                    proc.pid, proc.exitcode))
+                new = start()
+                new.start()
+                procs.append(new)
+            continue
+        continue
+    return
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("role", choices=["coordinator", "worker"])
+    parser.add_argument("--host", default=constants.campaign.host)
+    parser.add_argument("--port", type=int, default=constants.campaign.port)
+    parser.add_argument("--procs", type=int, default=os.cpu_count(),
+        help="Worker processes, each with its own SUMO instance.")
+    parser.add_argument("--batch-size", type=int, default=64,
+        help="Tests the explorers hand out at a time.")
+    parser.add_argument("--standin", action="store_true",
+        help="Workers run the scripted TraCI stand-in instead of SUMO.")
+    args = parser.parse_args()
+    try:
+        key = load_authkey(args.host)
+    except RuntimeError as e:
+        parser.error(str(e))
+
+    if args.role == "worker":
+        run_worker(args.host, args.port, key, args.procs, args.standin)
+        return
+
+    import dino
+    import telemetry
+    constants.batch_size = args.batch_size
+    metrics = telemetry.Telemetry()
+    coordinator = Coordinator(args.host, args.port, key,
+        telemetry = metrics)
+    print("Coordinator listening on %s:%d" % coordinator.address)
+    try:
+        dino.Runner(coordinator, metrics)
+    finally:
+        coordinator.close()
+    return
+
+if __name__ == "__main__":
+    main()
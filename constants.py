@@ -3,7 +3,24 @@
 seed = 4827
 n_tests = 10_000
 n_boundary_samples = 50
+# Tests handed out per ask() of the batched explorers
+batch_size = 1
+# Collision events kept per test, see GammaCrossScenario.collision_metrics
+max_collision_events = 32
+# Contact time (s) that makes a Monte Carlo test a collision target
+collision_target_contact_s = 10.0
 output_dir = "temp"
+feature_store_file = "out/cache/full_data_features.feather"
+# (params, scores, movement) feathers of the feature store, in store order
+feature_store_datasets = [
+    ("out/full_data/full_data_gamma_cross_a_eb_%s_params.feather" % movement,
+        "out/full_data/full_data_gamma_cross_a_eb_%s_scores.feather" % movement,
+        movement)
+    for movement in ["left", "straight", "right"]
+]
+explanation_store_dir = "out/cache/explanations"
+param_spec_file = "scenario_config/cross-gama-params.xlsx"
+param_spec_cache = "out/cache/cross-gama-params.pkl"
 
 class RGBA:
     light_blue = (12,158,236,255)
@@ -32,8 +49,70 @@ class sumo:
     gui_setting_file = "sumo_config/gui.xml"
     init_state_file = "temp/init-state.xml"
     default_view = 'View #0'
+    # Adaptive stepping: while the DUT is far from the junction with no
+    # foe close by, the client advances coarse_step_length per step.
+    adaptive_step = False
+    coarse_step_length = 0.5
+    adaptive_junction_distance = 30 # m
+    adaptive_leader_distance = 20 # m
 
 
+class campaign:
+    # Coordinator address, see campaign.py
+    host = "127.0.0.1"
+    port = 5600
+    # Shared secret of loopback campaigns when CAMPAIGN_AUTHKEY is unset,
+    # created on first use and readable only by its owner
+    authkey_file = "temp/campaign-authkey"
+    heartbeat_s = 1.0
+    # Jobs of a worker silent for this long go back on the queue
+    lease_timeout_s = 10.0
+    max_attempts = 3
+    results_file = "temp/campaign-results.pkl"
+
+class telemetry:
+    # Prometheus text metrics of a running campaign, see telemetry.py
+    enabled = True
+    file = "temp/telemetry.prom"
+    interval_s = 5.0
+    window_s = 60.0
+    # Also serve http://127.0.0.1:<port>/metrics when set
+    http_port = None
+    reservoir_size = 2048
+
+class monte_carlo:
+    # Adaptive Monte Carlo stopping, see monte_carlo.py
+    confidence = 0.95
+    half_width = 0.01
+    # A target is only resolved with min_hits hits and a half width of at
+    # most relative_half_width of its rate, so 0-hit rare targets are not
+    # declared converged by the absolute half width alone
+    relative_half_width = 0.5
+    min_hits = 10
+    min_tests = 200
+
+class rare_event:
+    # Cross-entropy importance sampling, see rare_event.py
+    n_per_stage = 500
+    n_final = 1000
+    rho = 0.1
+    smoothing = 0.7
+    floor = 0.01
+    alpha = 0.01
+    n_bins = 8
+    max_stages = 10
+
+class tl_program:
+    # DUT arrival times (s after time0) pre-screened for red, see
+    # tl_program.py. Over the out/mc campaigns, the 23% of tests with no red
+    # in this window ran the red light at most 1.6% of the time.
+    arrival_window = (5.0, 30.0)
+
+class pipeline:
+    # Artefact task graph, see pipeline.py
+    state_file = "out/cache/pipeline-state.json"
+    n_jobs = 4
+
 class vehicle_types:
     aggresive = "AggrCar"
     conservative = "Car"
@@ -69,17 +148,14 @@ class traci:
             "eb_straight" : ":0_10_0",
             "eb_right" : ":0_9_0"
         }
-        tl_state = {
-            "GGgrrrGGgrrr" : 0,
-            "yygrrryygrrr" : 1,
-            "rrGrrrrrGrrr" : 2,
-            "rryrrrrryrrr" : 3,
-            "rrrGGgrrrGGg" : 4,
-            "rrryygrrryyg" : 5,
-            "rrrrrGrrrrrG" : 6,
-            "rrrrryrrrrry" : 7,
-            "" : None
-        }
+        tl_id = "0"
+    class tiled_gamma_cross:
+        # K copies of gamma_cross in one network, see tiled_net.py
+        n_tiles = 8
+        tile_spacing = 1200 # m between tile origins along x
+        net_file = "temp/tiled/cross3l-x%d.net.xml"
+        route_files = "temp/tiled/cross3l-x%d.rou.xml"
+        init_state_file = "temp/init-state-tiled.xml"
         
 DUT = "dut"
 FOE = "foe"
@@ -0,0 +1,154 @@
+import os
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.feather as feather
+
+import constants
+import target_classifiers
+import tl_program
+import utils
+
+# Score columns holding a list per test, summarized by their length.
+LIST_FEATURES = {
+    "collisions" : "n collisions",
+    "foes in inter (on enter)" : "n foes in inter (on enter)"
+}
+
+# Sentinel values: negative means "never happened", 9999 means "never measured"
+NONNEGATIVE_FEATURES = ["speed (on enter)", "time (on enter)", "side move"]
+SENTINEL_9999_FEATURES = ["dtc (front)", "ttc (front)", "dtc (inter)",
+    "dtc (approach)"]
+
+# Running totals over the test sequence
+CUMULATIVE_FEATURES = ["n side move", "n run red light"]
+
+# Code and data the derivation depends on. A change to any of them misses
+# the cache.
+ROOT = os.path.dirname(os.path.abspath(__file__))
+DERIVATION_SOURCES = [
+    os.path.abspath(__file__),
+    os.path.abspath(target_classifiers.__file__),
+    os.path.abspath(tl_program.__file__),
+    os.path.join(ROOT, constants.traci.gamma_cross.net_file)
+]
+
+class DerivedStats:
+    def __init__(self, cache_dir : str = "out/cache/derived"):
+        """
+        Vectorized derived statistics over campaign score files, cached on
+        disk by the content hash of the source file and of the derivation
+        code (DERIVATION_SOURCES).
+
+        :: Parameters ::
+            cache_dir : str
+                Directory holding one derived feather per source file and
+                code version.
+        """
+        self._cache_dir = cache_dir
+        self._code_digest = None
+        return
+
+    @property
+    def cache_dir(self) -> str:
+        return self._cache_dir
+
+    @property
+    def code_digest(self) -> str:
+        """
+        Hash of DERIVATION_SOURCES, computed once.
+        """
+        if self._code_digest is None:
+            self._code_digest = utils.files_digest(DERIVATION_SOURCES)
+        return self._code_digest
+
+    @staticmethod
+    def read_scores(fn : str) -> pd.DataFrame:
+        """
+        Reads a scores feather with the list columns replaced by their lengths,
+        so the nested collision records are never converted to Python objects.
+        """
+        table = feather.read_table(fn, memory_map = True)
+        for feat in LIST_FEATURES.keys():
+            if not feat in table.column_names:
+                continue
+            i = table.column_names.index(feat)
+            lengths = pc.list_value_length(table.column(feat)).cast(pa.int64())
+            table = table.set_column(i, feat, lengths)
+            continue
+        return table.to_pandas()
+
+    @staticmethod
+    def clean(scores_df : pd.DataFrame) -> pd.DataFrame:
+        """
+        Summarizes list columns by their length and replaces sentinel values
+        with NaN, the same transformations EDA.stat_summary used to apply
+        element-wise.
+        """
+        df = scores_df.round(decimals=5)
+
+        for feat, n_feat in LIST_FEATURES.items():
+            if pd.api.types.is_integer_dtype(df[feat]):
+                df[n_feat] = df[feat]
+            else:
+                df[n_feat] = df[feat].str.len()
+            continue
+        df.drop(columns=list(LIST_FEATURES.keys()), inplace=True)
+        # Contact events past constants.max_collision_events are only counted
+        if "n collisions dropped" in df.columns:
+            df["n collisions"] += df["n collisions dropped"]
+
+        for feat in NONNEGATIVE_FEATURES:
+            df[feat] = df[feat].where(df[feat] >= 0)
+            continue
+
+        df["run red light"] = df["run red light"].astype(int)
+        df["tl state (on enter)"] = df["tl state (on enter)"].map(
+            tl_program.gamma_cross().state_index)
+
+        for feat in SENTINEL_9999_FEATURES:
+            df[feat] = df[feat].where(df[feat] < 9999)
+            continue
+        return df
+
+    @staticmethod
+    def cumulative_counts(scores_df : pd.DataFrame) -> pd.DataFrame:
+        """
+        Running totals of side moves and red light runs over the test order.
+        """
+        return pd.DataFrame({
+            "n side move" : \
+                target_classifiers.SIDE_MOVE.frame(scores_df).cumsum(),
+            "n run red light" : \
+                target_classifiers.RUN_RED_LIGHT.frame(scores_df).cumsum()
+        }, index = scores_df.index)
+
+    @staticmethod
+    def derive(scores_df : pd.DataFrame) -> pd.DataFrame:
+        """
+        All derived statistics for one scores DataFrame in a single pass.
+        """
+        return pd.concat([
+            DerivedStats.clean(scores_df),
+            DerivedStats.cumulative_counts(scores_df)
+        ], axis=1)
+
+    def load(self, fn : str) -> pd.DataFrame:
+        """
+        Derived statistics for the scores file @fn, computed on the first call
+        and read back from the cache while the file content and the
+        derivation code are unchanged.
+        """
+        cache_fn = os.path.join(self.cache_dir,
+            "%s-%s.feather" % (utils.file_digest(fn), self.code_digest))
+        if os.path.exists(cache_fn):
+            return pd.read_feather(cache_fn)
+
+        df = self.derive(self.read_scores(fn))
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_fn = "%s.tmp" % cache_fn
+        df.to_feather(tmp_fn)
+        os.replace(tmp_fn, cache_fn)
+        return df
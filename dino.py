@@ -1,28 +1,58 @@
-from typing import Callable
+import time
 import constants
 import traci_clients
 import scenarios
 import utils
+import param_spec
+import param_schema
+import explorer_batch
+import param_index
+import monte_carlo
+import rare_event
+import telemetry
+import target_classifiers
+import tl_program
 
 import scenarioxp as sxp
 import pandas as pd
 import numpy as np
 
+# Progress line label of each explorer stage
+STAGE_LABELS = {
+    "seq" : "Locating Envelope",
+    "fs" : "Locating Surface",
+    "brrt" : "Following Boundary"
+}
+
 class Runner:
-    def __init__(self):
+    def __init__(self, coordinator = None, metrics = None):
+        """
+        Runs a test campaign.
+
+        :: Parameters ::
+            coordinator : campaign.Coordinator
+                Runs the tests on remote workers when given. Otherwise they
+                run on a local SUMO instance.
+            metrics : telemetry.Telemetry
+                Live campaign metrics. One is started when None and
+                constants.telemetry.enabled is set.
+        """
         self._rng = np.random.RandomState(seed=constants.seed)
 
         # Build the Manager
-        fn = "scenario_config/cross-gama-params.xlsx"
-        df = pd.read_excel(
-            fn, 
-            engine = 'openpyxl',
-            usecols = ["feat","min","max","inc"],
-        )
+        df = param_spec.load_spec()
         self._manager = sxp.ScenarioManager(df)
+        self._schema = param_schema.ParamSchema(self.manager.params)
         
-        self._traci_client = traci_clients.GenericClient(
-            constants.traci.gamma_cross.config)
+        self._coordinator = coordinator
+        if metrics is None and constants.telemetry.enabled:
+            metrics = telemetry.Telemetry()
+        self._metrics = metrics
+        # Workers run their own SUMO instances
+        self._traci_client = None
+        if coordinator is None:
+            self._traci_client = traci_clients.GenericClient(
+                constants.traci.gamma_cross.config)
         
         self._scenario = scenarios.GammaCrossScenario
 
@@ -34,8 +64,13 @@ class Runner:
         # self.target_run_red_light()
         self.target_side_move()
         # self.monte_carlo()
+        # self.adaptive_monte_carlo()
+        # self.rare_event_collisions()
 
-        self.traci_client.close()
+        if coordinator is None:
+            self.traci_client.close()
+        if self.metrics is not None:
+            self.metrics.close()
 
         return
 
@@ -44,11 +79,22 @@ class Runner:
         return self._manager
     
     @property
-    def tsc(self) -> Callable[[pd.Series], bool]:
+    def metrics(self) -> telemetry.Telemetry:
+        return self._metrics
+
+    @property
+    def schema(self) -> param_schema.ParamSchema:
+        return self._schema
+
+    @property
+    def tsc(self) -> target_classifiers.Classifier:
         return self._tsc
 
     @property
     def traci_client(self) -> traci_clients.GenericClient:
+        """
+        The local SUMO client, None when a coordinator runs the tests.
+        """
         return self._traci_client
 
     @property
@@ -87,7 +133,11 @@ class Runner:
         return self.rng.randint(2**32-1)
     
     def monte_carlo(self):
-        tsc = lambda s : len(s["collisions"]) > 100
+        # The SequenceExplorer runs its scenarios in this process
+        if self._coordinator is not None:
+            raise RuntimeError("monte_carlo() runs on the local SUMO client "
+                "only; use adaptive_monte_carlo() with a coordinator")
+        tsc = target_classifiers.COLLISION
 
         seq_exp = sxp.SequenceExplorer(
             strategy = sxp.SequenceExplorer.MONTE_CARLO,
@@ -98,6 +148,7 @@ class Runner:
             scramble = False,
             fast_foward = self.random_seed() % 10000
         )
+        param_schema.compact(seq_exp, self.schema)
 
         for i in range(constants.n_tests):
             print("Test %d" % i, end="\r")
@@ -113,13 +164,67 @@ class Runner:
         c = type_map[constants.traci.gamma_cross.dut_type]
 
         prefix = "gamma_cross_%s_%s" % (c , constants.traci.gamma_cross.dut_route)
-        seq_exp.params_history.to_feather("out/mc_%s_params.feather" % prefix)
+        self.schema.write_feather(param_schema.params_frame(seq_exp, self.schema),
+            "out/mc_%s_params.feather" % prefix)
         seq_exp.score_history.to_feather("out/mc_%s_scores.feather" % prefix)
 
         return
 
+    def adaptive_monte_carlo(self):
+        """
+        Monte Carlo estimates of the collision, red light and side move
+        rates, stopping once every rate is resolved to the precision of
+        constants.monte_carlo.
+        """
+        mc = monte_carlo.AdaptiveMonteCarlo(
+            manager = self.manager,
+            evaluate = self.evaluate,
+            seed = self.random_seed(),
+            batch_size = constants.batch_size
+        )
+        if self.metrics is not None:
+            self.metrics.add_source(mc.gauges)
+        mc.run()
+
+        for name, estimate in mc.estimates.items():
+            low, high = estimate.interval
+            print("%-14s %.4f [%.4f, %.4f] over %d tests" % (
+                name, estimate.rate, low, high, estimate.n))
+            continue
+
+        type_map = {
+            constants.vehicle_types.aggresive : "a",
+            constants.vehicle_types.conservative : "c"
+        }
+        c = type_map[constants.traci.gamma_cross.dut_type]
+        prefix = "gamma_cross_%s_%s" % (c , constants.traci.gamma_cross.dut_route)
+        mc.save("out/amc_%s" % prefix, self.schema)
+        return
+
+    def rare_event_collisions(self):
+        """
+        Cross-entropy importance sampling estimate of the collision rate,
+        for collisions too rare for adaptive_monte_carlo() to resolve.
+        """
+        ce = rare_event.CrossEntropySampler(
+            spec = self.manager.params,
+            evaluate = self.evaluate,
+            seed = self.random_seed(),
+            batch_size = constants.batch_size
+        )
+        ce.run()
+
+        type_map = {
+            constants.vehicle_types.aggresive : "a",
+            constants.vehicle_types.conservative : "c"
+        }
+        c = type_map[constants.traci.gamma_cross.dut_type]
+        prefix = "gamma_cross_%s_%s" % (c , constants.traci.gamma_cross.dut_route)
+        ce.save("out/ce_%s" % prefix, self.schema)
+        return
+
     def target_run_red_light(self):
-        self._tsc = lambda s : s["run red light"] != -1
+        self._tsc = target_classifiers.RUN_RED_LIGHT
         
         print()
 
@@ -141,6 +246,11 @@ class Runner:
         pd.set_option('display.max_columns', None)
         print(self.scores_df)
 
+        exposure = self.red_light_prescreen(self.params_df)
+        print("Predicted red exposure %.3f (%.1f%% of tests never exposed),"
+            " run red light rate %.3f" % (exposure.mean(),
+            100 * (exposure == 0).mean(), self.scores_df["is_target"].mean()))
+
         type_map = {
             constants.vehicle_types.aggresive : "a",
             constants.vehicle_types.conservative : "c"
@@ -149,12 +259,26 @@ class Runner:
         prefix = "gamma_cross_%s_%s" % (c ,
             constants.traci.gamma_cross.dut_route)
 
-        self.params_df.to_feather("out/run_red_light_%s_params.feather" % prefix)
+        self.schema.write_feather(self.params_df,
+            "out/run_red_light_%s_params.feather" % prefix)
         self.scores_df.to_feather("out/run_red_light_%s_scores.feather" % prefix)
+        self.save_index("out/run_red_light_%s_index.npz" % prefix)
         return
 
+    def red_light_prescreen(self, params_df : pd.DataFrame) -> np.ndarray:
+        """
+        Red light exposure of each test in @params_df predicted from its
+        time0 alone, before simulating it.
+
+        :: Return ::
+            Share of the DUT's arrival window (constants.tl_program) during
+            which its signal is red, per test. Tests at 0 rarely run the red
+            light.
+        """
+        return tl_program.dut_red_exposure(params_df["time0"].to_numpy())
+
     def target_side_move(self):
-        self._tsc = lambda s : s["side move"] != -1
+        self._tsc = target_classifiers.SIDE_MOVE
         
         print()
 
@@ -184,10 +308,12 @@ class Runner:
         prefix = "gamma_cross_%s_%s" % (c ,
             constants.traci.gamma_cross.dut_route)
 
-        self.params_df.to_feather(
+        self.schema.write_feather(self.params_df,
             "%s/side_move_%s_params.feather" % (constants.output_dir, prefix))
         self.scores_df.to_feather(
             "%s/side_move_%s_scores.feather" % (constants.output_dir, prefix))
+        self.save_index(
+            "%s/side_move_%s_index.npz" % (constants.output_dir, prefix))
 
         return
     
@@ -217,30 +343,15 @@ class Runner:
             fast_foward = self.random_seed() % 10000,
             **kwargs
         )
-        
-        n_tests = 0
-
-        seq_steps = 0
-        while seq_exp.stage != seq_exp.STAGE_EXPLORATION_COMPLETE:
-            seq_exp.step()
-            seq_steps += 1
-            kept = len(seq_exp._arr_history)
-            n_tests = self.n_tests + seq_steps
-            skipped = seq_steps - kept
-            print("                                                    ", end="\r")
-            print("%d -> Locating Envelope: %d kept, %d skipped" \
-                  % (n_tests,  kept, skipped), end="\r")
-            # print()
-
-            if n_tests >= constants.n_tests:
-                self._n_tests = n_tests
-                self._seq_exp_history.append(seq_exp)
-                return     
-            continue
-        
-        
-        self._n_tests = n_tests
+        seq_batch = explorer_batch.BatchExplorer(
+            param_schema.compact(seq_exp, self.schema),
+            max_steps = constants.n_tests - self.n_tests
+        )
+        self.explore(seq_batch, "seq", count_skipped = True)
+        self._n_tests += seq_batch.n_steps
         self._seq_exp_history.append(seq_exp)
+        if self.n_tests >= constants.n_tests:
+            return
 
         # Find the surface of the envelope.
         fs_exp = sxp.FindSurfaceExplorer(
@@ -248,28 +359,16 @@ class Runner:
             seed = self.random_seed(),
             **kwargs
         )
-        fs_steps = 0
-        while fs_exp.stage != fs_exp.STAGE_EXPLORATION_COMPLETE:
-            fs_exp.step()
-            fs_steps += 1
-            kept = len(fs_exp._arr_history)
-            n_tests = self.n_tests + kept
-            skipped = fs_steps - kept
-            print("                                                    ", end="\r")
-            print("%d -> Locating Surface: %d kept, %d skipped" \
-                    % (n_tests,  kept, skipped), end="\r")
-            # print()
-
-            if n_tests >= constants.n_tests:
-                self._n_tests = n_tests
-                self._fs_exp_history.append(fs_exp)
-                return     
-            continue
-        
-        self._n_tests = n_tests
+        fs_batch = explorer_batch.BatchExplorer(
+            param_schema.compact(fs_exp, self.schema),
+            stop = lambda exp : \
+                self.n_tests + len(exp._arr_history) >= constants.n_tests
+        )
+        self.explore(fs_batch, "fs")
+        self._n_tests += len(fs_exp._arr_history)
         self._fs_exp_history.append(fs_exp)
-
-
+        if self.n_tests >= constants.n_tests:
+            return
 
         # follow the boundary
         root = fs_exp._arr_history[-1]
@@ -279,30 +378,88 @@ class Runner:
             strategy = "e",
             **kwargs
         )
-        
-        brrt_steps = 0
-        for i in range(n_boundary_samples):
-        # while len(brrt_exp._arr_history) != n_boundary_samples:
-            brrt_exp.step()
-            brrt_steps += 1
-            kept = len(brrt_exp._arr_history)
-            n_tests = self.n_tests + kept
-            skipped = brrt_steps - kept
-            print("                                                    ", end="\r")
-            print("%d -> Following Boundary: %d kept, %d skipped" \
-                  % (n_tests, kept, skipped), end="\r")
-            # print()
-            
-            if n_tests >= constants.n_tests:
-                self._n_tests = n_tests
-                self._brrt_exp_history.append(brrt_exp)
-                return
+        brrt_batch = explorer_batch.BatchExplorer(
+            param_schema.compact(brrt_exp, self.schema),
+            max_steps = n_boundary_samples,
+            stop = lambda exp : \
+                self.n_tests + len(exp._arr_history) >= constants.n_tests
+        )
+        self.explore(brrt_batch, "brrt")
+        self._n_tests += len(brrt_exp._arr_history)
+        self._brrt_exp_history.append(brrt_exp)
+        return
+
+    def evaluate(self, params_list : list[pd.Series]) -> list[pd.Series]:
+        """
+        Runs one scenario per row of @params_list, returning their scores in
+        the same order.
+        """
+        if self._coordinator is not None:
+            return self._coordinator.evaluate(params_list)
+        scores = []
+        for params in params_list:
+            start = time.perf_counter()
+            scenario = self.scenario(params)
+            if self.metrics is not None:
+                self.metrics.observe_test("local",
+                    time.perf_counter() - start, scenario.n_steps)
+            scores.append(scenario.score)
             continue
+        return scores
 
-        self._n_tests = n_tests
-        self._brrt_exp_history.append(brrt_exp)
-        
+    def explore(self, 
+            batch : explorer_batch.BatchExplorer, 
+            stage : str,
+            count_skipped : bool = False
+        ):
+        """
+        Drives @batch to completion, evaluating constants.batch_size tests
+        at a time.
+
+        :: Parameters ::
+            batch : explorer_batch.BatchExplorer
+                Batched explorer of one stage.
+            stage : str
+                Stage of the explorer, a key of STAGE_LABELS.
+            count_skipped : bool
+                Count steps that were skipped as tests too, like the
+                sequence stage does.
+        """
+        prev_steps = batch.n_steps
+        prev_kept = len(batch.explorer._arr_history)
+        while not batch.complete:
+            # An empty ask may still have taken steps that needed no test
+            params = batch.ask(constants.batch_size)
+            if len(params) > 0:
+                batch.tell(list(zip(params, self.evaluate(params))))
+
+            kept = len(batch.explorer._arr_history)
+            skipped = batch.n_steps - kept
+            if self.metrics is not None:
+                self.metrics.observe_stage(stage,
+                    steps = batch.n_steps - prev_steps,
+                    kept = kept - prev_kept,
+                    targets = int(sum(batch.explorer._tsc_history[prev_kept:])))
+            prev_steps = batch.n_steps
+            prev_kept = kept
+
+            n_tests = self.n_tests + (batch.n_steps if count_skipped else kept)
+            print("                                                    ", end="\r")
+            print("%d -> %s: %d kept, %d skipped" \
+                  % (n_tests, STAGE_LABELS[stage], kept, skipped), end="\r")
+            if len(params) == 0:
+                break
+            continue
+        return
 
+    def save_index(self, fn : str):
+        """
+        Saves a nearest-neighbour index over the flattened tests to @fn,
+        with the params_df index as row ids.
+        """
+        param_index.ParamIndex.from_tests(
+            self.manager.params, self.params_df, self.scores_df["is_target"]
+        ).save(fn)
         return
 
     def flatten_tests(self):
@@ -321,7 +478,8 @@ class Runner:
             ]:
                 exp_history, stage = stage_exp
                 try:
-                    pdf = exp_history[i].params_history\
+                    pdf = param_schema.params_frame(
+                            exp_history[i], self.schema)\
                         .assign(envelope_id = i)\
                         .assign(stage = stage)
                     sdf = exp_history[i].score_history\
@@ -344,8 +502,7 @@ class Runner:
         scores_df = pd.concat(scores).reset_index(drop=True)
 
 
-        scores_df["is_target"] = scores_df.apply(
-            lambda s: self.tsc(s), axis=1)
+        scores_df["is_target"] = self.tsc.frame(scores_df)
         
         self._params_df = params_df
         self._scores_df = scores_df
@@ -1,3 +1,5 @@
+import os
+import sys
 import warnings
 warnings.filterwarnings("ignore")
 
@@ -8,17 +10,28 @@ import numpy as np
 
 import utils
 import constants
+import target_classifiers
+from derived_stats import DerivedStats, CUMULATIVE_FEATURES
+from explainability.explanation_store import ExplanationStore
 
 # Show all columns when printing
 pd.set_option('display.max_columns', None)
 
-class EDA:
-    def __init__(self):
-        # self.load_data()
-        # self.compare_targeted_testing()
-        # self.stat_summary()
+# Artefacts written by the EDA steps, see pipeline.py
+TABLES_DIR = "out/tables"
+GRAPHS_DIR = "out/graphs"
 
-        self.lightbm_feature_importance()
+class EDA:
+    def __init__(self, steps : list[str] = None):
+        """
+        Runs the EDA methods named in @steps, e.g.
+        python eda.py stat_summary comparison_graphs
+        """
+        if steps is None:
+            steps = ["lightbm_feature_importance"]
+        for step in steps:
+            getattr(self, step)()
+            continue
         return
     
     def lightbm_feature_importance(self):
@@ -58,41 +71,16 @@ class EDA:
         return ax
 
     def stat_summary(self):
+        self.load_derived()
+
         # Collect Data
         data = []
         for dir in constants.directions:
             for tar in constants.targets:
-                df = self.all_data[dir][tar][constants.SCORES].copy()
-                df = df.round(decimals=5)
-
-                df["n collisions"] = df["collisions"].apply(len)
-                df["n foes in inter (on enter)"] = df["foes in inter (on enter)"]\
-                    .apply(len)
-
-                df.drop(
-                    columns=["collisions", "foes in inter (on enter)"], 
-                    inplace=True
-                )
-
-                for feat in ["speed (on enter)", "time (on enter)", "side move"]:
-                    df[feat] = df[feat]\
-                        .apply(lambda x: x if x >= 0 else None)
-                    
-                df["speed (on enter)"].apply(utils.mps2kph)
-                
-                df["run red light"] = df["run red light"].astype(int)
-                df["tl state (on enter)"] = df["tl state (on enter)"].apply(
-                    lambda x : constants.traci.gamma_cross.tl_state[x]
-                )
-                
-                for feat in ["dtc (front)", "ttc (front)", "dtc (inter)", 
-                            "dtc (approach)"]:
-                    df[feat] = df[feat]\
-                        .apply(lambda x: x if x < 9999 else None)
-                    continue
+                df = self.all_derived[dir][tar].drop(columns=CUMULATIVE_FEATURES)
                 # df["tar"] = tar
                 df["dir"] = dir
-                data.append(df.copy())
+                data.append(df)
                 continue
             continue
         df = pd.concat(data)
@@ -151,10 +139,10 @@ class EDA:
         msg += "\\end{tabular}\n"
         msg += "\\end{table}"
 
-        
-        # print(df)
-        # print(msg)
-        return
+        os.makedirs(TABLES_DIR, exist_ok=True)
+        with open(os.path.join(TABLES_DIR, "stat_summary.tex"), "w") as f:
+            f.write(msg)
+        return msg
     
     def stats2latex(self, s : pd.Series) -> str:
         stats = ["count", "mean", "std", "min", "max"]
@@ -170,14 +158,14 @@ class EDA:
         return msg
     
     def compare_targeted_testing(self):
-        self.count_side_moves()
-        self.count_run_red_light()
+        self.load_derived()
+        tables = []
         for feat in ["n side move", "n run red light"]:
             print(":: %s ::" % feat)
             data = []
             for dir in constants.directions:
                 for tar in constants.targets:
-                    df = self.all_data[dir][tar][constants.SCORES]
+                    df = self.all_derived[dir][tar]
                     n = df[feat].max()
                     s = pd.Series({
                         "dir" : dir,
@@ -188,20 +176,24 @@ class EDA:
                     continue
                 continue
             feat_df = pd.DataFrame(data)
+            feat_df["feature"] = feat
             print(feat_df)
+            tables.append(feat_df)
             continue
 
-            
-    
+        os.makedirs(TABLES_DIR, exist_ok=True)
+        pd.concat(tables).to_csv(
+            os.path.join(TABLES_DIR, "targeted_testing.tsv"),
+            sep="\t", index=False)
         return
     
     def comparison_graphs(self):
-        self.count_side_moves()
-        self.count_run_red_light()
+        self.load_derived()
+        os.makedirs(GRAPHS_DIR, exist_ok=True)
 
         for dir in constants.directions:
             for tar in [constants.MONTE_CARLO, constants.SIDE_MOVE]:
-                df = self.all_data[dir][tar][constants.SCORES]
+                df = self.all_derived[dir][tar]
                 n = df[df.index == len(df.index)-1]["n side move"].iloc[0]
                 print(dir, tar, n)
 
@@ -216,7 +208,7 @@ class EDA:
         )
         ax.set_ylabel("# run red light = True")
         plt.savefig(
-            "out/graphs/%s_comparison.pdf" % feature, 
+            os.path.join(GRAPHS_DIR, "%s_comparison.pdf" % feature),
             bbox_inches="tight"
         )
 
@@ -231,7 +223,7 @@ class EDA:
         )
         ax.set_ylabel("# side move = True")
         plt.savefig(
-            "out/graphs/%s_comparison.pdf" % feature, 
+            os.path.join(GRAPHS_DIR, "%s_comparison.pdf" % feature),
             bbox_inches="tight"
         )
         return
@@ -244,7 +236,7 @@ class EDA:
         """
         Compare Side Move tests with Monte Carlo
         """
-        all_data = self.all_data.copy()
+        all_derived = self.all_derived
 
 
         """
@@ -268,7 +260,7 @@ class EDA:
         for target in targets:
             for dir in constants.directions:
                 # Collect Side Move data
-                df = all_data[dir][target][constants.SCORES]
+                df = all_derived[dir][target]
 
                 # Plot
                 x = df.index.tolist()
@@ -301,45 +293,96 @@ class EDA:
         for dir in constants.directions:
             for tar in constants.targets:
                 df = self.all_data[dir][tar][constants.SCORES]
-                n_run_red_light = []
-                n = 0
-                for flag in df["run red light"]:
-                    if flag:
-                        n += 1
-                    n_run_red_light.append(n)
-                df["n run red light"] = n_run_red_light
+                df["n run red light"] = \
+                    DerivedStats.cumulative_counts(df)["n run red light"]
         return
 
     def count_side_moves(self):
         for dir in constants.directions:
             for tar in constants.targets:
                 df = self.all_data[dir][tar][constants.SCORES]
-                n_side_move = []
-                n = 0
-                for time in df["side move"]:
-                    if time >= 0:
-                        n += 1
-                    n_side_move.append(n)
-                df["n side move"] = n_side_move
-
-                # self.all_data[dir][tar][constants.SCORES]
+                df["n side move"] = \
+                    DerivedStats.cumulative_counts(df)["n side move"]
         return
 
+    @staticmethod
+    def data_fn(target : str, direction : str, kind : str) -> str:
+        """
+        File name of the @kind (params or scores) feather of one campaign.
+        """
+        return "out/%s/%s_gamma_cross_a_eb_%s_%s.feather" % (
+            target, target, direction, kind
+        )
+
+    def load_derived(self):
+        """
+        Loads the derived statistics of every scores file, computing them only
+        for files whose content changed since the last run.
+        """
+        if hasattr(self, "all_derived"):
+            return
+        stats = DerivedStats()
+        self.all_derived = {}
+        for direction in constants.directions:
+            self.all_derived[direction] = {
+                target : stats.load(
+                    self.data_fn(target, direction, constants.SCORES))
+                for target in constants.targets
+            }
+            continue
+        return
+
+    def load_feature_store(self):
+        """
+        Memory-maps the preprocessed full_data feature store shared with the
+        explainability apps (see explainability/collision_model/feature_store.py),
+        building it first when it is missing or stale.
+        """
+        if hasattr(self, "features"):
+            return
+        from explainability.collision_model.feature_store import FeatureStore
+        self.features = FeatureStore(constants.feature_store_file)\
+            .open(constants.feature_store_datasets)
+        return
+
+    def feature_store_summary(self):
+        """
+        Target counts and rates per movement type from the feature store.
+        """
+        self.load_feature_store()
+        df = self.features.select(
+            ["movement", "num_collisions", "run_red_light", "side_move"]
+        ).to_pandas()
+        df["n collisions > 100"] = target_classifiers.MANY_COLLISIONS.test(
+            df["num_collisions"])
+        df = df.drop(columns=["num_collisions"])\
+            .groupby("movement", observed=True)\
+            .agg(["sum", "mean"])
+        print(df)
+        return df
+
+    def explanation_summary(self, method : str = None) -> pd.DataFrame:
+        """
+        Mean |SHAP value| or |LIME weight| per model and feature over every
+        explanation the explainability apps have stored.
+        """
+        df = ExplanationStore.summary(constants.explanation_store_dir, method)
+        for (model, method), group in df.groupby(["model", "method"]):
+            print("\n%s %s, %d rows" % (model, method, group["n_rows"].iloc[0]))
+            print(group[["feature", "mean_abs", "mean"]].head(10)\
+                .to_string(index=False))
+            continue
+        return df
+
     def load_data(self):
         self.all_data = {}
         for direction in constants.directions:
             dir_data = {}
             for target in constants.targets:
                 params_df = pd.read_feather(
-                    "out/%s/%s_gamma_cross_a_eb_%s_params.feather" % (
-                        target, target, direction
-                    )
-                )
+                    self.data_fn(target, direction, constants.PARAMS))
                 scores_df = pd.read_feather(
-                    "out/%s/%s_gamma_cross_a_eb_%s_scores.feather" % (
-                        target, target, direction
-                    )
-                )
+                    self.data_fn(target, direction, constants.SCORES))
                 
                 dir_data[target] = {
                     "params" : params_df,
@@ -352,36 +395,7 @@ class EDA:
 
 
     def mc_stats(self):
-        df = self.scores_df.copy()
-        df = df.round(decimals=5)
-
-        df["n collisions"] = df["collisions"].apply(len)
-        df["n foes in inter (on enter)"] = df["foes in inter (on enter)"]\
-            .apply(len)
-
-        df.drop(
-            columns=["collisions", "foes in inter (on enter)"], 
-            inplace=True
-        )
-
-        for feat in ["speed (on enter)", "time (on enter)", "side move"]:
-            df[feat] = df[feat]\
-                .apply(lambda x: x if x >= 0 else None)
-            
-        df["speed (on enter)"].apply(utils.mps2kph)
-
-        # df["side move"] = df["side move"]\
-        #     .apply(lambda x : 1 if x >= 0 else None)
-        
-        df["run red light"] = df["run red light"].astype(int)
-        df["tl state (on enter)"] = df["tl state (on enter)"].apply(
-            lambda x : constants.traci.gamma_cross.tl_state[x]
-        )
-        
-        for feat in ["dtc (front)", "ttc (front)", "dtc (inter)", 
-                     "dtc (approach)"]:
-            df[feat] = df[feat]\
-                .apply(lambda x: x if x < 9999 else None)
+        df = DerivedStats.clean(self.scores_df)
             
         utils.describe_as_latex(df)
         # df = df.describe().T[["count", "mean", "std", "min", "max"]]
@@ -414,7 +428,7 @@ class EDA:
             df = scores_df
 
             # Quantify Scores
-            df["n collisions"] = df["collisions"].apply(len)
+            df["n collisions"] = target_classifiers.N_COLLISIONS.frame(df)
             df["n foes in inter (on enter)"] = \
                 df["foes in inter (on enter)"].apply(len)
             df["run red light"] = df["run red light"].apply(int)
@@ -431,4 +445,4 @@ class EDA:
             print(df)
         return
 if __name__ == "__main__":
-    EDA()
\ No newline at end of file
+    EDA(sys.argv[1:] or None)
\ No newline at end of file
@@ -1,11 +1,11 @@
-from collision_model import CollisionDataLoader
+from collision_model import FeatureStore
 from lime_ex import LimeAnalyzer
 from shap_ex import ShapAnalyzer
+from model_registry import ModelRegistry
+from explanation_store import ExplanationStore
 import numpy as np
 import pandas as pd
 import os
-from sklearn.model_selection import train_test_split
-from pycaret import regression
 
 DATASETS = [
    ("out/full_data/full_data_gamma_cross_a_eb_left_params.feather",
@@ -24,7 +24,17 @@ Y_COLUMN = "num_collisions"
 RANDOM_STATE = None
 USE_TOP30 = False
 
-def analyze_random_red_light_scenario(X_train, X_test, scenario_test, y_test, model, test_pred, output_dir):
+def split_frames(artifacts, model_df, scenario_df, feature_cols):
+   """Train/test rows of a cached model, looked up by their feature store position"""
+   train_indices = artifacts['X_train'].index
+   test_indices = artifacts['X_test'].index
+   X_train = model_df.loc[train_indices, feature_cols]
+   X_test = model_df.loc[test_indices, feature_cols]
+   y_test = model_df.loc[test_indices, Y_COLUMN]
+   scenario_test = scenario_df.loc[test_indices]
+   return X_train, X_test, y_test, scenario_test
+
+def analyze_random_red_light_scenario(X_train, X_test, scenario_test, y_test, model, test_pred, output_dir, store=None):
    print("\n___ Analyzing Random Red Light Running Case ___")
 
    red_light_cases = scenario_test[scenario_test['run_red_light'] == True].index
@@ -35,9 +45,9 @@ def analyze_random_red_light_scenario(X_train, X_test, scenario_test, y_test, mo
    random_idx = np.random.choice(red_light_cases)
    print(f"Selected red light scenario: {random_idx}")
 
-   analyze_scenario(X_train, X_test, y_test, test_pred, model, random_idx, "red_light", output_dir)
+   analyze_scenario(X_train, X_test, y_test, test_pred, model, random_idx, "red_light", output_dir, store)
 
-def analyze_random_side_move_scenario(X_train, X_test, scenario_test, y_test, model, test_pred, output_dir):
+def analyze_random_side_move_scenario(X_train, X_test, scenario_test, y_test, model, test_pred, output_dir, store=None):
    print("\n___ Analyzing Random Side Move Case ___")
 
    side_move_cases = scenario_test[scenario_test['side_move'] == True].index
@@ -48,9 +58,9 @@ def analyze_random_side_move_scenario(X_train, X_test, scenario_test, y_test, mo
    random_idx = np.random.choice(side_move_cases)
    print(f"Selected side move scenario: {random_idx}")
 
-   analyze_scenario(X_train, X_test, y_test, test_pred, model, random_idx, "side_move", output_dir)
+   analyze_scenario(X_train, X_test, y_test, test_pred, model, random_idx, "side_move", output_dir, store)
 
-def analyze_random_normal_scenario(X_train, X_test, scenario_test, y_test, model, test_pred, output_dir):
+def analyze_random_normal_scenario(X_train, X_test, scenario_test, y_test, model, test_pred, output_dir, store=None):
    print("\n___ Analyzing Random Normal Case ___")
 
    normal_cases = scenario_test[
@@ -65,28 +75,31 @@ def analyze_random_normal_scenario(X_train, X_test, scenario_test, y_test, model
    random_idx = np.random.choice(normal_cases)
    print(f"Selected normal scenario: {random_idx}")
 
-   analyze_scenario(X_train, X_test, y_test, test_pred, model, random_idx, "normal", output_dir)
+   analyze_scenario(X_train, X_test, y_test, test_pred, model, random_idx, "normal", output_dir, store)
 
-def analyze_scenario(X_train, X_test, y_test, test_pred, model, scenario_idx, scenario_type, output_dir):
+def analyze_scenario(X_train, X_test, y_test, test_pred, model, scenario_idx, scenario_type, output_dir, store=None):
    lime_dir = os.path.join(output_dir, "local", "lime", scenario_type)
    shap_dir = os.path.join(output_dir, "local", "shap", scenario_type)
 
-   lime_analyzer = LimeAnalyzer(X_train, model, y=Y_COLUMN)
+   lime_analyzer = LimeAnalyzer(X_train, model, y=Y_COLUMN, store=store)
    lime_analyzer.analyze_specific_scenario(
        X_test, y_test, test_pred, scenario_idx,
        output_dir=lime_dir,
        verbose=True
    )
 
-   shap_analyzer = ShapAnalyzer(model, X_train)
+   shap_analyzer = ShapAnalyzer(model, X_train, store=store)
    shap_analyzer.analyze_specific_scenario(
        X_test, y_test, scenario_idx,
        output_dir=shap_dir
    )
 
 def main():
+   # pycaret is slow to import, so only pay for it when the app runs
+   from pycaret import regression
+
    print("Loading and combining datasets")
-   model_df, scenario_df = CollisionDataLoader.combine_datasets(DATASETS, add_movement_vars=True)
+   model_df, scenario_df = FeatureStore().frames(DATASETS, Y_COLUMN)
 
    print(f"Dataset shape: {model_df.shape}")
    print("\nFeature names:")
@@ -96,42 +109,33 @@ def main():
    # First run with all features
    all_features_dir = os.path.join(OUTPUT_DIR, "all_features")
    print("\n___ Running analysis with all features ___")
-
-   print("\nSetting up PyCaret environment")
-   regression.setup(
-       data=model_df,
-       target=Y_COLUMN,
-       session_id=42,
-       normalize=True,
-       transform_target=False,
-       remove_outliers=False,
-       polynomial_features=False,
-       feature_selection=False,
-       fold=5,
-       verbose=False
-   )
-
-   print("\nTraining LightGBM model with all features")
-   full_model = regression.create_model('lightgbm')
+   registry = ModelRegistry()
+
+   setup_config = {
+       'data': model_df,
+       'target': Y_COLUMN,
+       'session_id': 42,
+       'normalize': True,
+       'transform_target': False,
+       'remove_outliers': False,
+       'polynomial_features': False,
+       'feature_selection': False,
+       'fold': 5,
+       'verbose': False,
+   }
+   full_artifacts = registry.get_or_train(regression, setup_config, DATASETS, 'lightgbm')
+   full_model = full_artifacts['model']
 
    if not hasattr(full_model, 'predict'):
        raise ValueError("Extracted model doesn't have specified prediction method")
 
-   # split data (but keep scenarios aligned)
-   train_indices, test_indices = train_test_split(
-       model_df.index,
-       test_size=0.2,
-       random_state=RANDOM_STATE
-   )
-
-   # split model features
-   X_train = model_df.loc[train_indices, feature_cols]
-   X_test = model_df.loc[test_indices, feature_cols]
-   y_test = model_df.loc[test_indices, 'num_collisions']
-   scenario_test = scenario_df.loc[test_indices]
+   # The model's own split, so a cached model is never explained on its
+   # training rows and scenarios stay aligned
+   X_train, X_test, y_test, scenario_test = split_frames(
+       full_artifacts, model_df, scenario_df, feature_cols)
 
    print("\n___ Full Model Evaluation ___")
-   test_pred = full_model.predict(regression.get_config('X_test'))
+   test_pred = full_model.predict(X_test)
 
    print("\nCalculating feature importance")
    if hasattr(full_model, 'feature_name_'):
@@ -169,14 +173,16 @@ def main():
    )
 
    print("\nAnalyzing full model scenarios...")
+   row_ids = FeatureStore.row_ids(DATASETS)
+   full_store = ExplanationStore(full_artifacts['key'], row_ids, X_train.columns)
    analyze_random_red_light_scenario(
-       X_train, X_test, scenario_test, y_test, full_model, test_pred, all_features_dir
+       X_train, X_test, scenario_test, y_test, full_model, test_pred, all_features_dir, full_store
    )
    analyze_random_side_move_scenario(
-       X_train, X_test, scenario_test, y_test, full_model, test_pred, all_features_dir
+       X_train, X_test, scenario_test, y_test, full_model, test_pred, all_features_dir, full_store
    )
    analyze_random_normal_scenario(
-       X_train, X_test, scenario_test, y_test, full_model, test_pred, all_features_dir
+       X_train, X_test, scenario_test, y_test, full_model, test_pred, all_features_dir, full_store
    )
 
    if USE_TOP30:
@@ -184,29 +190,20 @@ def main():
        top_30_dir = os.path.join(OUTPUT_DIR, "top_30")
        print("\n=== Running analysis with top 30 features ===")
 
-       print("\nSetting up PyCaret environment for reduced feature set...")
-       regression.setup(
-           data=model_df.loc[:, top_30_features + ['num_collisions']],
-           target=Y_COLUMN,
-           session_id=43,
-           normalize=True,
-           transform_target=False,
-           remove_outliers=False,
-           polynomial_features=False,
-           feature_selection=False,
-           fold=5,
-           verbose=False
-       )
-
-       print("\nTraining LightGBM model with top 30 features")
-       reduced_model = regression.create_model('lightgbm')
+       reduced_config = {
+           **setup_config,
+           'data': model_df.loc[:, top_30_features + ['num_collisions']],
+           'session_id': 43,
+       }
+       reduced_artifacts = registry.get_or_train(regression, reduced_config, DATASETS, 'lightgbm')
+       reduced_model = reduced_artifacts['model']
 
-       # reduce features
-       X_train_reduced = X_train[top_30_features]
-       X_test_reduced = X_test[top_30_features]
+       # reduce features, on the reduced model's own split
+       X_train_reduced, X_test_reduced, y_test_reduced, scenario_test_reduced = split_frames(
+           reduced_artifacts, model_df, scenario_df, top_30_features)
 
        print("\n___ Reduced Model Evaluation ___")
-       test_pred_reduced = reduced_model.predict(regression.get_config('X_test'))
+       test_pred_reduced = reduced_model.predict(X_test_reduced)
 
        # save reduced
        importance_reduced = pd.DataFrame({
@@ -234,14 +231,18 @@ def main():
        )
 
        print("\nAnalyzing reduced model scenarios")
+       reduced_store = ExplanationStore(reduced_artifacts['key'], row_ids, X_train_reduced.columns)
        analyze_random_red_light_scenario(
-           X_train_reduced, X_test_reduced, scenario_test, y_test, reduced_model, test_pred_reduced, top_30_dir
+           X_train_reduced, X_test_reduced, scenario_test_reduced, y_test_reduced, reduced_model, test_pred_reduced, top_30_dir,
+           reduced_store
        )
        analyze_random_side_move_scenario(
-           X_train_reduced, X_test_reduced, scenario_test, y_test, reduced_model, test_pred_reduced, top_30_dir
+           X_train_reduced, X_test_reduced, scenario_test_reduced, y_test_reduced, reduced_model, test_pred_reduced, top_30_dir,
+           reduced_store
        )
        analyze_random_normal_scenario(
-           X_train_reduced, X_test_reduced, scenario_test, y_test, reduced_model, test_pred_reduced, top_30_dir
+           X_train_reduced, X_test_reduced, scenario_test_reduced, y_test_reduced, reduced_model, test_pred_reduced, top_30_dir,
+           reduced_store
        )
 
 if __name__ == "__main__":
@@ -1,8 +1,11 @@
-from collision_model import CollisionDataLoader
+from collision_model import FeatureStore
+from model_registry import ModelRegistry
+from model_selection import ModelSelector
 import pandas as pd
 import numpy as np
+import hashlib
+import os
 import time
-from pycaret import regression
 
 DATASETS = [
     ("out/full_data/full_data_gamma_cross_a_eb_left_params.feather",
@@ -17,6 +20,14 @@ DATASETS = [
 ]
 Y_COLUMN = "num_collisions"
 
+# Quick models first, then the complex ones; missing libraries are skipped
+MODELS = ['lr', 'ridge', 'dt', 'rf', 'gbr', 'xgboost', 'lightgbm', 'catboost']
+# Wall-clock budget of the model selection, and where its folds are checkpointed
+BUDGET_S = 30 * 60
+SELECTION_DIR = "out/cache/model_selection"
+# Successive halving settings, which decide the folds and rungs checkpointed
+SELECTION_CONFIG = {'seed': 0, 'eta': 3, 'n_rungs': 3}
+
 def log_model_config(model):
     print("\nModel Configuration:")
     print(f"Model params: {model.get_params()}")
@@ -30,12 +41,10 @@ def log_predictions(predictions):
     print(f"Max prediction: {predictions['prediction_label'].max():.4f}")
 
 def main():
+    from pycaret import regression
+
     print("Loading and combining datasets")
-    model_df, scenario_df = CollisionDataLoader.combine_datasets(
-        dataset_paths=DATASETS,
-        column_to_use="collisions",
-        add_movement_vars=True
-    )
+    model_df, scenario_df = FeatureStore().frames(DATASETS, Y_COLUMN)
 
     print(f"\nCombined dataset shape: {model_df.shape}")
     print(f"Number of features: {model_df.shape[1] - 1}")  # -1 for target
@@ -61,56 +70,41 @@ def main():
 
     regression.setup(**setup_config)
 
-    print("\nPhase 1: Quick Models")
-    fast_models = [
-        'lr',        # Linear Regression
-        'ridge',     # Ridge Regression
-        'dt',        # Decision Tree
-        'rf'         # Random Forest
-    ]
-    best_model = regression.compare_models(
-        include=fast_models,
-        sort='R2',
-        n_select=1,
-        cross_validation=True,
-        fold=5,
-        verbose=True
+    print("\nSelecting a model")
+    # Only the rows setup trains on, so the holdout evaluate_model reports
+    # on plays no part in the choice. The index is the feature store
+    # position, which the folds are drawn over.
+    X_train = regression.get_config('X_train')[feature_cols]
+    y_train = regression.get_config('y_train')
+    registry = ModelRegistry()
+    selection_config = {
+        **setup_config,
+        'selection': {**SELECTION_CONFIG, 'models': MODELS},
+        # setup's split is unseeded, so the checkpoint is tied to its rows
+        'train_rows': hashlib.sha256(np.sort(X_train.index.to_numpy()).tobytes()).hexdigest()[:16],
+    }
+    key = registry.fingerprint(DATASETS, feature_cols, Y_COLUMN, selection_config,
+                               regression.__name__, "selection")
+    selector = ModelSelector(
+        X_train, y_train,
+        checkpoint_path=os.path.join(SELECTION_DIR, f"{key}.jsonl"),
+        models=MODELS,
+        budget_s=BUDGET_S,
+        fold=setup_config['fold'],
+        **SELECTION_CONFIG,
     )
-    print(f"\nBest quick model: {best_model}")
-    print("\nQuick model details:")
+    best_id, leaderboard = selector.run()
+    print(f"\nLeaderboard:\n{leaderboard.to_string(index=False)}")
+    if selector.errors:
+        print(f"Failed models: {selector.errors}")
+
+    print(f"\nTraining best model: {best_id}")
+    best_model = regression.create_model(best_id, verbose=False)
     log_model_config(best_model)
 
-    print("\nEvaluating best quick model:")
+    print("\nEvaluating best model:")
     regression.evaluate_model(best_model)
 
-    print("\nPhase 2: Complex Models")
-    complex_models = [
-        'gbr',       # Gradient Boosting
-        'xgboost',   # XGBoost
-        'lightgbm',  # LightGBM
-        'catboost'   # CatBoost
-    ]
-    try:
-        best_complex = regression.compare_models(
-            include=complex_models,
-            sort='R2',
-            n_select=1,
-            cross_validation=True,
-            fold=5,
-            verbose=True
-        )
-        print(f"\nBest complex model: {best_complex}")
-        print("\nComplex model details:")
-        log_model_config(best_complex)
-
-        print("\nEvaluating best complex model:")
-        regression.evaluate_model(best_complex)
-        # use the best complex model since its already sorted by R^2
-        best_model = best_complex
-    except Exception as e:
-        print(f"Error in complex models phase: {e}")
-        print("Continuing with best quick model")
-
     print("\nMaking predictions")
     predictions = regression.predict_model(best_model, data=model_df)
     log_predictions(predictions)
@@ -1,2 +1,13 @@
+import os
+import sys
+
+# The submodules import target_classifiers.py from the repository root,
+# which is not on sys.path when an app runs from explainability/
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if ROOT not in sys.path:
+    sys.path.append(ROOT)
+
 from .collision_data_loader import CollisionDataLoader
 from .collision_model import CollisionModel
+from .campaign_dataset import CampaignDataset
+from .feature_store import FeatureStore
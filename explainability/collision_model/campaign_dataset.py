@@ -0,0 +1,121 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.feather as feather
+
+# From the repository root, which the package __init__ puts on sys.path
+import target_classifiers
+
+class CampaignDataset:
+    def __init__(self, dataset_paths: list[tuple[str, str, str]]):
+        """
+        Lazy view over the (params, scores, movement_type) feather pairs of a
+        campaign.
+
+        Files are memory-mapped and only the requested columns are read.
+        Tables are concatenated once and shuffled with a single take(), so
+        cost grows linearly with the number of files. Uncompressed feathers
+        are read zero-copy; compressed ones are decompressed per column.
+        """
+        self.dataset_paths = dataset_paths
+        self.movement_types = sorted({movement_type for _, _, movement_type in dataset_paths})
+
+    # Schema metadata written by param_schema.py in the repository root
+    PARAM_SCHEMA_KEY = b"param_schema"
+
+    # Seed of the row shuffle, so PyCaret's positional train/test split is
+    # the same on every run
+    SHUFFLE_SEED = 0
+
+    @staticmethod
+    def shuffle_order(num_rows: int, seed: int = SHUFFLE_SEED) -> np.ndarray:
+        """Reproducible shuffled order of @num_rows rows"""
+        return np.random.default_rng(seed).permutation(num_rows)
+
+    @staticmethod
+    def read_table(path: str, columns: list[str] = None) -> pa.Table:
+        table = feather.read_table(path, columns=columns, memory_map=True)
+        metadata = table.schema.metadata or {}
+        if CampaignDataset.PARAM_SCHEMA_KEY in metadata:
+            table = CampaignDataset.decode_params(
+                table, json.loads(metadata[CampaignDataset.PARAM_SCHEMA_KEY]))
+        return table
+
+    @staticmethod
+    def decode_params(table: pa.Table, schema: dict) -> pa.Table:
+        """Scaled integer params columns back to min + code * inc"""
+        for feat, (kind, lo, inc) in schema.items():
+            if kind != "scaled" or feat not in table.column_names:
+                continue
+            i = table.column_names.index(feat)
+            values = pc.add(pc.multiply(table.column(i).cast(pa.float64()), inc), lo)
+            table = table.set_column(i, feat, values)
+        return table
+
+    def table(self, targets: list[tuple[str, target_classifiers.Measure]],
+              include_params: bool = True,
+              add_movement_vars: bool = False,
+              movement_column: bool = False) -> pa.Table:
+        """
+        Concatenate every file pair into one table.
+
+        @targets is a list of (name, target_classifiers Measure or Classifier)
+        columns computed from the scores and appended after the params columns. With @add_movement_vars, one boolean
+        movement_<type> column per movement type follows the targets. With
+        @movement_column, a dictionary-encoded movement column is appended.
+        """
+        score_columns = list(dict.fromkeys(
+            column for _, target in targets for column in target.columns))
+        required = {target.column for _, target in targets}
+        tables = []
+        for params_path, scores_path, movement_type in self.dataset_paths:
+            # Extra columns, like "n collisions dropped", only where the file has them
+            names = feather.read_table(scores_path, memory_map=True).column_names
+            scores = self.read_table(scores_path, columns=[
+                column for column in score_columns if column in required or column in names])
+            if include_params:
+                table = self.read_table(params_path)
+            else:
+                table = pa.table({})
+
+            if include_params and table.num_rows != scores.num_rows:
+                raise ValueError(f"Params ({table.num_rows} rows) and Scores ({scores.num_rows} rows) must have same length")
+
+            for name, target in targets:
+                column = target.arrow(scores)
+                if table.num_columns == 0:
+                    table = pa.table({name: column})
+                else:
+                    table = table.append_column(name, column)
+
+            if add_movement_vars:
+                for other in self.movement_types:
+                    flags = np.full(scores.num_rows, other == movement_type)
+                    table = table.append_column(f"movement_{other}", pa.array(flags))
+
+            if movement_column:
+                codes = np.full(scores.num_rows,
+                                self.movement_types.index(movement_type), dtype=np.int8)
+                movement = pa.DictionaryArray.from_arrays(
+                    pa.array(codes), pa.array(self.movement_types))
+                table = table.append_column('movement', movement)
+
+            tables.append(table.replace_schema_metadata(None))
+        # Compact int8 params files mix with older float64 ones
+        return pa.concat_tables(tables, promote_options="permissive")
+
+    @staticmethod
+    def to_pandas(table: pa.Table, order: np.ndarray = None) -> pd.DataFrame:
+        """
+        Materialize @table once, rows taken in @order if given. The index
+        keeps each row's position in @table, so explanations of a shuffled
+        row can be traced back to it (see FeatureStore.row_ids).
+        """
+        if order is None:
+            return table.to_pandas(split_blocks=True, self_destruct=True)
+        df = table.take(pa.array(order)).to_pandas(split_blocks=True, self_destruct=True)
+        df.index = pd.Index(order, name='row')
+        return df
@@ -1,9 +1,20 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
 from sklearn.metrics import mean_squared_error, r2_score
-from sklearn.model_selection import cross_val_score
+from sklearn.model_selection import KFold, cross_val_score
 from catboost import CatBoostRegressor
 
 class CollisionModel:
+    # Final predictors of train_and_validate
+    ENSEMBLE = "ensemble"
+    WARM_START = "warm_start"
+
     def __init__(self, random_state=None):
+        self.random_state = random_state
         self.model = CatBoostRegressor(
             iterations=1000,
             learning_rate=0.07,
@@ -13,6 +24,12 @@ class CollisionModel:
             random_state=random_state,
             verbose=0
         )
+        self.fold_models = []
+        self.oof_predictions = None
+        self.ensemble = False
+        # Best fold model boosted on all rows by train_and_validate, used
+        # by predict instead of self.model, which stays the template
+        self.warm_model = None
 
     def cross_validate(self, X_train, y_train):
         cv_scores = cross_val_score(self.model, X_train, y_train, cv=5, scoring='r2')
@@ -21,9 +38,105 @@ class CollisionModel:
 
     def train_model(self, X_train,y_train):
         self.model.fit(X_train, y_train)
+        self.ensemble = False
+        self.warm_model = None
+
+    def fingerprint(self, X_train, y_train, cv, seed):
+        """Fingerprint of the training data, model params and folds of a train_and_validate run"""
+        digest = hashlib.sha256()
+        digest.update(pd.util.hash_pandas_object(X_train, index=False).values.tobytes())
+        digest.update(pd.util.hash_pandas_object(y_train, index=False).values.tobytes())
+        payload = {
+            "columns": list(X_train.columns),
+            "params": self.model.get_params(),
+            "cv": cv,
+            "seed": seed,
+        }
+        digest.update(json.dumps(payload, sort_keys=True, default=str).encode())
+        return digest.hexdigest()[:16]
+
+    def snapshot_file(self, fold, snapshot_dir):
+        return os.path.abspath(os.path.join(snapshot_dir, f"fold{fold}.cbsnapshot"))
+
+    def fold_model(self, fold, snapshot_dir=None):
+        """Unfitted copy of the model for @fold, snapshotting to @snapshot_dir"""
+        model = self.model.copy()
+        if snapshot_dir is not None:
+            model.set_params(
+                save_snapshot=True,
+                snapshot_file=self.snapshot_file(fold, snapshot_dir),
+                snapshot_interval=60,
+            )
+        return model
+
+    def train_and_validate(self, X_train, y_train, cv=5, final=ENSEMBLE,
+                           warm_start_iterations=200, snapshot_dir=None):
+        """
+        Cross-validate on @cv folds and keep the fold models, instead of
+        cross_validate followed by a sixth full fit in train_model.
+
+        The fold models give the out-of-fold predictions (oof_predictions)
+        and the cross-validation R^2. With final=ENSEMBLE, predict averages
+        the fold models. With final=WARM_START, the best fold model is
+        boosted for @warm_start_iterations more rounds on all of @X_train
+        into warm_model, which predict then uses.
+
+        With @snapshot_dir, each fold model is saved there once trained,
+        and CatBoost snapshots the one being trained, so an interrupted run
+        skips the finished folds and resumes the unfinished one. Runs are
+        kept in a subdirectory named by fingerprint, so a run on other data
+        or params never loads the fold models of an earlier one.
+        """
+        if final not in (self.ENSEMBLE, self.WARM_START):
+            raise ValueError(f"final must be {self.ENSEMBLE} or {self.WARM_START}")
+
+        X_train, y_train = X_train.reset_index(drop=True), y_train.reset_index(drop=True)
+        # Seeded even without a random_state, so a resumed run gets the same folds
+        seed = 0 if self.random_state is None else self.random_state
+        if snapshot_dir is not None:
+            snapshot_dir = os.path.join(snapshot_dir, self.fingerprint(X_train, y_train, cv, seed))
+            os.makedirs(snapshot_dir, exist_ok=True)
+        folds = KFold(cv, shuffle=True, random_state=seed).split(X_train)
+        self.fold_models = []
+        self.oof_predictions = np.empty(len(X_train))
+        scores = []
+        for fold, (train, val) in enumerate(folds):
+            model = self.fold_model(fold, snapshot_dir)
+            model_path = None if snapshot_dir is None \
+                else os.path.join(snapshot_dir, f"fold{fold}.cbm")
+            if model_path is not None and os.path.exists(model_path):
+                print(f"Loaded fold {fold} model")
+                model.load_model(model_path)
+            else:
+                model.fit(X_train.iloc[train], y_train.iloc[train])
+                if model_path is not None:
+                    model.save_model(model_path)
+            if model_path is not None and os.path.exists(self.snapshot_file(fold, snapshot_dir)):
+                # Only needed to resume the fold, which the saved model now covers
+                os.remove(self.snapshot_file(fold, snapshot_dir))
+
+            self.oof_predictions[val] = model.predict(X_train.iloc[val])
+            scores.append(r2_score(y_train.iloc[val], self.oof_predictions[val]))
+            self.fold_models.append(model)
+
+        scores = np.array(scores)
+        print("Cross-validation performance:")
+        print(f"R^2: {scores.mean():.3f} (+/- {scores.std() * 2:.3f})")
+        print(f"Out-of-fold R^2: {r2_score(y_train, self.oof_predictions):.3f}")
+
+        self.warm_model = None
+        if final == self.ENSEMBLE:
+            self.ensemble = True
+        else:
+            best = self.fold_models[int(np.argmax(scores))]
+            self.warm_model = self.model.copy()
+            self.warm_model.set_params(iterations=warm_start_iterations)
+            self.warm_model.fit(X_train, y_train, init_model=best)
+            self.ensemble = False
+        return scores
 
     def evaluate(self, X_test, y_test):
-        test_pred = self.model.predict(X_test)
+        test_pred = self.predict(X_test)
         test_mse = mean_squared_error(y_test, test_pred)
         test_r2 = r2_score(y_test, test_pred)
 
@@ -38,4 +151,8 @@ class CollisionModel:
         return test_pred
 
     def predict(self, X):
+        if self.ensemble:
+            return np.mean([model.predict(X) for model in self.fold_models], axis=0)
+        if self.warm_model is not None:
+            return self.warm_model.predict(X)
         return self.model.predict(X)
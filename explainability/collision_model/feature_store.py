@@ -0,0 +1,136 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.feather as feather
+
+import utils
+from . import campaign_dataset
+from .campaign_dataset import CampaignDataset, target_classifiers
+
+# Code the store's columns are derived with; a change to it rebuilds the store
+DERIVATION_SOURCES = [
+    os.path.abspath(__file__),
+    os.path.abspath(campaign_dataset.__file__),
+    os.path.abspath(target_classifiers.__file__),
+]
+
+class FeatureStore:
+    # Every model target, side by side in the store
+    TARGETS = [
+        ('num_collisions', target_classifiers.N_COLLISIONS),
+        ('run_red_light', target_classifiers.RUN_RED_LIGHT),
+        ('side_move', target_classifiers.SIDE_MOVE),
+    ]
+    TARGET_NAMES = [name for name, _ in TARGETS]
+
+    def __init__(self, path: str = "out/cache/full_data_features.feather"):
+        """
+        Preprocessed feature matrix shared by the collision, red-light and
+        side-move models.
+
+        The store holds the params columns, a dictionary-encoded movement
+        column and all targets in one uncompressed feather file, so readers
+        memory-map it without copying. It is rebuilt when the source files
+        or the derivation code (DERIVATION_SOURCES) change.
+        """
+        self.path = path
+
+    @staticmethod
+    def sources(dataset_paths: list[tuple[str, str, str]]) -> str:
+        """Signature of the source files and derivation code used to detect a stale store"""
+        data = [utils.files_digest(DERIVATION_SOURCES)]
+        for params_path, scores_path, movement_type in dataset_paths:
+            for path in (params_path, scores_path):
+                stat = os.stat(path)
+                data.append([path, stat.st_size, stat.st_mtime_ns])
+            data.append(movement_type)
+        return json.dumps(data)
+
+    @staticmethod
+    def row_ids(dataset_paths: list[tuple[str, str, str]]) -> np.ndarray:
+        """
+        Stable id "<source>:<row>" of every store row, in store order, where
+        <source> is the params file name without _params.feather
+        """
+        row_ids = []
+        for params_path, _, _ in dataset_paths:
+            source = os.path.basename(params_path).replace("_params.feather", "")
+            num_rows = feather.read_table(params_path, memory_map=True).num_rows
+            row_ids.append(np.char.add(f"{source}:", np.arange(num_rows).astype(str)))
+        return np.concatenate(row_ids)
+
+    def build(self, dataset_paths: list[tuple[str, str, str]]):
+        """Preprocess @dataset_paths once and write the store"""
+        dataset = CampaignDataset(dataset_paths)
+        table = dataset.table(self.TARGETS, movement_column=True)
+        table = table.replace_schema_metadata({
+            "sources": self.sources(dataset_paths)
+        })
+
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        feather.write_feather(table, tmp_path, compression="uncompressed")
+        os.replace(tmp_path, self.path)
+
+    def is_current(self, dataset_paths: list[tuple[str, str, str]]) -> bool:
+        if not os.path.exists(self.path):
+            return False
+        with pa.memory_map(self.path) as source:
+            metadata = pa.ipc.open_file(source).schema.metadata or {}
+        return metadata.get(b"sources") == self.sources(dataset_paths).encode()
+
+    def open(self, dataset_paths: list[tuple[str, str, str]]) -> pa.Table:
+        """Memory-map the store, building it first if it is missing or stale"""
+        if not self.is_current(dataset_paths):
+            print(f"Building feature store {self.path}")
+            self.build(dataset_paths)
+        return feather.read_table(self.path, memory_map=True)
+
+    @staticmethod
+    def feature_columns(table: pa.Table) -> list[str]:
+        return [col for col in table.column_names
+                if col not in FeatureStore.TARGET_NAMES and col != 'movement']
+
+    @staticmethod
+    def movement_dummies(table: pa.Table) -> dict[str, pa.ChunkedArray]:
+        """One boolean movement_<type> column per movement type"""
+        movement = table.column('movement')
+        movement_types = movement.chunk(0).dictionary.to_pylist() \
+            if movement.num_chunks else []
+        return {
+            f"movement_{movement_type}": pc.equal(movement.cast(pa.string()), movement_type)
+            for movement_type in sorted(movement_types)
+        }
+
+    def model_table(self, table: pa.Table, target: str) -> pa.Table:
+        """Params, @target and movement dummies of the memory-mapped @table"""
+        columns = {col: table.column(col) for col in self.feature_columns(table)}
+        columns[target] = table.column(target)
+        columns.update(self.movement_dummies(table))
+        return pa.table(columns)
+
+    def model_df(self, dataset_paths: list[tuple[str, str, str]],
+                 target: str) -> pd.DataFrame:
+        """
+        Shuffled params, @target and movement dummies in the layout of
+        CollisionDataLoader.combine_datasets_for_redlight/_for_sidemove.
+        """
+        table = self.open(dataset_paths)
+        shuffle_idx = CampaignDataset.shuffle_order(table.num_rows)
+        return CampaignDataset.to_pandas(self.model_table(table, target), shuffle_idx)
+
+    def frames(self, dataset_paths: list[tuple[str, str, str]],
+               target: str) -> tuple[pd.DataFrame, pd.DataFrame]:
+        """
+        Model and scenario frames sharing one shuffle order, in the layout of
+        CollisionDataLoader.combine_datasets(..., add_movement_vars=True).
+        """
+        table = self.open(dataset_paths)
+        shuffle_idx = CampaignDataset.shuffle_order(table.num_rows)
+        scenario_table = table.select(['run_red_light', 'side_move', 'num_collisions'])
+        return (CampaignDataset.to_pandas(self.model_table(table, target), shuffle_idx),
+                CampaignDataset.to_pandas(scenario_table, shuffle_idx))
@@ -0,0 +1,300 @@
+"""
+Long-running local explanation server.
+
+Loads the collision, red-light and side-move models of collisions_app,
+redlight_app and sidemove_app (from the ModelRegistry cache, training only
+on a miss) and their explainers once, then answers over HTTP:
+
+    GET  /models
+    GET  /explain?model=run_red_light&row_id=full_data_gamma_cross_a_eb_left:17&lime=1
+    POST /explain {"model": "num_collisions", "params": {"time0": 12, ..., "movement": "left"}}
+
+A test is given by its row_id (see FeatureStore.row_ids) or its feature
+store position as row, or by a params row. Concurrent requests for one
+model are micro-batched into a single predict and shap_values call; SHAP
+values and LIME weights of stored tests come from the ExplanationStore.
+
+    python explainability/explain_server.py --port 5700
+"""
+import argparse
+import importlib
+import json
+import queue
+import threading
+import time
+import urllib.parse
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+
+from collision_model import FeatureStore
+from lime_ex import LimeAnalyzer
+from shap_ex import ShapAnalyzer
+from model_registry import ModelRegistry
+from explanation_store import ExplanationStore
+import collisions_app
+import redlight_app
+import sidemove_app
+
+APPS = [collisions_app, redlight_app, sidemove_app]
+HOST = "127.0.0.1"
+PORT = 5700
+# Requests per predict/shap_values call, and how long a batch waits to fill
+MAX_BATCH = 64
+MAX_WAIT_S = 0.002
+
+class MicroBatcher:
+    def __init__(self, fn, max_batch: int = MAX_BATCH, max_wait_s: float = MAX_WAIT_S):
+        """
+        Calls fn(items) -> results from one thread, on batches of the items
+        submitted concurrently. A batch starts with the first waiting item
+        and takes whatever else arrives within @max_wait_s.
+        """
+        self.fn = fn
+        self.max_batch = max_batch
+        self.max_wait_s = max_wait_s
+        self.n_batches = 0
+        self.n_items = 0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, item) -> Future:
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            if batch[0] is None:
+                return
+            deadline = time.monotonic() + self.max_wait_s
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    entry = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if entry is None:
+                    self._queue.put(None)
+                    break
+                batch.append(entry)
+
+            items = [item for item, _ in batch]
+            try:
+                results = self.fn(items)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+            self.n_batches += 1
+            self.n_items += len(batch)
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+class ModelService:
+    def __init__(self, app, registry: ModelRegistry, feature_store: FeatureStore):
+        """The model of explainability @app with its explainers, loaded once"""
+        self.name = app.Y_COLUMN
+        model_df = feature_store.model_df(app.DATASETS, app.Y_COLUMN)
+        experiment = importlib.import_module(f"pycaret.{app.EXPERIMENT}")
+        artifacts = registry.get_or_train(
+            experiment, {**app.SETUP_CONFIG, 'data': model_df}, app.DATASETS, 'lightgbm')
+
+        self.key = artifacts['key']
+        self.model = artifacts['model']
+        self.X_train = artifacts['X_train']
+        self.features = list(self.X_train.columns)
+        # Consolidated copy, so concatenating a batch of rows stays cheap
+        self.rows = model_df[self.features].sort_index().copy()
+        self.row_ids = FeatureStore.row_ids(app.DATASETS)
+        self.positions = {row_id: i for i, row_id in enumerate(self.row_ids)}
+
+        self.store = ExplanationStore(self.key, self.row_ids, self.features)
+        self.shap = ShapAnalyzer(self.model, self.X_train, store=self.store)
+        self.lime = LimeAnalyzer(self.X_train, self.model, y=self.name, store=self.store)
+        self.lime_lock = threading.Lock()
+        self.batcher = MicroBatcher(self.predict_and_explain)
+
+    def row(self, request: dict) -> tuple:
+        """Store position (None for a params row) and 1-row frame of @request"""
+        if 'row_id' in request:
+            if request['row_id'] not in self.positions:
+                raise KeyError(f"Unknown row_id {request['row_id']}")
+            label = self.positions[request['row_id']]
+            return label, self.rows.loc[[label]]
+        if 'row' in request:
+            label = int(request['row'])
+            return label, self.rows.loc[[label]]
+        if 'params' not in request:
+            raise ValueError("Give row_id, row or params")
+
+        params = dict(request['params'])
+        movement = params.pop('movement', None)
+        if movement is not None:
+            for feature in self.features:
+                if feature.startswith("movement_"):
+                    params[feature] = feature == f"movement_{movement}"
+        missing = [feature for feature in self.features if feature not in params]
+        if missing:
+            raise ValueError(f"Missing params: {', '.join(missing)}")
+        X = pd.DataFrame([params])[self.features].astype(self.rows.dtypes.to_dict())
+        return None, X
+
+    def predict_and_explain(self, items: list[tuple]) -> list[dict]:
+        """Predictions and SHAP values of a batch of (label, row) items"""
+        X = pd.concat([row for _, row in items])
+        predictions = self.model.predict(X)
+        probabilities = self.model.predict_proba(X)[:, -1] \
+            if hasattr(self.model, 'predict_proba') else None
+
+        base_values = np.empty(len(items))
+        shap_values = np.empty((len(items), len(self.features)))
+        labels = [label for label, _ in items]
+        stored = [i for i, label in enumerate(labels) if label is not None]
+        adhoc = [i for i, label in enumerate(labels) if label is None]
+        if stored:
+            # Concurrent requests may ask for the same test
+            unique = sorted({labels[i] for i in stored})
+            unique_base, unique_shap = self.shap.explain_rows(self.rows.loc[unique])
+            j = [unique.index(labels[i]) for i in stored]
+            base_values[stored], shap_values[stored] = unique_base[j], unique_shap[j]
+        if adhoc:
+            base_values[adhoc] = self.shap.expected_value
+            shap_values[adhoc] = self.shap.shap_matrix(X.iloc[adhoc].values)
+
+        results = []
+        for i, (label, _) in enumerate(items):
+            result = {
+                'model': self.name,
+                'prediction': np.asarray(predictions[i]).item(),
+                'base_value': float(base_values[i]),
+                'shap': dict(zip(self.features, shap_values[i].tolist())),
+            }
+            if label is not None:
+                result['row_id'] = str(self.row_ids[label])
+            if probabilities is not None:
+                result['probability'] = float(probabilities[i])
+            results.append(result)
+        return results
+
+    def lime_weights(self, label, X: pd.DataFrame) -> dict:
+        """LIME weights of the features LIME kept, from the store when it has them"""
+        if label is not None and self.store.contains(self.store.LIME, label):
+            _, weights = self.store.get(self.store.LIME, [label])
+            weights = weights[0]
+        else:
+            with self.lime_lock:
+                exp = self.lime.explain(X, X.index[0])
+                if label is not None:
+                    self.lime.save_explanations(X, [(label, exp)])
+            weights = np.zeros(len(self.features))
+            for feature, weight in exp.local_exp[self.lime.LABEL]:
+                weights[feature] = weight
+        return {feature: float(weight) for feature, weight in zip(self.features, weights)
+                if weight != 0}
+
+    def explain(self, request: dict) -> dict:
+        start = time.perf_counter()
+        label, X = self.row(request)
+        result = self.batcher.submit((label, X)).result()
+        if request.get('lime'):
+            result['lime'] = self.lime_weights(label, X)
+        result['elapsed_ms'] = (time.perf_counter() - start) * 1000
+        return result
+
+class ExplainServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, services: dict, host: str = HOST, port: int = PORT):
+        self.services = services
+        super().__init__((host, port), ExplainHandler)
+
+class ExplainHandler(BaseHTTPRequestHandler):
+    def send_json(self, status: int, body: dict):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def answer(self, request: dict):
+        services = self.server.services
+        if request.get('model') not in services:
+            self.send_json(400, {'error': f"model must be one of {sorted(services)}"})
+            return
+        try:
+            result = services[request['model']].explain(request)
+        except (KeyError, ValueError, TypeError) as e:
+            self.send_json(400, {'error': str(e)})
+            return
+        self.send_json(200, result)
+
+    def do_GET(self):
+        url = urllib.parse.urlparse(self.path)
+        if url.path == "/models":
+            self.send_json(200, {name: {'key': service.key, 'features': service.features}
+                                 for name, service in self.server.services.items()})
+        elif url.path == "/explain":
+            request = dict(urllib.parse.parse_qsl(url.query))
+            request['lime'] = request.get('lime', '0') not in ('0', 'false', '')
+            self.answer(request)
+        else:
+            self.send_json(404, {'error': f"Unknown path {url.path}"})
+
+    def do_POST(self):
+        if urllib.parse.urlparse(self.path).path != "/explain":
+            self.send_json(404, {'error': f"Unknown path {self.path}"})
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError as e:
+            self.send_json(400, {'error': f"Invalid JSON: {e}"})
+            return
+        self.answer(request)
+
+    def log_message(self, format, *args):
+        return
+
+def main():
+    parser = argparse.ArgumentParser(description="Local explanation server")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--models", nargs="*", default=[app.Y_COLUMN for app in APPS],
+                        help="Models to serve, by target name")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    registry = ModelRegistry()
+    feature_store = FeatureStore()
+    services = {}
+    for app in APPS:
+        if app.Y_COLUMN in args.models:
+            print(f"Loading {app.Y_COLUMN} model")
+            services[app.Y_COLUMN] = ModelService(app, registry, feature_store)
+
+    server = ExplainServer(services, args.host, args.port)
+    print(f"Serving {', '.join(services)} on http://{args.host}:{args.port} "
+          f"(loaded in {time.perf_counter() - start:.1f} s)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        for service in services.values():
+            service.batcher.close()
+
+if __name__ == "__main__":
+    main()
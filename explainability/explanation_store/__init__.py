@@ -0,0 +1 @@
+from .explanation_store import ExplanationStore
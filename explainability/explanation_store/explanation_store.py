@@ -0,0 +1,144 @@
+import glob
+import json
+import os
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+class ExplanationStore:
+    SHAP = "shap"
+    LIME = "lime"
+
+    # Schema metadata key of the explained feature names
+    FEATURES_KEY = b"feature_names"
+
+    def __init__(self, model_key: str, row_ids, feature_names: list[str],
+                 store_dir: str = "out/cache/explanations"):
+        """
+        Per-row SHAP and LIME explanations of one model, kept in feather
+        parts under @store_dir/@model_key.
+
+        @model_key is the ModelRegistry fingerprint, which already changes
+        with the data, features, target and setup. @row_ids maps the row
+        labels of the explained frames (feature store positions) to stable
+        ids like "<source file>:<row>", see FeatureStore.row_ids. Each part
+        holds row_id, base_value (SHAP expected value or LIME intercept) and
+        one value per feature (SHAP value or LIME weight, 0 for features
+        LIME left out).
+        """
+        self.model_key = model_key
+        self.row_ids = np.asarray(row_ids)
+        self.feature_names = list(feature_names)
+        self.store_dir = store_dir
+        self._entries = {}
+
+    @property
+    def model_dir(self) -> str:
+        return os.path.join(self.store_dir, self.model_key)
+
+    @staticmethod
+    def read_part(path: str) -> tuple[list[str], pa.Table, np.ndarray]:
+        """Feature names, table and values matrix of one part file"""
+        table = feather.read_table(path, memory_map=True)
+        feature_names = json.loads(table.schema.metadata[ExplanationStore.FEATURES_KEY])
+        values = table.column('values').combine_chunks().flatten().to_numpy()
+        return feature_names, table, values.reshape(table.num_rows, len(feature_names))
+
+    def entries(self, method: str) -> dict:
+        """Stored {row_id: (base_value, values)} of @method; later parts win"""
+        if method not in self._entries:
+            entries = {}
+            for path in sorted(glob.glob(os.path.join(self.model_dir, f"{method}-*.feather"))):
+                feature_names, table, values = self.read_part(path)
+                if feature_names != self.feature_names:
+                    continue
+                base_values = table.column('base_value').to_numpy()
+                for i, row_id in enumerate(table.column('row_id').to_pylist()):
+                    entries[row_id] = (base_values[i], values[i])
+            self._entries[method] = entries
+        return self._entries[method]
+
+    def contains(self, method: str, label) -> bool:
+        return str(self.row_ids[label]) in self.entries(method)
+
+    def get(self, method: str, labels) -> tuple[np.ndarray, np.ndarray]:
+        """Base values and values of the rows @labels, KeyError if any is missing"""
+        entries = self.entries(method)
+        rows = [entries[str(row_id)] for row_id in self.row_ids[list(labels)]]
+        return (np.array([base for base, _ in rows]),
+                np.array([values for _, values in rows]).reshape(len(rows), len(self.feature_names)))
+
+    def put(self, method: str, labels, base_values, values):
+        """Store explanations of the rows @labels as a new part"""
+        row_ids = [str(row_id) for row_id in self.row_ids[list(labels)]]
+        values = np.asarray(values, dtype=np.float64).reshape(len(row_ids), len(self.feature_names))
+        base_values = np.asarray(base_values, dtype=np.float64)
+        table = pa.table({
+            'row_id': pa.array(row_ids),
+            'base_value': pa.array(base_values),
+            'values': pa.FixedSizeListArray.from_arrays(
+                pa.array(values.ravel()), len(self.feature_names)),
+        }).replace_schema_metadata({
+            self.FEATURES_KEY: json.dumps(self.feature_names)
+        })
+
+        os.makedirs(self.model_dir, exist_ok=True)
+        path = os.path.join(self.model_dir,
+                            f"{method}-{time.time_ns()}-{uuid.uuid4().hex[:8]}.feather")
+        tmp_path = f"{path}.tmp"
+        feather.write_feather(table, tmp_path, compression="uncompressed")
+        os.replace(tmp_path, path)
+
+        entries = self.entries(method)
+        for row_id, base, row in zip(row_ids, base_values, values):
+            entries[row_id] = (base, row)
+
+    def explain(self, method: str, labels, compute) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Base values and values of the rows @labels, looked up in the store.
+        Missing rows are explained with compute(missing_labels) ->
+        (base_values, values) and stored.
+        """
+        labels = list(labels)
+        missing = [label for label in labels if not self.contains(method, label)]
+        if missing:
+            base_values, values = compute(missing)
+            self.put(method, missing, base_values, values)
+        return self.get(method, labels)
+
+    @staticmethod
+    def summary(store_dir: str = "out/cache/explanations", method: str = None) -> pd.DataFrame:
+        """
+        Mean |value|, mean value and number of explained rows per model,
+        method and feature, over every stored explanation.
+        """
+        frames = []
+        for model_dir in sorted(glob.glob(os.path.join(store_dir, "*"))):
+            model_key = os.path.basename(model_dir)
+            groups = {}
+            for path in sorted(glob.glob(os.path.join(model_dir, "*-*.feather"))):
+                part_method = os.path.basename(path).split("-")[0]
+                if method is not None and part_method != method:
+                    continue
+                feature_names, table, values = ExplanationStore.read_part(path)
+                rows = groups.setdefault((part_method, tuple(feature_names)), {})
+                for row_id, row in zip(table.column('row_id').to_pylist(), values):
+                    rows[row_id] = row
+            for (part_method, feature_names), rows in groups.items():
+                values = np.array(list(rows.values()))
+                frames.append(pd.DataFrame({
+                    'model': model_key,
+                    'method': part_method,
+                    'feature': list(feature_names),
+                    'n_rows': len(values),
+                    'mean_abs': np.abs(values).mean(0),
+                    'mean': values.mean(0),
+                }))
+        if not frames:
+            return pd.DataFrame(columns=['model', 'method', 'feature', 'n_rows', 'mean_abs', 'mean'])
+        return pd.concat(frames, ignore_index=True)\
+            .sort_values(['model', 'method', 'mean_abs'], ascending=[True, True, False], ignore_index=True)
@@ -4,7 +4,16 @@ import os.path
 import time
 
 class LimeAnalyzer:
-    def __init__(self, X_train, model, y):
+    # Label of the regression explanation in LIME's local_exp and intercept
+    LABEL = 1
+
+    def __init__(self, X_train, model, y, store=None):
+        """
+        LIME explanations of @model. With an ExplanationStore as @store, the
+        weights of every explained row are stored, and rows already in the
+        store whose report exists are not explained again.
+        """
+        self.store = store
         self.explainer = LimeTabularExplainer(
             X_train.values,
             feature_names=X_train.columns,
@@ -14,18 +23,45 @@ class LimeAnalyzer:
         )
         self.model = model
 
+    def explain(self, X, idx):
+        """LIME explanation of row @idx of @X"""
+        return self.explainer.explain_instance(
+            X.loc[idx].values,
+            self.model.predict,
+            num_features=30,
+        )
+
+    def save_explanations(self, X, explained):
+        """Store the weights of the (idx, exp) pairs @explained as one part"""
+        if self.store is None or not explained:
+            return
+        weights = np.zeros((len(explained), X.shape[1]))
+        for i, (_, exp) in enumerate(explained):
+            for feature, weight in exp.local_exp[self.LABEL]:
+                weights[i, feature] = weight
+        self.store.put(self.store.LIME, [idx for idx, _ in explained],
+                       [exp.intercept[self.LABEL] for _, exp in explained], weights)
+
+    def is_stored(self, idx, output_path):
+        """True if row @idx was explained before and its report still exists"""
+        return self.store is not None and os.path.exists(output_path) \
+            and self.store.contains(self.store.LIME, idx)
+
     def analyze_specific_scenario(self, X_test, y_test, test_pred, scenario_idx, output_dir, verbose=False):
         """Analyze a specific scenario by index"""
         if not os.path.exists(output_dir):
             os.makedirs(output_dir)
 
+        output_path = os.path.join(output_dir, f"scenario_{scenario_idx}_analysis.html")
+        if self.is_stored(scenario_idx, output_path):
+            if verbose:
+                print(f"\nScenario {scenario_idx} is already explained in {output_path}")
+            return
+
         start_time = time.perf_counter()
-        exp = self.explainer.explain_instance(
-            X_test.loc[scenario_idx].values,
-            self.model.predict,
-            num_features=30,
-        )
+        exp = self.explain(X_test, scenario_idx)
         analysis_time = time.perf_counter() - start_time
+        self.save_explanations(X_test, [(scenario_idx, exp)])
 
         if verbose:
             print(f"\nAnalyzing scenario {scenario_idx}:")
@@ -36,7 +72,6 @@ class LimeAnalyzer:
             for feature, impact in exp.as_list():
                 print(f"{feature}: {impact:.4f}")
 
-        output_path = os.path.join(output_dir, f"scenario_{scenario_idx}_analysis.html")
         exp.save_to_file(output_path)
 
     def analyze_red_light_cases(self, X_test, y_test, test_pred, output_dir, verbose=False):
@@ -47,27 +82,29 @@ class LimeAnalyzer:
         red_light_cases = X_test[X_test['run_red_light'] == True].index
         total_start_time = time.perf_counter()
         total_analysis_time = 0
+        explained = []
 
         if verbose:
             print(f"\nAnalyzing {len(red_light_cases)} red light cases")
 
         for idx in red_light_cases:
+            output_path = os.path.join(output_dir, f"red_light_case_{idx}.html")
+            if self.is_stored(idx, output_path):
+                continue
+
             start_time = time.perf_counter()
-            exp = self.explainer.explain_instance(
-                X_test.loc[idx].values,
-                self.model.predict,
-                num_features=30,
-            )
+            exp = self.explain(X_test, idx)
             analysis_time = time.perf_counter() - start_time
             total_analysis_time += analysis_time
+            explained.append((idx, exp))
 
             if verbose:
                 print(f"\nCase {idx}:")
                 print(f"Analysis took {analysis_time:.4f} seconds")
 
-            output_path = os.path.join(output_dir, f"red_light_case_{idx}.html")
             exp.save_to_file(output_path)
 
+        self.save_explanations(X_test, explained)
         total_time = time.perf_counter() - total_start_time
         if verbose:
             print(f"\nTotal analysis time: {total_time:.4f} seconds")
@@ -82,27 +119,29 @@ class LimeAnalyzer:
         side_move_cases = X_test[X_test['side_move'] == True].index
         total_start_time = time.perf_counter()
         total_analysis_time = 0
+        explained = []
 
         if verbose:
             print(f"\nAnalyzing {len(side_move_cases)} side move cases")
 
         for idx in side_move_cases:
+            output_path = os.path.join(output_dir, f"side_move_case_{idx}.html")
+            if self.is_stored(idx, output_path):
+                continue
+
             start_time = time.perf_counter()
-            exp = self.explainer.explain_instance(
-                X_test.loc[idx].values,
-                self.model.predict,
-                num_features=30,
-            )
+            exp = self.explain(X_test, idx)
             analysis_time = time.perf_counter() - start_time
             total_analysis_time += analysis_time
+            explained.append((idx, exp))
 
             if verbose:
                 print(f"\nCase {idx}:")
                 print(f"Analysis took {analysis_time:.4f} seconds")
 
-            output_path = os.path.join(output_dir, f"side_move_case_{idx}.html")
             exp.save_to_file(output_path)
 
+        self.save_explanations(X_test, explained)
         total_time = time.perf_counter() - total_start_time
         if verbose:
             print(f"\nTotal analysis time: {total_time:.4f} seconds")
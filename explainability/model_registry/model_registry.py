@@ -0,0 +1,108 @@
+import hashlib
+import json
+import os
+import pickle
+
+# Imported first, it puts the repository root (utils) on sys.path
+from collision_model.feature_store import DERIVATION_SOURCES
+import utils
+
+class ModelRegistry:
+    # Bumped when cached artifacts change layout, e.g. 2: X/y indexed by
+    # feature store row, so explanations can be stored per row
+    FORMAT = 2
+
+    def __init__(self, registry_dir: str = "out/cache/models"):
+        """
+        On-disk cache of trained PyCaret models and their train/test splits.
+
+        Entries are keyed on a fingerprint of the dataset files, the code
+        deriving the targets, the feature columns, the target, the setup
+        config and the model id, so a change to any of them misses the cache
+        and retrains.
+        """
+        self.registry_dir = registry_dir
+
+    @staticmethod
+    def fingerprint(dataset_paths: list[tuple[str, str, str]],
+                    feature_cols: list[str],
+                    target: str,
+                    setup_config: dict,
+                    experiment: str,
+                    model_id: str) -> str:
+        """Fingerprint of everything that determines a trained model"""
+        payload = {
+            "datasets": [
+                [utils.file_digest(params_path),
+                 utils.file_digest(scores_path),
+                 movement_type]
+                for params_path, scores_path, movement_type in dataset_paths
+            ],
+            # The code deriving the targets from the datasets
+            "code": utils.files_digest(DERIVATION_SOURCES),
+            "features": list(feature_cols),
+            "target": target,
+            "setup": {k: v for k, v in setup_config.items() if k != "data"},
+            "experiment": experiment,
+            "model": model_id,
+            "format": ModelRegistry.FORMAT,
+        }
+        msg = json.dumps(payload, sort_keys=True, default=str)
+        return hashlib.sha256(msg.encode()).hexdigest()[:16]
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.registry_dir, f"{key}.pkl")
+
+    def load(self, key: str):
+        """Load the artifacts stored under @key, or None on a miss"""
+        path = self.path(key)
+        if not os.path.exists(path):
+            return None
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+    def save(self, key: str, artifacts: dict):
+        """Store @artifacts under @key"""
+        os.makedirs(self.registry_dir, exist_ok=True)
+        path = self.path(key)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(artifacts, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    def get_or_train(self, experiment, setup_config: dict,
+                     dataset_paths: list[tuple[str, str, str]],
+                     model_id: str = "lightgbm") -> dict:
+        """
+        Return the fitted model, pipeline and train/test split for
+        @setup_config, training with the PyCaret @experiment module
+        (regression or classification) only on a cache miss.
+        """
+        data = setup_config["data"]
+        target = setup_config["target"]
+        feature_cols = [col for col in data.columns if col != target]
+        key = self.fingerprint(dataset_paths, feature_cols, target,
+                               setup_config, experiment.__name__, model_id)
+
+        artifacts = self.load(key)
+        if artifacts is not None:
+            print(f"Loaded cached {model_id} model {key}")
+            return artifacts
+
+        print("\nSetting up PyCaret environment")
+        experiment.setup(**setup_config)
+
+        print(f"\nTraining {model_id} model")
+        model = experiment.create_model(model_id)
+
+        artifacts = {
+            "key": key,
+            "model": model,
+            "pipeline": experiment.get_config('pipeline'),
+            "X_train": experiment.get_config('X_train'),
+            "X_test": experiment.get_config('X_test'),
+            "y_train": experiment.get_config('y_train'),
+            "y_test": experiment.get_config('y_test'),
+        }
+        self.save(key, artifacts)
+        return artifacts
@@ -0,0 +1 @@
+from .model_selector import ModelSelector, REGRESSORS, make_model
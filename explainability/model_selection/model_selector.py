@@ -0,0 +1,263 @@
+import importlib
+import json
+import math
+import multiprocessing
+import os
+import queue
+import time
+
+import numpy as np
+import pandas as pd
+
+# PyCaret regression ids of the candidate models as (module, class, kwargs),
+# importable in worker processes without PyCaret itself
+REGRESSORS = {
+    'lr': ("sklearn.linear_model", "LinearRegression", {}),
+    'ridge': ("sklearn.linear_model", "Ridge", {}),
+    'dt': ("sklearn.tree", "DecisionTreeRegressor", {}),
+    'rf': ("sklearn.ensemble", "RandomForestRegressor", {'n_jobs': 1}),
+    'gbr': ("sklearn.ensemble", "GradientBoostingRegressor", {}),
+    'xgboost': ("xgboost", "XGBRegressor", {'n_jobs': 1}),
+    'lightgbm': ("lightgbm", "LGBMRegressor", {'n_jobs': 1, 'verbose': -1}),
+    'catboost': ("catboost", "CatBoostRegressor", {'thread_count': 1, 'verbose': False}),
+}
+
+# Set in each worker process by _init_worker, so the data is sent once per
+# process rather than once per task
+_X = None
+_y = None
+
+def make_model(model_id: str, seed: int = None):
+    """Unfitted, normalizing pipeline of the candidate @model_id"""
+    from sklearn.pipeline import make_pipeline
+    from sklearn.preprocessing import StandardScaler
+
+    module, name, kwargs = REGRESSORS[model_id]
+    estimator = getattr(importlib.import_module(module), name)(**kwargs)
+    if seed is not None and 'random_state' in estimator.get_params():
+        estimator.set_params(random_state=seed)
+    return make_pipeline(StandardScaler(), estimator)
+
+def _init_worker(X: np.ndarray, y: np.ndarray):
+    global _X, _y
+    _X, _y = X, y
+
+def _evaluate_fold(task: dict) -> dict:
+    """Fit one candidate on a subset of one fold and score it on the fold's test rows"""
+    from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
+
+    start = time.perf_counter()
+    model = make_model(task['model'], task['seed'])
+    model.fit(_X[task['train']], _y[task['train']])
+    fit_s = time.perf_counter() - start
+    predictions = model.predict(_X[task['test']])
+    y_test = _y[task['test']]
+    return {
+        'model': task['model'],
+        'fraction': task['fraction'],
+        'fold': task['fold'],
+        'n_train': len(task['train']),
+        'R2': float(r2_score(y_test, predictions)),
+        'MAE': float(mean_absolute_error(y_test, predictions)),
+        'RMSE': float(np.sqrt(mean_squared_error(y_test, predictions))),
+        'fit_s': fit_s,
+    }
+
+class ModelSelector:
+    def __init__(self, X: pd.DataFrame, y: pd.Series,
+                 checkpoint_path: str,
+                 models: list[str] = None,
+                 budget_s: float = 1800,
+                 n_jobs: int = None,
+                 fold: int = 5,
+                 eta: int = 3,
+                 n_rungs: int = 3,
+                 sort: str = 'R2',
+                 seed: int = 0):
+        """
+        Parallel model selection by successive halving under a wall-clock
+        budget.
+
+        Every candidate is cross-validated on @fold folds, first training on
+        1/eta^(n_rungs-1) of each fold's training rows. The best 1/@eta of
+        the candidates by mean @sort move on to a rung with @eta times the
+        rows, until the last rung trains on full folds. The folds of a rung
+        run in @n_jobs worker processes, and the pool is terminated when
+        @budget_s runs out.
+
+        Every finished fold is appended to the JSONL file @checkpoint_path
+        and is read back instead of refit on a rerun, so @checkpoint_path
+        should be specific to the data and config (e.g. a ModelRegistry
+        fingerprint). A failing candidate is dropped without losing the
+        other candidates' folds.
+        """
+        self.X = X
+        self.y = y
+        self.checkpoint_path = checkpoint_path
+        self.models = list(REGRESSORS) if models is None else list(models)
+        self.budget_s = budget_s
+        self.n_jobs = n_jobs or os.cpu_count()
+        self.fold = fold
+        self.eta = eta
+        self.n_rungs = n_rungs
+        self.sort = sort
+        self.seed = seed
+        self.results = self.load_checkpoint()
+        self.errors = {}
+
+    @property
+    def fractions(self) -> list[float]:
+        """Share of each fold's training rows used at each rung"""
+        return [self.eta ** -(self.n_rungs - 1 - rung) for rung in range(self.n_rungs)]
+
+    def load_checkpoint(self) -> dict:
+        """Finished folds as {(model, fraction, fold): result}"""
+        results = {}
+        if os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path) as f:
+                for line in f:
+                    try:
+                        result = json.loads(line)
+                    except ValueError:
+                        # A line cut short by a killed run
+                        continue
+                    results[(result['model'], result['fraction'], result['fold'])] = result
+        return results
+
+    def checkpoint(self, result: dict):
+        os.makedirs(os.path.dirname(self.checkpoint_path) or ".", exist_ok=True)
+        with open(self.checkpoint_path, "a") as f:
+            f.write(json.dumps(result) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.results[(result['model'], result['fraction'], result['fold'])] = result
+
+    def available_models(self) -> list[str]:
+        """Candidates whose library is installed"""
+        models = []
+        for model_id in self.models:
+            try:
+                importlib.import_module(REGRESSORS[model_id][0])
+            except ImportError as e:
+                print(f"Skipping {model_id}: {e}")
+                self.errors[model_id] = str(e)
+                continue
+            models.append(model_id)
+        return models
+
+    def folds(self) -> list[tuple[np.ndarray, np.ndarray]]:
+        """
+        Shuffled (train, test) row positions of every fold.
+
+        Folds are drawn over the sorted index of @X (feature store positions
+        for FeatureStore frames), not over its row order, so a rerun on the
+        same rows in another order gets the same folds and its checkpointed
+        results stay valid.
+        """
+        from sklearn.model_selection import KFold
+
+        ids = np.sort(np.asarray(self.X.index))
+        positions = self.X.index.get_indexer(ids)
+        if (positions < 0).any() or len(np.unique(ids)) != len(ids):
+            raise ValueError("Model selection needs a unique index on X")
+        rng = np.random.default_rng(self.seed)
+        kfold = KFold(self.fold, shuffle=True, random_state=self.seed)
+        return [(positions[rng.permutation(train)], positions[test])
+                for train, test in kfold.split(ids)]
+
+    def tasks(self, models: list[str], fraction: float, folds: list) -> list[dict]:
+        """Fold tasks of @models at @fraction that are not checkpointed yet"""
+        tasks = []
+        for model_id in models:
+            for i, (train, test) in enumerate(folds):
+                if (model_id, fraction, i) in self.results:
+                    continue
+                # The same leading rows of the shuffled fold for every model
+                n_train = max(1, math.ceil(len(train) * fraction))
+                tasks.append({
+                    'model': model_id,
+                    'fraction': fraction,
+                    'fold': i,
+                    'seed': self.seed,
+                    'train': train[:n_train],
+                    'test': test,
+                })
+        return tasks
+
+    def leaderboard(self, fraction: float, models: list[str] = None) -> pd.DataFrame:
+        """Mean fold scores of the candidates that finished every fold at @fraction"""
+        rows = [result for (model_id, result_fraction, _), result in self.results.items()
+                if result_fraction == fraction and (models is None or model_id in models)]
+        if not rows:
+            return pd.DataFrame(columns=['model', 'folds', 'R2', 'MAE', 'RMSE', 'fit_s'])
+        scores = pd.DataFrame(rows).groupby('model').agg(
+            folds=('fold', 'nunique'), R2=('R2', 'mean'), MAE=('MAE', 'mean'),
+            RMSE=('RMSE', 'mean'), fit_s=('fit_s', 'mean'))
+        scores = scores[scores['folds'] == self.fold]
+        ascending = self.sort != 'R2'
+        return scores.sort_values(self.sort, ascending=ascending).reset_index()
+
+    def run_rung(self, pool, tasks: list[dict], deadline: float) -> bool:
+        """Run @tasks in @pool, checkpointing as they finish; False when out of time"""
+        done = queue.Queue()
+        for task in tasks:
+            pool.apply_async(_evaluate_fold, (task,),
+                             callback=lambda result: done.put((True, result)),
+                             error_callback=lambda e, task=task: done.put((False, (task, e))))
+
+        for _ in range(len(tasks)):
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                return False
+            try:
+                ok, result = done.get(timeout=timeout)
+            except queue.Empty:
+                return False
+            if ok:
+                self.checkpoint(result)
+                print(f"  {result['model']} fold {result['fold']} "
+                      f"({result['n_train']} rows): R2 {result['R2']:.4f}")
+            else:
+                task, e = result
+                print(f"  {task['model']} fold {task['fold']} failed: {e}")
+                self.errors[task['model']] = str(e)
+        return True
+
+    def run(self) -> tuple[str, pd.DataFrame]:
+        """Best model id and the leaderboard of the last rung it reached"""
+        deadline = time.monotonic() + self.budget_s
+        folds = self.folds()
+        models = self.available_models()
+        X, y = np.asarray(self.X, dtype=np.float64), np.asarray(self.y, dtype=np.float64)
+
+        best = None
+        pool = multiprocessing.Pool(self.n_jobs, initializer=_init_worker, initargs=(X, y))
+        try:
+            for rung, fraction in enumerate(self.fractions):
+                tasks = self.tasks(models, fraction, folds)
+                print(f"\nRung {rung}: {len(models)} models on {fraction:.0%} of each fold, "
+                      f"{len(tasks)} folds to fit ({len(models) * self.fold - len(tasks)} checkpointed)")
+                in_time = self.run_rung(pool, tasks, deadline)
+
+                leaderboard = self.leaderboard(fraction, models)
+                if leaderboard.empty:
+                    break
+                # A rung cut short ranks only the models that happened to
+                # finish first, so it replaces the previous rung's winner
+                # only when every promoted model finished its folds
+                if in_time or best is None or len(leaderboard) == len(models):
+                    best = (leaderboard['model'].iloc[0], leaderboard)
+                if not in_time:
+                    print(f"Time budget of {self.budget_s} s used up at rung {rung}, "
+                          f"{len(leaderboard)} of {len(models)} models finished; "
+                          f"keeping {best[0]}")
+                    break
+                models = list(leaderboard['model'].iloc[:max(1, math.ceil(len(models) / self.eta))])
+        finally:
+            # Drops folds still running when the budget ran out
+            pool.terminate()
+            pool.join()
+
+        if best is None:
+            raise RuntimeError("No candidate finished all its folds within the time budget")
+        return best
@@ -1,10 +1,11 @@
-from collision_model import CollisionDataLoader
+from collision_model import FeatureStore
 from lime_ex import LimeAnalyzer
 from shap_ex import ShapAnalyzer
+from model_registry import ModelRegistry
+from explanation_store import ExplanationStore
 import numpy as np
 import pandas as pd
 import os
-from pycaret import classification
 
 DATASETS = [
    ("out/full_data/full_data_gamma_cross_a_eb_left_params.feather",
@@ -21,8 +22,21 @@ DATASETS = [
 OUTPUT_DIR = "out/explainability/run_red_light"
 Y_COLUMN = "run_red_light"
 RANDOM_STATE = None
-
-def analyze_scenario(X_train, X_test, y_test, test_pred, model, scenario_idx, position):
+# PyCaret setup of the model, without the data
+SETUP_CONFIG = {
+    'target': Y_COLUMN,
+    'session_id': RANDOM_STATE,
+    'normalize': True,
+    'remove_outliers': False,
+    'polynomial_features': False,
+    'feature_selection': False,
+    'fold': 5,
+    'verbose': False,
+}
+# PyCaret module the model is trained with
+EXPERIMENT = "classification"
+
+def analyze_scenario(X_train, X_test, y_test, test_pred, model, scenario_idx, position, store=None):
     """Analyze a specific scenario with both Lime and SHAP"""
     lime_dir = os.path.join(OUTPUT_DIR, "local", "lime")
     shap_dir = os.path.join(OUTPUT_DIR, "local", "shap")
@@ -30,14 +44,14 @@ def analyze_scenario(X_train, X_test, y_test, test_pred, model, scenario_idx, po
     actual_value = y_test[scenario_idx]
     predicted_value = test_pred[position]
 
-    lime_analyzer = LimeAnalyzer(X_train, model, y=Y_COLUMN)
+    lime_analyzer = LimeAnalyzer(X_train, model, y=Y_COLUMN, store=store)
     lime_analyzer.analyze_specific_scenario(
         X_test, y_test, test_pred, scenario_idx,
         output_dir=lime_dir,
         verbose=True
     )
 
-    shap_analyzer = ShapAnalyzer(model, X_train)
+    shap_analyzer = ShapAnalyzer(model, X_train, store=store)
     shap_analyzer.analyze_specific_scenario_classification(
     X_test, y_test, scenario_idx,
         output_dir=shap_dir,
@@ -46,37 +60,28 @@ def analyze_scenario(X_train, X_test, y_test, test_pred, model, scenario_idx, po
     )
 
 def main():
+    from pycaret import classification
+
     print("Loading and combining datasets")
-    model_df = CollisionDataLoader.combine_datasets_for_redlight(DATASETS)
+    model_df = FeatureStore().model_df(DATASETS, Y_COLUMN)
 
     print(f"Dataset shape: {model_df.shape}")
     print("\nFeature names:")
     feature_cols = [col for col in model_df.columns if col != Y_COLUMN]
     print('\n'.join(feature_cols))
 
-    print("\nSetting up PyCaret environment")
-    classification.setup(
-        data=model_df,
-        target=Y_COLUMN,
-        session_id=RANDOM_STATE,
-        normalize=True,
-        remove_outliers=False,
-        polynomial_features=False,
-        feature_selection=False,
-        fold=5,
-        verbose=False
-    )
-
-    print("\nTraining LightGBM model")
-    model = classification.create_model('lightgbm')
+    setup_config = {**SETUP_CONFIG, 'data': model_df}
+    artifacts = ModelRegistry().get_or_train(classification, setup_config, DATASETS, 'lightgbm')
+    model = artifacts['model']
 
     if not hasattr(model, 'predict'):
         raise ValueError("Extracted model doesn't have specified prediction method")
 
     # Get data splits from PyCaret
-    X_train = classification.get_config('X_train')
-    X_test = classification.get_config('X_test')
-    y_test = classification.get_config('y_test')
+    X_train = artifacts['X_train']
+    X_test = artifacts['X_test']
+    y_test = artifacts['y_test']
+    store = ExplanationStore(artifacts['key'], FeatureStore.row_ids(DATASETS), X_train.columns)
 
     print("\n___ Model Evaluation ___")
     test_pred = model.predict(X_test)
@@ -128,7 +133,7 @@ def main():
     print(f"Red light run: {actual_value}")
     print(f"Predicted red light: {predicted_value}")
 
-    analyze_scenario(X_train, X_test, y_test, test_pred, model, random_idx, position)
+    analyze_scenario(X_train, X_test, y_test, test_pred, model, random_idx, position, store)
 
 if __name__ == "__main__":
    main()
@@ -1 +1 @@
-from .shap_analyzer import ShapAnalyzer
+from .shap_analyzer import ShapAnalyzer, ShapSummary
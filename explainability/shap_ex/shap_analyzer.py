@@ -2,44 +2,192 @@ import matplotlib.pyplot as plt
 import shap
 import os
 import time
+import collections
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import pandas as pd
 
+# Rows explained per chunk by the global analysis
+CHUNK_SIZE = 10_000
+
+class ShapSummary:
+    def __init__(self, n_features):
+        """
+        Running per-feature statistics of SHAP values, so global importance
+        never holds the full n_rows x n_features SHAP matrix. Rows may carry
+        weights, e.g. the inverse sampling rates of a stratified subsample.
+        """
+        self.n_rows = 0
+        self.weight = 0.0
+        self.sum_abs = np.zeros(n_features)
+        self.sum = np.zeros(n_features)
+        self.sum_sq = np.zeros(n_features)
+        self.max_abs = np.zeros(n_features)
+
+    def add(self, shap_values, weights=None):
+        """Accumulate a chunk of SHAP values"""
+        abs_values = np.abs(shap_values)
+        if weights is None:
+            self.weight += len(shap_values)
+            self.sum_abs += abs_values.sum(0)
+            self.sum += shap_values.sum(0)
+            self.sum_sq += np.square(shap_values).sum(0)
+        else:
+            self.weight += weights.sum()
+            self.sum_abs += weights @ abs_values
+            self.sum += weights @ shap_values
+            self.sum_sq += weights @ np.square(shap_values)
+        if len(shap_values) > 0:
+            self.max_abs = np.maximum(self.max_abs, abs_values.max(0))
+        self.n_rows += len(shap_values)
+        return self
+
+    def merge(self, other):
+        """Add the statistics of another summary, e.g. of another chunk"""
+        self.n_rows += other.n_rows
+        self.weight += other.weight
+        self.sum_abs += other.sum_abs
+        self.sum += other.sum
+        self.sum_sq += other.sum_sq
+        self.max_abs = np.maximum(self.max_abs, other.max_abs)
+        return self
+
+    def frame(self, feature_names):
+        """Per-feature mean |SHAP|, mean, std and max |SHAP|, by importance"""
+        mean = self.sum / self.weight
+        std = np.sqrt(np.maximum(self.sum_sq / self.weight - mean**2, 0))
+        return pd.DataFrame({
+            'feature': list(feature_names),
+            'importance': self.sum_abs / self.weight,
+            'mean': mean,
+            'std': std,
+            'max_abs': self.max_abs
+        }).sort_values('importance', ascending=False, ignore_index=True)
+
 class ShapAnalyzer:
-    def __init__(self, model, background_data):
+    def __init__(self, model, background_data, store=None):
+        """
+        SHAP explanations of @model. With an ExplanationStore as @store,
+        local explanations are looked up there and only computed once.
+        """
         self.model = model
         if hasattr(background_data, 'values'):
             background_data = background_data.values
         self.explainer = shap.TreeExplainer(model)
-
-    def analyze_global_importance(self, X, output_dir):
-        """Create global SHAP importance plot"""
+        self.store = store
+
+    @property
+    def expected_value(self):
+        """Expected model output, of the positive class for classifiers"""
+        expected_value = self.explainer.expected_value
+        if np.ndim(expected_value) > 0:
+            expected_value = np.asarray(expected_value)[-1]
+        return float(expected_value)
+
+    def explain_rows(self, X):
+        """Expected values and SHAP values of the rows of @X"""
+        def compute(labels):
+            shap_values = self.shap_matrix(X.loc[labels].values)
+            return np.full(len(labels), self.expected_value), shap_values
+
+        if self.store is None:
+            return compute(list(X.index))
+        return self.store.explain(self.store.SHAP, X.index, compute)
+
+    def shap_matrix(self, X_values):
+        """2-D SHAP values of @X_values, of the positive class for classifiers"""
+        shap_values = self.explainer.shap_values(X_values)
+        if isinstance(shap_values, list):
+            shap_values = shap_values[-1]
+        if shap_values.ndim == 3:
+            shap_values = shap_values[:, :, -1]
+        return shap_values
+
+    @staticmethod
+    def stratified_sample(strata, max_rows, min_per_stratum=100, seed=0):
+        """
+        Positions of at most about @max_rows rows, drawn per stratum in
+        proportion to its size but at least @min_per_stratum rows (or all of
+        it), with weights that undo the sampling rate of each stratum.
+        """
+        strata = np.asarray(strata)
+        rng = np.random.default_rng(seed)
+        labels, codes, counts = np.unique(strata, return_inverse=True, return_counts=True)
+        positions = []
+        weights = []
+        for code, count in enumerate(counts):
+            n = min(count, max(min_per_stratum, round(max_rows * count / len(strata))))
+            members = np.flatnonzero(codes == code)
+            positions.append(rng.choice(members, n, replace=False))
+            weights.append(np.full(n, count / n))
+        positions = np.concatenate(positions)
+        order = np.argsort(positions)
+        return positions[order], np.concatenate(weights)[order]
+
+    def global_summary(self, X, chunk_size=CHUNK_SIZE, n_jobs=None,
+                       max_rows=None, strata=None, seed=0):
+        """
+        Per-feature SHAP statistics over @X, explained in chunks across a
+        thread pool. At most n_jobs + 1 chunks of SHAP values are alive at a
+        time; each is reduced to a ShapSummary as soon as it is computed.
+
+        With @max_rows, a subsample of that size is explained instead,
+        stratified by @strata (e.g. the target) when given, and weighted so
+        the statistics still describe all of @X.
+        """
+        X_values = X.values if hasattr(X, 'values') else X
+        n_jobs = n_jobs or os.cpu_count()
+
+        positions, weights = None, None
+        if max_rows is not None and max_rows < len(X_values):
+            if strata is None:
+                strata = np.zeros(len(X_values))
+            positions, weights = self.stratified_sample(strata, max_rows, seed=seed)
+        n_rows = len(X_values) if positions is None else len(positions)
+
+        def explain(start):
+            stop = min(start + chunk_size, n_rows)
+            if positions is None:
+                rows, w = X_values[start:stop], None
+            else:
+                rows, w = X_values[positions[start:stop]], weights[start:stop]
+            return ShapSummary(X_values.shape[1]).add(self.shap_matrix(rows), w)
+
+        # Chunks are merged in order, so the sums do not depend on n_jobs
+        summary = ShapSummary(X_values.shape[1])
+        pending = collections.deque()
+        with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+            for start in range(0, n_rows, chunk_size):
+                pending.append(pool.submit(explain, start))
+                if len(pending) > n_jobs:
+                    summary.merge(pending.popleft().result())
+            while pending:
+                summary.merge(pending.popleft().result())
+        return summary.frame(X.columns)
+
+    def analyze_global_importance(self, X, output_dir, chunk_size=CHUNK_SIZE,
+                                  n_jobs=None, max_rows=None, strata=None,
+                                  max_display=20):
+        """Create global SHAP importance plot and summary table"""
         if not os.path.exists(output_dir):
             os.makedirs(output_dir)
 
         print("\nCalculating global SHAP values...")
         start_time = time.perf_counter()
 
-        if hasattr(X, 'values'):
-            X_values = X.values
-        else:
-            X_values = X
-        shap_values = self.explainer.shap_values(X_values)
-
-        mean_abs_shap = np.abs(shap_values).mean(0)
-        feature_importance = pd.DataFrame({
-            'feature': X.columns,
-            'importance': mean_abs_shap
-        })
-        feature_importance = feature_importance.sort_values('importance', ascending=False)
+        feature_importance = self.global_summary(
+            X, chunk_size=chunk_size, n_jobs=n_jobs, max_rows=max_rows, strata=strata)
+        feature_importance.to_csv(
+            os.path.join(output_dir, "global_shap_summary.txt"),
+            index=False,
+            sep='\t',
+            float_format='%.6f'
+        )
 
+        top = feature_importance.head(max_display).iloc[::-1]
         plt.figure(figsize=(10, 6))
-        shap.summary_plot(
-            shap_values,
-            X,
-            plot_type="bar",
-            show=False
-        )
+        plt.barh(top['feature'], top['importance'])
+        plt.xlabel("mean(|SHAP value|)")
         plt.title("Global SHAP Feature Importance")
         plt.tight_layout()
         plt.savefig(os.path.join(output_dir, "global_shap_waterfall.pdf"),
@@ -48,6 +196,7 @@ class ShapAnalyzer:
 
         analysis_time = time.perf_counter() - start_time
         print(f"Global SHAP analysis took {analysis_time:.4f} seconds")
+        return feature_importance
 
     def analyze_specific_scenario(self, X, y, scenario_idx, output_dir, actual_value=None, predicted_value=None):
         """Analyze a specific scenario using SHAP"""
@@ -57,9 +206,8 @@ class ShapAnalyzer:
         # time shap completion
         start_analysis = time.perf_counter()
         instance = X.loc[[scenario_idx]]
-        if hasattr(instance, 'values'):
-            instance = instance.values
-        shap_values = self.explainer.shap_values(instance)
+        base_values, shap_values = self.explain_rows(instance)
+        instance = instance.values
         analysis_time = time.perf_counter() - start_analysis
 
         # time spent plotting
@@ -68,7 +216,7 @@ class ShapAnalyzer:
         shap.waterfall_plot(
             shap.Explanation(
                 values=shap_values[0],
-                base_values=self.explainer.expected_value,
+                base_values=base_values[0],
                 data=instance[0],
                 feature_names=X.columns
             ),
@@ -102,13 +250,15 @@ class ShapAnalyzer:
         plot_total = 0
 
         print(f"\nAnalyzing {len(red_light_cases)} red light cases")
+        if self.store is not None:
+            # Explain and store all cases in one pass, the loop then reads them back
+            self.explain_rows(red_light_cases)
 
         for idx in red_light_cases.index:
             start_analysis = time.perf_counter()
             instance = X.loc[[idx]]
-            if hasattr(instance, 'values'):
-                instance = instance.values
-            shap_values = self.explainer.shap_values(instance)
+            base_values, shap_values = self.explain_rows(instance)
+            instance = instance.values
             analysis_time = time.perf_counter() - start_analysis
             analysis_total += analysis_time
 
@@ -117,7 +267,7 @@ class ShapAnalyzer:
             shap.waterfall_plot(
                 shap.Explanation(
                     values=shap_values[0],
-                    base_values=self.explainer.expected_value,
+                    base_values=base_values[0],
                     data=instance[0],
                     feature_names=X.columns
                 ),
@@ -150,13 +300,15 @@ class ShapAnalyzer:
         plot_total = 0
 
         print(f"\nAnalyzing {len(side_move_cases)} side move cases")
+        if self.store is not None:
+            # Explain and store all cases in one pass, the loop then reads them back
+            self.explain_rows(side_move_cases)
 
         for idx in side_move_cases.index:
             start_analysis = time.perf_counter()
             instance = X.loc[[idx]]
-            if hasattr(instance, 'values'):
-                instance = instance.values
-            shap_values = self.explainer.shap_values(instance)
+            base_values, shap_values = self.explain_rows(instance)
+            instance = instance.values
             analysis_time = time.perf_counter() - start_analysis
             analysis_total += analysis_time
 
@@ -165,7 +317,7 @@ class ShapAnalyzer:
             shap.waterfall_plot(
                 shap.Explanation(
                     values=shap_values[0],
-                    base_values=self.explainer.expected_value,
+                    base_values=base_values[0],
                     data=instance[0],
                     feature_names=X.columns
                 ),
@@ -194,9 +346,8 @@ class ShapAnalyzer:
 
         start_analysis = time.perf_counter()
         instance = X.loc[[scenario_idx]]
-        if hasattr(instance, 'values'):
-            instance = instance.values
-        shap_values = self.explainer.shap_values(instance)
+        base_values, shap_values = self.explain_rows(instance)
+        instance = instance.values
         analysis_time = time.perf_counter() - start_analysis
 
         start_plot = time.perf_counter()
@@ -204,7 +355,7 @@ class ShapAnalyzer:
         shap.waterfall_plot(
             shap.Explanation(
                 values=shap_values[0],
-                base_values=self.explainer.expected_value,
+                base_values=base_values[0],
                 data=instance[0],
                 feature_names=X.columns
             ),
@@ -235,9 +386,8 @@ class ShapAnalyzer:
 
         start_analysis = time.perf_counter()
         instance = X.loc[[scenario_idx]]
-        if hasattr(instance, 'values'):
-            instance = instance.values
-        shap_values = self.explainer.shap_values(instance)
+        base_values, shap_values = self.explain_rows(instance)
+        instance = instance.values
         analysis_time = time.perf_counter() - start_analysis
 
         start_plot = time.perf_counter()
@@ -245,7 +395,7 @@ class ShapAnalyzer:
         shap.waterfall_plot(
             shap.Explanation(
                 values=shap_values[0],
-                base_values=self.explainer.expected_value,
+                base_values=base_values[0],
                 data=instance[0],
                 feature_names=X.columns
             ),
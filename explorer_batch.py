@@ -0,0 +1,297 @@
+"""
+Batched ask/tell driving of scenarioxp explorers.
+
+The explorers run their scenario inside step(), one test at a time.
+BatchExplorer runs a copy of the explorer ahead of the real one with
+guessed outcomes, collecting the tests it would ask for, and hands them out
+as a batch. Scores told back are cached, and the real explorer only steps
+once every test of its next step is cached. Its history is then exactly
+what step() alone would have produced; wrong guesses only cost the
+speculative tests the real explorer never asks for.
+"""
+import copy
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+import scenarioxp as sxp
+from rtree import index
+from sim_bug_tools.exploration.brrt_std import brrt as sbt_brrt
+
+HISTORY_ATTRIBUTES = ["_arr_history", "_params_history", "_score_history",
+    "_tsc_history"]
+
+# What a step of each explorer changes before its scenario runs, as
+# (attribute, copied) pairs: copied values are changed in place, the others
+# only reassigned. A step stopped by a missing result is undone by putting
+# them back. Everything else only changes once the result is known.
+STEP_STATE = {
+    sxp.SequenceExplorer : [("_seq", True), ("_stage", False)],
+    sxp.FindSurfaceExplorer : [("_prev", False), ("_cur", False),
+        ("_s", True), ("_interm", True), ("_stage", False)],
+    sxp.BoundaryRRTExplorer : [("_arr", False)]
+}
+# ... and of the boundary RRT of a BoundaryRRTExplorer
+BRRT_STEP_STATE = [("_adherer", True), ("_tmp_parent", False), ("_r", False),
+    ("_parent", False), ("_p", False)]
+
+class _Pending(Exception):
+    """
+    The explorer asked for a test that has no result yet.
+    """
+
+class _Result:
+    def __init__(self, score):
+        """
+        Stands in for a finished Scenario, holding only its score.
+        """
+        self.score = score
+        return
+
+# Score of a speculative test, classified by the guess
+_GUESS = object()
+
+def params_key(params : pd.Series) -> tuple:
+    return tuple(params.values.tolist())
+
+def _copy_rtree(brrt : sbt_brrt.BoundaryRRT) -> index.Index:
+    """
+    A new spatial index over the nodes of @brrt. The rtree index wraps a C
+    object that deepcopy cannot copy.
+    """
+    p = index.Property()
+    p.set_dimension(brrt._ndims)
+    idx = index.Index(properties=p)
+    for node in sorted(brrt._tree.all_nodes(), key=lambda n : n.identifier):
+        idx.insert(node.identifier, node.data[sbt_brrt.DATA_LOCATION])
+        continue
+    return idx
+
+def step_state(explorer : sxp.Explorer) -> list[tuple]:
+    """
+    What the next step of @explorer changes before it runs its scenario, as
+    (object, attribute, value) triples, or None for an explorer type
+    missing from STEP_STATE.
+    """
+    if not type(explorer) in STEP_STATE:
+        return None
+    targets = [(explorer, STEP_STATE[type(explorer)])]
+    if isinstance(explorer, sxp.BoundaryRRTExplorer):
+        targets.append((explorer.brrt, BRRT_STEP_STATE))
+    # The adherer calls back into the explorer, which must not be copied
+    memo = {id(explorer) : explorer,
+        id(explorer.scenario_manager) : explorer.scenario_manager}
+    state = []
+    for obj, attributes in targets:
+        for attr, copied in attributes:
+            value = getattr(obj, attr, None)
+            state.append((obj, attr,
+                copy.deepcopy(value, memo) if copied else value))
+            continue
+        continue
+    return state
+
+def default_guess(explorer : sxp.Explorer) -> bool:
+    """
+    The most likely outcome of the next test, per explorer type.
+    Sampling keeps missing the target, surface search keeps hitting it and
+    boundary following repeats the last outcome.
+    """
+    if isinstance(explorer, sxp.SequenceExplorer):
+        return False
+    if isinstance(explorer, sxp.FindSurfaceExplorer):
+        return True
+    if len(explorer._tsc_history) > 0:
+        return bool(explorer._tsc_history[-1])
+    return True
+
+class BatchExplorer:
+    def __init__(self,
+            explorer : sxp.Explorer,
+            max_steps : int = None,
+            max_speculation : int = 1000,
+            guess : Callable[[sxp.Explorer], bool] = default_guess,
+            stop : Callable[[sxp.Explorer], bool] = None
+        ):
+        """
+        Ask/tell adapter around a scenarioxp explorer.
+
+        :: Parameters ::
+            explorer : sxp.Explorer
+                The explorer to drive. Its scenario is only used through
+                results told back, never run.
+            max_steps : int
+                Stop after this many real steps. None for the explorer's own
+                completion.
+            max_speculation : int
+                Limit on speculative steps per ask().
+            guess : Callable[[sxp.Explorer], bool]
+                Guessed target classification of untested candidates.
+            stop : Callable[[sxp.Explorer], bool]
+                Optional early stop, checked before every real step.
+        """
+        self._explorer = explorer
+        self._max_steps = max_steps
+        self._max_speculation = max_speculation
+        self._guess = guess
+        self._stop = stop
+        self._tsc = explorer.target_score_classifier
+        self._cache = {}
+        self._n_steps = 0
+        self._n_told = 0
+        # Copy of the explorer that tries each step first, in step with it
+        self._probe = None
+
+        # The real explorer only sees cached results
+        explorer._scenario = self._cached
+        return
+
+    @property
+    def explorer(self) -> sxp.Explorer:
+        return self._explorer
+
+    @property
+    def n_steps(self) -> int:
+        """
+        Real steps taken by the explorer.
+        """
+        return self._n_steps
+
+    @property
+    def n_told(self) -> int:
+        """
+        Tests evaluated, including speculative ones the explorer never used.
+        """
+        return self._n_told
+
+    @property
+    def complete(self) -> bool:
+        if self._max_steps is not None and self.n_steps >= self._max_steps:
+            return True
+        if self._stop is not None and self._stop(self.explorer):
+            return True
+        return self.explorer.stage == self.explorer.STAGE_EXPLORATION_COMPLETE
+
+    def _cached(self, params : pd.Series) -> _Result:
+        key = params_key(params)
+        if not key in self._cache:
+            raise _Pending()
+        return _Result(self._cache[key])
+
+    def _shadow(self) -> sxp.Explorer:
+        """
+        A copy of the explorer sharing its manager and scenario, without
+        its history.
+        """
+        memo = {id(self.explorer.scenario_manager) :
+            self.explorer.scenario_manager}
+        for attr in HISTORY_ATTRIBUTES:
+            memo[id(getattr(self.explorer, attr))] = []
+            continue
+        if isinstance(self.explorer, sxp.BoundaryRRTExplorer):
+            brrt = self.explorer.brrt
+            memo[id(brrt._index)] = _copy_rtree(brrt)
+        return copy.deepcopy(self.explorer, memo)
+
+    def ask(self, n : int) -> list[pd.Series]:
+        """
+        Up to @n untested parameter rows, in the order the explorer would
+        ask for them if every guess held. The first one is always the test
+        the explorer needs next. Steps that need no new test, like samples
+        out of bounds, are taken on the way, so an empty list means the
+        explorer is complete.
+        """
+        while not self.complete:
+            candidates = self._speculate(n)
+            if len(candidates) > 0:
+                return candidates
+            n_steps = self.n_steps
+            self.tell([])
+            if self.n_steps == n_steps:
+                break
+            continue
+        return []
+
+    def _speculate(self, n : int) -> list[pd.Series]:
+        guess = self._guess(self.explorer)
+        candidates = {}
+        def speculate(params : pd.Series) -> _Result:
+            key = params_key(params)
+            if key in self._cache:
+                return _Result(self._cache[key])
+            candidates.setdefault(key, params)
+            return _Result(_GUESS)
+
+        shadow = self._shadow()
+        shadow._scenario = speculate
+        shadow._target_score_classifier = lambda score : \
+            guess if score is _GUESS else self._tsc(score)
+
+        # The boundary RRT samples from the global numpy RNG, which the
+        # speculative steps must leave as they found it
+        rng_state = np.random.get_state()
+        n_steps = self.n_steps
+        for i in range(self._max_speculation):
+            if shadow.stage == shadow.STAGE_EXPLORATION_COMPLETE:
+                break
+            if self._max_steps is not None and n_steps >= self._max_steps:
+                break
+            shadow.step()
+            n_steps += 1
+            if len(candidates) >= n:
+                break
+            continue
+        np.random.set_state(rng_state)
+        return list(candidates.values())[:n]
+
+    def tell(self, results : list[tuple[pd.Series, pd.Series]]):
+        """
+        Stores (params, score) @results and steps the explorer as far as
+        the known results allow.
+        """
+        for params, score in results:
+            self._cache[params_key(params)] = score
+            continue
+        self._n_told += len(results)
+
+        while not self.complete:
+            # Step a copy first, so the real explorer is never left halfway
+            # through a step that is missing a result.
+            if self._probe is None:
+                self._probe = self._shadow()
+                self._probe._scenario = self._cached
+            state = step_state(self._probe)
+            rng_state = np.random.get_state()
+            try:
+                self._probe.step()
+            except _Pending:
+                if state is None:
+                    self._probe = None
+                else:
+                    for obj, attr, value in state:
+                        setattr(obj, attr, value)
+                        continue
+                break
+            finally:
+                np.random.set_state(rng_state)
+            for attr in HISTORY_ATTRIBUTES:
+                getattr(self._probe, attr).clear()
+                continue
+            self.explorer.step()
+            self._n_steps += 1
+            continue
+        return
+
+    def run(self, evaluate : Callable[[list[pd.Series]], list[pd.Series]],
+            batch_size : int):
+        """
+        Asks, evaluates and tells in batches of @batch_size until the
+        explorer completes.
+        """
+        while not self.complete:
+            params = self.ask(batch_size)
+            if len(params) == 0:
+                break
+            self.tell(list(zip(params, evaluate(params))))
+            continue
+        return
@@ -0,0 +1,297 @@
+"""
+Adaptive Monte Carlo estimation of target rates with confidence-interval
+stopping.
+
+Test i draws its parameters from its own generator, seeded by
+SeedSequence(constants.seed, spawn_key=(i,)), so the sample set does not
+depend on how many workers run it or in which order they finish. Tests
+are evaluated in batches through any evaluate(params_list) -> scores
+function (dino.Runner.evaluate, local or on campaign workers). The
+estimates are updated in test order, and the run stops at the first test
+where every target is resolved: its Wilson interval is narrow enough both
+in absolute terms and relative to its rate, over a minimum number of hits.
+Tests of the last batch past that point are dropped, so the result does
+not depend on the batch size either. Targets still unresolved at
+max_tests are reported rather than passed off as converged.
+"""
+import json
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+import scenarioxp as sxp
+from scipy import stats
+
+import constants
+import target_classifiers
+
+# Targets estimated by default
+TARGETS = target_classifiers.TARGETS
+
+def wilson_interval(k : int, n : int, confidence : float) -> tuple:
+    """
+    Wilson score interval of a binomial rate with @k hits in @n tests.
+
+    :: Return ::
+        (low, high)
+    """
+    if n == 0:
+        return 0.0, 1.0
+    z = stats.norm.ppf(1 - (1 - confidence) / 2)
+    p = k / n
+    denom = 1 + z**2 / n
+    center = (p + z**2 / (2 * n)) / denom
+    half = z * np.sqrt(p * (1 - p) / n + z**2 / (4 * n**2)) / denom
+    return max(0.0, center - half), min(1.0, center + half)
+
+class Estimate:
+    def __init__(self, name : str, confidence : float):
+        """
+        Running rate estimate of one target.
+        """
+        self._name = name
+        self._confidence = confidence
+        self._k = 0
+        self._n = 0
+        return
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @property
+    def k(self) -> int:
+        return self._k
+
+    @property
+    def n(self) -> int:
+        return self._n
+
+    @property
+    def rate(self) -> float:
+        return self._k / self._n if self._n > 0 else float("nan")
+
+    @property
+    def interval(self) -> tuple:
+        return wilson_interval(self._k, self._n, self._confidence)
+
+    @property
+    def half_width(self) -> float:
+        low, high = self.interval
+        return (high - low) / 2
+
+    def resolved(self,
+            half_width : float,
+            relative_half_width : float,
+            min_hits : int
+        ) -> bool:
+        """
+        Whether the rate is known to within @half_width, and to within
+        @relative_half_width of itself over at least @min_hits hits.
+        """
+        return self.k >= min_hits \
+            and self.half_width <= half_width \
+            and self.half_width <= relative_half_width * self.rate
+
+    def add(self, hit : bool):
+        self._k += int(hit)
+        self._n += 1
+        return
+
+    def to_dict(self) -> dict:
+        low, high = self.interval
+        return {
+            "hits" : self.k,
+            "tests" : self.n,
+            "rate" : self.rate,
+            "low" : low,
+            "high" : high,
+            "confidence" : self._confidence
+        }
+
+class AdaptiveMonteCarlo:
+    def __init__(self,
+            manager : sxp.ScenarioManager,
+            evaluate : Callable[[list[pd.Series]], list[pd.Series]],
+            targets : dict[str, Callable[[pd.Series], bool]] = TARGETS,
+            seed : int = constants.seed,
+            confidence : float = constants.monte_carlo.confidence,
+            half_width : float = constants.monte_carlo.half_width,
+            relative_half_width : float = \
+                constants.monte_carlo.relative_half_width,
+            min_hits : int = constants.monte_carlo.min_hits,
+            min_tests : int = constants.monte_carlo.min_tests,
+            max_tests : int = constants.n_tests,
+            batch_size : int = constants.batch_size
+        ):
+        """
+        Monte Carlo run that stops once every target rate is known to
+        within @half_width and within @relative_half_width of itself, over
+        at least @min_hits hits, at @confidence.
+
+        :: Parameters ::
+            manager : sxp.ScenarioManager
+                Projects the uniform samples to test parameters.
+            evaluate : Callable[[list[pd.Series]], list[pd.Series]]
+                Runs a batch of tests, returning their scores in order.
+            targets : dict[str, Callable[[pd.Series], bool]]
+                Score classifiers of the estimated rates.
+            seed : int
+                Root of every test's seed stream.
+            confidence : float
+                Confidence level of the intervals.
+            half_width : float
+                Stop when every interval's half width is at most this.
+            relative_half_width : float
+                ... and at most this share of the target's rate.
+            min_hits : int
+                ... and every target has at least this many hits.
+            min_tests : int
+                Never stop before this many tests.
+            max_tests : int
+                Never run more than this many tests.
+            batch_size : int
+                Tests evaluated per call of @evaluate.
+        """
+        self._manager = manager
+        self._evaluate = evaluate
+        self._targets = targets
+        self._seed = seed
+        self._half_width = half_width
+        self._relative_half_width = relative_half_width
+        self._min_hits = min_hits
+        self._min_tests = min_tests
+        self._max_tests = max_tests
+        self._batch_size = batch_size
+        self._estimates = {name : Estimate(name, confidence) \
+            for name in targets}
+        self._params = []
+        self._scores = []
+        self._n_evaluated = 0
+        return
+
+    @property
+    def estimates(self) -> dict[str, Estimate]:
+        return self._estimates
+
+    @property
+    def n_tests(self) -> int:
+        return len(self._scores)
+
+    @property
+    def n_evaluated(self) -> int:
+        """
+        Tests run, including those past the stopping point.
+        """
+        return self._n_evaluated
+
+    @property
+    def params_history(self) -> pd.DataFrame:
+        return pd.DataFrame(self._params).reset_index(drop=True)
+
+    @property
+    def score_history(self) -> pd.DataFrame:
+        return pd.DataFrame(self._scores).reset_index(drop=True)
+
+    @property
+    def unresolved(self) -> list[str]:
+        """
+        Targets whose rate is not known precisely enough yet.
+        """
+        return [name for name, e in self.estimates.items() \
+            if not e.resolved(self._half_width, self._relative_half_width,
+                self._min_hits)]
+
+    @property
+    def converged(self) -> bool:
+        return self.n_tests >= self._min_tests and not self.unresolved
+
+    def sample(self, i : int) -> pd.Series:
+        """
+        Parameters of test @i, from its own seed stream.
+        """
+        seq = np.random.SeedSequence(self._seed, spawn_key=(i,))
+        arr = np.random.default_rng(seq).random(len(self._manager.params))
+        return self._manager.project(arr)
+
+    def run(self, progress : bool = True) -> dict[str, Estimate]:
+        """
+        Runs batches until convergence or max_tests.
+        """
+        while not self.converged and self.n_tests < self._max_tests:
+            start = self.n_tests
+            n = min(self._batch_size, self._max_tests - start)
+            params_list = [self.sample(i) for i in range(start, start + n)]
+            scores = self._evaluate(params_list)
+            self._n_evaluated += n
+
+            # Add in test order, up to the first test that converges
+            for params, score in zip(params_list, scores):
+                for name, estimate in self.estimates.items():
+                    estimate.add(self._targets[name](score))
+                    continue
+                self._params.append(params)
+                self._scores.append(score)
+                if self.converged:
+                    break
+                continue
+
+            if progress:
+                print("                                                    "
+                    "                            ", end="\r")
+                print("Test %d: %s" % (self.n_tests, ", ".join(
+                    "%s %.4f ±%.4f" % (e.name, e.rate, e.half_width) \
+                        for e in self.estimates.values())), end="\r")
+            continue
+        if progress:
+            print()
+        if self.unresolved:
+            print("Unresolved after %d tests: %s" % (
+                self.n_tests, ", ".join("%s (%d hits)" % (
+                    name, self.estimates[name].k) for name in self.unresolved)))
+        return self.estimates
+
+    def gauges(self) -> dict[str, float]:
+        """
+        Estimates as telemetry gauges.
+        """
+        gauges = {"mc_tests" : self.n_tests,
+            "mc_unresolved" : len(self.unresolved)}
+        for e in self.estimates.values():
+            key = e.name.replace(" ", "_")
+            low, high = e.interval
+            gauges["mc_%s_rate" % key] = e.rate if e.n > 0 else 0
+            gauges["mc_%s_low" % key] = low
+            gauges["mc_%s_high" % key] = high
+            continue
+        return gauges
+
+    def save(self, prefix : str, schema = None):
+        """
+        Writes <prefix>_params.feather, <prefix>_scores.feather and the
+        estimates to <prefix>_estimates.json.
+
+        :: Parameters ::
+            schema : param_schema.ParamSchema
+                Compact params storage, when given.
+        """
+        if schema is None:
+            self.params_history.to_feather("%s_params.feather" % prefix)
+        else:
+            schema.write_feather(self.params_history,
+                "%s_params.feather" % prefix)
+        self.score_history.to_feather("%s_scores.feather" % prefix)
+        with open("%s_estimates.json" % prefix, "w") as f:
+            json.dump({
+                "n_tests" : self.n_tests,
+                "n_evaluated" : self.n_evaluated,
+                "seed" : self._seed,
+                "half_width" : self._half_width,
+                "relative_half_width" : self._relative_half_width,
+                "min_hits" : self._min_hits,
+                "converged" : self.converged,
+                "unresolved" : self.unresolved,
+                "estimates" : {name : e.to_dict() \
+                    for name, e in self.estimates.items()}
+            }, f, indent=2)
+        return
@@ -0,0 +1,340 @@
+"""
+Nearest-neighbour index over tested parameter vectors.
+
+Points live in the normalized parameter space of the spec, where every
+feature spans [0, 1], which is also the space the explorers sample in.
+Targets and non-targets are indexed separately, so "closest tested point"
+and "closest point with the opposite outcome" are each one tree query.
+
+Each partition is a cKDTree over most of its points plus a small buffer of
+recent additions that is scanned directly; the tree is rebuilt once the
+buffer outgrows a fraction of it, which keeps add() cheap while queries
+stay sub-millisecond at campaign sizes.
+"""
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+from scipy.spatial.distance import cdist
+
+# Rebuild a tree when its buffer holds more than this many points, or
+# this fraction of the tree, whichever is larger.
+REBUILD_MIN = 256
+REBUILD_FRACTION = 0.25
+
+class _Partition:
+    def __init__(self, n_dims : int):
+        """
+        Points of one outcome, with their row ids.
+        """
+        self._points = np.empty((0, n_dims))
+        self._ids = np.empty(0, dtype=np.int64)
+        self._tree = None
+        self._n_tree = 0
+        return
+
+    @property
+    def points(self) -> np.ndarray:
+        return self._points
+
+    @property
+    def ids(self) -> np.ndarray:
+        return self._ids
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def add(self, points : np.ndarray, ids : np.ndarray):
+        self._points = np.concatenate([self._points, points])
+        self._ids = np.concatenate([self._ids, ids])
+        n_buffer = len(self) - self._n_tree
+        if n_buffer > max(REBUILD_MIN, REBUILD_FRACTION * self._n_tree):
+            self.rebuild()
+        return
+
+    def rebuild(self):
+        self._tree = cKDTree(self._points) if len(self) > 0 else None
+        self._n_tree = len(self)
+        return
+
+    def knn(self, q : np.ndarray, k : int) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Distances and positions of the @k nearest points to each row of @q,
+        padded with inf and -1.
+        """
+        m = len(q)
+        dist = np.full((m, 0), np.inf)
+        pos = np.full((m, 0), -1, dtype=np.int64)
+        if self._n_tree > 0:
+            d, i = self._tree.query(q, k=k)
+            d = d.reshape(m, k)
+            i = i.reshape(m, k)
+            i[i >= self._n_tree] = -1
+            dist = np.concatenate([dist, d], axis=1)
+            pos = np.concatenate([pos, i], axis=1)
+        if len(self) > self._n_tree:
+            d = cdist(q, self._points[self._n_tree:])
+            i = np.broadcast_to(np.arange(self._n_tree, len(self)), d.shape)
+            dist = np.concatenate([dist, d], axis=1)
+            pos = np.concatenate([pos, i], axis=1)
+
+        order = np.argsort(dist, axis=1, kind="stable")[:, :k]
+        dist = np.take_along_axis(dist, order, axis=1)
+        pos = np.take_along_axis(pos, order, axis=1)
+        if dist.shape[1] < k:
+            pad = k - dist.shape[1]
+            dist = np.pad(dist, ((0, 0), (0, pad)), constant_values=np.inf)
+            pos = np.pad(pos, ((0, 0), (0, pad)), constant_values=-1)
+        return dist, pos
+
+    def radius(self, q : np.ndarray, r : float) -> np.ndarray:
+        """
+        Positions of the points within @r of the single point @q.
+        """
+        pos = []
+        if self._n_tree > 0:
+            pos += self._tree.query_ball_point(q, r)
+        if len(self) > self._n_tree:
+            d = cdist(q[None, :], self._points[self._n_tree:])[0]
+            pos += (np.flatnonzero(d <= r) + self._n_tree).tolist()
+        return np.array(sorted(pos), dtype=np.int64)
+
+class ParamIndex:
+    def __init__(self, spec : pd.DataFrame):
+        """
+        Index over tested parameter vectors.
+
+        :: Parameters ::
+            spec : pd.DataFrame
+                Parameter spec with feat, min and max columns, as from
+                param_spec.load_spec().
+        """
+        self._feats = spec["feat"].tolist()
+        self._lo = spec["min"].to_numpy(dtype=float)
+        self._span = (spec["max"] - spec["min"]).to_numpy(dtype=float)
+        self._span[self._span == 0] = 1
+        self._partitions = {
+            True : _Partition(len(self._feats)),
+            False : _Partition(len(self._feats))
+        }
+        self._next_id = 0
+        return
+
+    @property
+    def feats(self) -> list[str]:
+        return self._feats
+
+    def __len__(self) -> int:
+        return sum(len(p) for p in self._partitions.values())
+
+    def normalize(self, params) -> np.ndarray:
+        """
+        @params as rows of the normalized parameter space.
+
+        :: Parameters ::
+            params : pd.Series | pd.DataFrame | np.ndarray
+                One test or a table of tests. Arrays are taken to be
+                normalized already, like the explorers' _arr_history.
+        """
+        if isinstance(params, pd.Series):
+            params = params[self.feats].to_frame().T
+        if isinstance(params, pd.DataFrame):
+            arr = (params[self.feats].to_numpy(dtype=float) - self._lo) \
+                / self._span
+        else:
+            arr = np.asarray(params, dtype=float)
+        return np.atleast_2d(arr)
+
+    def add(self, params, is_target, ids = None) -> np.ndarray:
+        """
+        Adds tested points.
+
+        :: Parameters ::
+            params : pd.Series | pd.DataFrame | np.ndarray
+                The tests, see normalize().
+            is_target : bool | array of bool
+                Target classification of each test.
+            ids : array of int
+                Row ids of the tests, e.g. the params_df index. Defaults to
+                consecutive ids after the largest one so far.
+
+        :: Return ::
+            The row ids of the added tests.
+        """
+        arr = self.normalize(params)
+        is_target = np.broadcast_to(np.asarray(is_target, dtype=bool),
+            len(arr))
+        if ids is None:
+            ids = np.arange(self._next_id, self._next_id + len(arr))
+        ids = np.asarray(ids, dtype=np.int64)
+        for target, partition in self._partitions.items():
+            mask = is_target == target
+            if mask.any():
+                partition.add(arr[mask], ids[mask])
+            continue
+        if len(ids) > 0:
+            self._next_id = max(self._next_id, int(ids.max()) + 1)
+        return ids
+
+    def _knn(self, arr : np.ndarray, k : int, targets : list[bool]) \
+            -> pd.DataFrame:
+        dist = []
+        ids = []
+        is_target = []
+        for target in targets:
+            partition = self._partitions[target]
+            if len(partition) == 0:
+                continue
+            d, pos = partition.knn(arr, k)
+            dist.append(d)
+            ids.append(np.where(pos >= 0, partition.ids[pos], -1))
+            is_target.append(np.full(d.shape, target))
+            continue
+        if len(dist) == 0:
+            return pd.DataFrame({"query" : [], "id" : [], "distance" : [],
+                "is_target" : []})
+        dist = np.concatenate(dist, axis=1)
+        ids = np.concatenate(ids, axis=1)
+        is_target = np.concatenate(is_target, axis=1)
+
+        order = np.argsort(dist, axis=1, kind="stable")[:, :k]
+        df = pd.DataFrame({
+            "query" : np.repeat(np.arange(len(arr)), order.shape[1]),
+            "id" : np.take_along_axis(ids, order, axis=1).ravel(),
+            "distance" : np.take_along_axis(dist, order, axis=1).ravel(),
+            "is_target" : np.take_along_axis(is_target, order, axis=1).ravel()
+        })
+        return df[df["id"] >= 0].reset_index(drop=True)
+
+    def knn(self, params, k : int = 1, is_target : bool = None) \
+            -> pd.DataFrame:
+        """
+        The @k tested points nearest to each query.
+
+        :: Parameters ::
+            params : pd.Series | pd.DataFrame | np.ndarray
+                Query points, see normalize().
+            k : int
+                Neighbours per query.
+            is_target : bool
+                Only consider tests with this classification. None for all.
+
+        :: Return ::
+            One row per neighbour with the query's position, the
+            neighbour's id, its distance and its classification, nearest
+            first within each query.
+        """
+        targets = [True, False] if is_target is None else [bool(is_target)]
+        return self._knn(self.normalize(params), k, targets)
+
+    def nearest(self, params) -> tuple:
+        """
+        The closest tested point to the single test @params.
+
+        :: Return ::
+            (id, distance, is_target), or None if the index is empty.
+        """
+        q = self.normalize(params)
+        best = None
+        for target, partition in self._partitions.items():
+            if len(partition) == 0:
+                continue
+            d, pos = partition.knn(q, 1)
+            if best is None or d[0, 0] < best[1]:
+                best = (int(partition.ids[pos[0, 0]]), float(d[0, 0]), target)
+            continue
+        return best
+
+    def radius(self, params, r : float, is_target : bool = None) \
+            -> pd.DataFrame:
+        """
+        Tested points within distance @r of the single test @params.
+
+        :: Return ::
+            id, distance and is_target of each point, nearest first.
+        """
+        q = self.normalize(params)[0]
+        targets = [True, False] if is_target is None else [bool(is_target)]
+        dfs = []
+        for target in targets:
+            partition = self._partitions[target]
+            pos = partition.radius(q, r)
+            dfs.append(pd.DataFrame({
+                "id" : partition.ids[pos],
+                "distance" : np.linalg.norm(partition.points[pos] - q, axis=1),
+                "is_target" : target
+            }))
+            continue
+        return pd.concat(dfs).sort_values("distance", kind="stable")\
+            .reset_index(drop=True)
+
+    def boundary_pairs(self, max_distance : float = np.inf) -> pd.DataFrame:
+        """
+        Pairs of tests on opposite sides of the target boundary: every
+        target test with its nearest non-target test.
+
+        :: Parameters ::
+            max_distance : float
+                Drop pairs further apart than this.
+
+        :: Return ::
+            target_id, other_id and distance of each pair, closest first.
+        """
+        targets = self._partitions[True]
+        others = self._partitions[False]
+        if len(targets) == 0 or len(others) == 0:
+            return pd.DataFrame({"target_id" : [], "other_id" : [],
+                "distance" : []})
+        dist, pos = others.knn(targets.points, 1)
+        df = pd.DataFrame({
+            "target_id" : targets.ids,
+            "other_id" : others.ids[pos[:, 0]],
+            "distance" : dist[:, 0]
+        })
+        return df[df["distance"] <= max_distance]\
+            .sort_values("distance", kind="stable").reset_index(drop=True)
+
+    def save(self, fn : str):
+        """
+        Writes the points, ids, classifications and spec ranges to the npz
+        file @fn. Trees are rebuilt on load.
+        """
+        np.savez_compressed(fn,
+            feats = np.array(self.feats),
+            lo = self._lo,
+            span = self._span,
+            target_points = self._partitions[True].points,
+            target_ids = self._partitions[True].ids,
+            other_points = self._partitions[False].points,
+            other_ids = self._partitions[False].ids
+        )
+        return
+
+    @classmethod
+    def load(cls, fn : str) -> "ParamIndex":
+        data = np.load(fn)
+        spec = pd.DataFrame({
+            "feat" : data["feats"],
+            "min" : data["lo"],
+            "max" : data["lo"] + data["span"]
+        })
+        index = cls(spec)
+        index._span = data["span"]
+        index.add(data["target_points"], True, data["target_ids"])
+        index.add(data["other_points"], False, data["other_ids"])
+        for partition in index._partitions.values():
+            partition.rebuild()
+            continue
+        return index
+
+    @classmethod
+    def from_tests(cls, spec : pd.DataFrame, params_df : pd.DataFrame,
+            is_target) -> "ParamIndex":
+        """
+        Index over a campaign's params_df, with its index as row ids.
+        """
+        index = cls(spec)
+        index.add(params_df, is_target, params_df.index.to_numpy())
+        for partition in index._partitions.values():
+            partition.rebuild()
+            continue
+        return index
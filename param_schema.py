@@ -0,0 +1,293 @@
+"""
+Compact storage of test parameters, derived from the parameter spec.
+
+ScenarioManager.project() puts every feature on the grid min + k * inc.
+Features whose grid is integral (min and inc whole numbers, like the
+vtype_* slots and the speeds of cross-gama-params.xlsx) are stored as their
+value in the smallest int dtype that holds [min, max]. Other features on a
+grid are stored as the scaled integer k. Features without an increment stay
+float64, since a narrower float would not round-trip.
+
+ParamHistory keeps an explorer's _params_history in that form, and
+write_feather() / read_feather() use it on disk, with the schema in the
+file metadata so readers can decode the scaled columns.
+"""
+import collections.abc
+import json
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+import scenarioxp as sxp
+
+INT = "int"
+SCALED = "scaled"
+FLOAT = "float"
+
+# Key of the schema in the feather schema metadata
+METADATA_KEY = b"param_schema"
+
+def _int_dtype(lo : float, hi : float) -> np.dtype:
+    """
+    The smallest signed int dtype holding [@lo, @hi].
+    """
+    for dtype in [np.int8, np.int16, np.int32]:
+        info = np.iinfo(dtype)
+        if info.min <= lo and hi <= info.max:
+            return np.dtype(dtype)
+    return np.dtype(np.int64)
+
+def _is_whole(x : float) -> bool:
+    return bool(np.isfinite(x)) and float(x) == round(float(x))
+
+class ParamSchema:
+    def __init__(self, spec : pd.DataFrame):
+        """
+        Storage type of every feature of @spec.
+
+        :: Parameters ::
+            spec : pd.DataFrame
+                Parameter spec with feat, min, max and inc columns, as from
+                param_spec.load_spec().
+        """
+        self._feats = spec["feat"].tolist()
+        self._kinds = {}
+        self._dtypes = {}
+        self._lo = {}
+        self._inc = {}
+        for feat, lo, hi, inc in spec[["feat", "min", "max", "inc"]]\
+                .itertuples(index=False):
+            self._lo[feat] = float(lo)
+            self._inc[feat] = float(inc)
+            on_grid = np.isfinite(inc) and inc > 0 \
+                and _is_whole((hi - lo) / inc)
+            if on_grid and _is_whole(lo) and _is_whole(inc):
+                self._kinds[feat] = INT
+                self._dtypes[feat] = _int_dtype(lo, hi)
+            elif on_grid:
+                self._kinds[feat] = SCALED
+                self._dtypes[feat] = _int_dtype(0, (hi - lo) / inc)
+            else:
+                self._kinds[feat] = FLOAT
+                self._dtypes[feat] = np.dtype(np.float64)
+            continue
+        return
+
+    @property
+    def feats(self) -> list[str]:
+        return self._feats
+
+    @property
+    def kinds(self) -> dict[str, str]:
+        return self._kinds
+
+    @property
+    def dtypes(self) -> dict[str, np.dtype]:
+        return self._dtypes
+
+    def encode_column(self, feat : str, values : np.ndarray) -> np.ndarray:
+        values = np.asarray(values, dtype=np.float64)
+        kind = self._kinds[feat]
+        if kind == FLOAT:
+            return values
+        if kind == SCALED:
+            codes = np.round((values - self._lo[feat]) / self._inc[feat])
+        else:
+            codes = values
+        return codes.astype(self._dtypes[feat])
+
+    def decode_column(self, feat : str, codes : np.ndarray) -> np.ndarray:
+        codes = np.asarray(codes)
+        if self._kinds[feat] == SCALED:
+            # Same operations as sxp.project(), so values match bit for bit
+            return self._lo[feat] + codes.astype(np.float64) * self._inc[feat]
+        return codes.astype(np.float64)
+
+    def encode(self, df : pd.DataFrame, check : bool = True) -> pd.DataFrame:
+        """
+        @df with the spec's features in their storage types. Other columns,
+        like envelope_id and stage, are left as they are.
+
+        :: Parameters ::
+            check : bool
+                Raise ValueError unless decoding gives @df back exactly.
+        """
+        out = df.copy()
+        for feat in self.feats:
+            if feat in out.columns:
+                out[feat] = self.encode_column(feat, df[feat].to_numpy())
+            continue
+        if check:
+            self.check_lossless(df, out)
+        return out
+
+    def decode(self, df : pd.DataFrame) -> pd.DataFrame:
+        """
+        Inverse of encode(), with every feature as float64.
+        """
+        out = df.copy()
+        for feat in self.feats:
+            if feat in out.columns:
+                out[feat] = self.decode_column(feat, df[feat].to_numpy())
+            continue
+        return out
+
+    def check_lossless(self, df : pd.DataFrame, encoded : pd.DataFrame):
+        for feat in self.feats:
+            if not feat in df.columns:
+                continue
+            values = df[feat].to_numpy(dtype=np.float64)
+            decoded = self.decode_column(feat, encoded[feat].to_numpy())
+            if not np.array_equal(values, decoded, equal_nan=True):
+                raise ValueError("%s does not round-trip through %s %s" % (
+                    feat, self._kinds[feat], self._dtypes[feat]))
+            continue
+        return
+
+    def metadata(self) -> bytes:
+        return json.dumps({feat : [self._kinds[feat], self._lo[feat],
+            self._inc[feat]] for feat in self.feats}).encode()
+
+    def write_feather(self, df : pd.DataFrame, fn : str):
+        """
+        Writes @df to @fn in storage types, unless it is encoded already.
+        """
+        if any(df[feat].dtype != self._dtypes[feat] \
+                for feat in self.feats if feat in df.columns):
+            df = self.encode(df)
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        metadata = dict(table.schema.metadata or {})
+        metadata[METADATA_KEY] = self.metadata()
+        feather.write_feather(table.replace_schema_metadata(metadata), fn)
+        return
+
+def read_feather(fn : str, columns : list[str] = None) -> pd.DataFrame:
+    """
+    Reads a params feather, decoding scaled integer columns to their
+    values. Integral features keep their int dtype; files written before
+    the schema existed are read as they are.
+    """
+    table = feather.read_table(fn, columns=columns, memory_map=True)
+    df = table.to_pandas()
+    metadata = table.schema.metadata or {}
+    if not METADATA_KEY in metadata:
+        return df
+    for feat, (kind, lo, inc) in json.loads(metadata[METADATA_KEY]).items():
+        if kind == SCALED and feat in df.columns:
+            df[feat] = lo + df[feat].to_numpy().astype(np.float64) * inc
+        continue
+    return df
+
+class ParamHistory(collections.abc.Sequence):
+    def __init__(self, schema : ParamSchema, capacity : int = 1024):
+        """
+        Drop-in for an explorer's _params_history list, holding the rows in
+        their storage types instead of as one pd.Series each.
+        """
+        self._schema = schema
+        self._index = pd.Index(schema.feats, name="feat")
+        kinds = np.array([schema.kinds[feat] for feat in schema.feats])
+        self._scaled = kinds == SCALED
+        self._lo = np.array([schema._lo[feat] for feat in schema.feats])
+        self._inc = np.array([schema._inc[feat] for feat in schema.feats])
+
+        # One block of columns per storage dtype
+        self._groups = {}
+        for i, feat in enumerate(schema.feats):
+            self._groups.setdefault(schema.dtypes[feat], []).append(i)
+            continue
+        self._blocks = {dtype : np.empty((capacity, len(pos)), dtype=dtype) \
+            for dtype, pos in self._groups.items()}
+        self._n = 0
+        return
+
+    def __len__(self) -> int:
+        return self._n
+
+    def _values(self, params : pd.Series) -> np.ndarray:
+        if not params.index.equals(self._index):
+            params = params[self._schema.feats]
+        return params.to_numpy(dtype=np.float64)
+
+    def _decode(self, codes : np.ndarray) -> np.ndarray:
+        return np.where(self._scaled, self._lo + codes * self._inc, codes)
+
+    def append(self, params : pd.Series):
+        values = self._values(params)
+        codes = np.where(self._scaled,
+            np.round((values - self._lo) / self._inc), values)
+        row = np.empty(len(values))
+        for dtype, pos in self._groups.items():
+            row[pos] = codes[pos].astype(dtype)
+            continue
+        if not np.array_equal(self._decode(row), values, equal_nan=True):
+            bad = np.flatnonzero(self._decode(row) != values)[0]
+            raise ValueError("%s = %r does not round-trip through %s" % (
+                self._schema.feats[bad], values[bad],
+                self._schema.dtypes[self._schema.feats[bad]]))
+
+        if self._n == len(next(iter(self._blocks.values()))):
+            for dtype, block in self._blocks.items():
+                grown = np.empty((2 * len(block), block.shape[1]), dtype=dtype)
+                grown[:len(block)] = block
+                self._blocks[dtype] = grown
+                continue
+        for dtype, pos in self._groups.items():
+            self._blocks[dtype][self._n] = row[pos]
+            continue
+        self._n += 1
+        return
+
+    def _row(self, i : int) -> np.ndarray:
+        row = np.empty(len(self._index))
+        for dtype, pos in self._groups.items():
+            row[pos] = self._blocks[dtype][i]
+            continue
+        return self._decode(row)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(self._n))]
+        if i < 0:
+            i += self._n
+        if not 0 <= i < self._n:
+            raise IndexError(i)
+        return pd.Series(self._row(i), index=self._index)
+
+    def to_frame(self) -> pd.DataFrame:
+        """
+        The rows in storage types, without decoding.
+        """
+        columns = {}
+        for dtype, pos in self._groups.items():
+            for j, i in enumerate(pos):
+                columns[self._schema.feats[i]] = \
+                    self._blocks[dtype][:self._n, j].copy()
+                continue
+            continue
+        return pd.DataFrame({feat : columns[feat] for feat in self._schema.feats})
+
+    @property
+    def nbytes(self) -> int:
+        return sum(block[:self._n].nbytes for block in self._blocks.values())
+
+def compact(explorer : sxp.Explorer, schema : ParamSchema) -> sxp.Explorer:
+    """
+    Swaps the params history of a fresh @explorer for a ParamHistory.
+    """
+    history = ParamHistory(schema)
+    for params in explorer._params_history:
+        history.append(params)
+        continue
+    explorer._params_history = history
+    return explorer
+
+def params_frame(explorer : sxp.Explorer, schema : ParamSchema) \
+        -> pd.DataFrame:
+    """
+    The params history of @explorer in storage types.
+    """
+    if isinstance(explorer._params_history, ParamHistory):
+        return explorer._params_history.to_frame()
+    return schema.encode(explorer.params_history)
@@ -0,0 +1,54 @@
+import os
+import pickle
+
+import constants
+import utils
+
+SPEC_COLUMNS = ["feat", "min", "max", "inc"]
+
+def compile_spec(fn : str = constants.param_spec_file,
+        cache_fn : str = constants.param_spec_cache
+    ):
+    """
+    Parses the parameter spreadsheet @fn once and stores it in binary form
+    at @cache_fn, tagged with the content hash of the spreadsheet.
+
+    :: Return ::
+        The parameter spec as a DataFrame with columns feat, min, max, inc.
+    """
+    import pandas as pd
+    df = pd.read_excel(
+        fn,
+        engine = 'openpyxl',
+        usecols = SPEC_COLUMNS,
+    )
+
+    os.makedirs(os.path.dirname(cache_fn) or ".", exist_ok=True)
+    tmp_fn = "%s.tmp" % cache_fn
+    with open(tmp_fn, "wb") as f:
+        pickle.dump({
+            "digest" : utils.file_digest(fn),
+            "spec" : df
+        }, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_fn, cache_fn)
+    return df
+
+def load_spec(fn : str = constants.param_spec_file,
+        cache_fn : str = constants.param_spec_cache
+    ):
+    """
+    Loads the parameter spec of @fn from the compiled cache, recompiling it
+    when the spreadsheet content changed.
+
+    :: Return ::
+        The parameter spec as a DataFrame with columns feat, min, max, inc.
+    """
+    if os.path.exists(cache_fn):
+        with open(cache_fn, "rb") as f:
+            data = pickle.load(f)
+        if data["digest"] == utils.file_digest(fn):
+            return data["spec"]
+    return compile_spec(fn, cache_fn)
+
+if __name__ == "__main__":
+    print(compile_spec())
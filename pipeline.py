@@ -0,0 +1,418 @@
+"""
+Incremental build of the paper artefacts under out/.
+
+Each Task runs one command that reads its input files and writes its output
+files: the campaign feathers feed the EDA tables and graphs (through the
+DerivedStats cache), the full_data feathers feed the explainability models
+and their explanations, and those feed the feature ranking PDFs. A task
+depends on every task that writes one of its inputs.
+
+A task is rebuilt only when it was never built, its command changed, one
+of its outputs is missing or was changed by hand, or the content hash of
+one of its inputs differs from the last successful build. Hashes are kept
+in constants.pipeline.state_file and reused while a file's size and mtime
+are unchanged. Independent tasks run in parallel, each logging to
+out/cache/pipeline-logs/<task>.log.
+
+    python pipeline.py [TASK ...] [-j N] [--dry-run] [--force]
+"""
+import argparse
+import glob
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import constants
+import utils
+from eda import EDA, GRAPHS_DIR, TABLES_DIR
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+LOG_DIR = "out/cache/pipeline-logs"
+
+class Task:
+    def __init__(self,
+            name : str,
+            command : list[str],
+            inputs : list[str],
+            outputs : list[str]
+        ):
+        """
+        One node of the artefact graph.
+
+        :: Parameters ::
+            name : str
+                Task name, used on the command line.
+            command : list[str]
+                Command run from the repository root.
+            inputs : list[str]
+                Files (or glob patterns) the command reads, code included.
+            outputs : list[str]
+                Files the command writes.
+        """
+        self._name = name
+        self._command = command
+        self._inputs = inputs
+        self._outputs = outputs
+        return
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @property
+    def command(self) -> list[str]:
+        return self._command
+
+    @property
+    def inputs(self) -> list[str]:
+        return self._inputs
+
+    @property
+    def outputs(self) -> list[str]:
+        return self._outputs
+
+    def input_files(self) -> list[str]:
+        """
+        Inputs with glob patterns expanded.
+        """
+        files = []
+        for pattern in self.inputs:
+            if glob.has_magic(pattern):
+                files.extend(sorted(glob.glob(pattern)))
+            else:
+                files.append(pattern)
+            continue
+        return files
+
+def tasks() -> list[Task]:
+    """
+    The artefact graph of the paper.
+    """
+    python = sys.executable
+    eda_code = ["eda.py", "derived_stats.py", "target_classifiers.py",
+        "tl_program.py", "constants.py", "utils.py",
+        constants.traci.gamma_cross.net_file]
+    scores = [EDA.data_fn(target, direction, constants.SCORES)
+        for target in constants.targets
+        for direction in constants.directions]
+    explainability_code = [
+        "explainability/collision_model/*.py",
+        "explainability/model_registry/*.py",
+        "explainability/explanation_store/*.py",
+        "explainability/shap_ex/*.py",
+        "explainability/lime_ex/*.py",
+        "target_classifiers.py",
+        "constants.py"
+    ]
+
+    graph = [
+        Task("stat_summary",
+            [python, "eda.py", "stat_summary"],
+            scores + eda_code,
+            [os.path.join(TABLES_DIR, "stat_summary.tex")]),
+        Task("targeted_testing",
+            [python, "eda.py", "compare_targeted_testing"],
+            scores + eda_code,
+            [os.path.join(TABLES_DIR, "targeted_testing.tsv")]),
+        Task("comparison_graphs",
+            [python, "eda.py", "comparison_graphs"],
+            scores + eda_code,
+            [os.path.join(GRAPHS_DIR, "%s_comparison.pdf" % feature)
+                for feature in ["n run red light", "n side move"]])
+    ]
+
+    rankings = []
+    for app, target in [("collisions_app", "num_collisions"),
+            ("redlight_app", "run_red_light"),
+            ("sidemove_app", "side_move")]:
+        out_dir = "out/explainability/%s/global" % target
+        ranking = "%s/lightgbm/lightgbm_global_feature_ranking.txt" % out_dir
+        rankings.append(ranking)
+        graph.append(Task("model_%s" % target,
+            [python, "explainability/%s.py" % app],
+            ["out/full_data/*.feather", "explainability/%s.py" % app] \
+                + explainability_code,
+            [ranking,
+                "%s/shap/global_shap_summary.txt" % out_dir,
+                "%s/shap/global_shap_waterfall.pdf" % out_dir]))
+        continue
+
+    graph.append(Task("feature_ranking_pdfs",
+        [python, "eda.py", "lightbm_feature_importance"],
+        rankings + ["eda.py"],
+        ["%s.pdf" % fn[:-len(".txt")] for fn in rankings]))
+    return graph
+
+class Pipeline:
+    def __init__(self,
+            tasks : list[Task],
+            state_file : str = constants.pipeline.state_file,
+            n_jobs : int = constants.pipeline.n_jobs
+        ):
+        """
+        Runs the stale tasks of a task graph, independent ones in parallel.
+
+        :: Parameters ::
+            tasks : list[Task]
+                Task graph; dependencies follow from inputs and outputs.
+            state_file : str
+                JSON file of the input/output hashes of the last builds.
+            n_jobs : int
+                Tasks run at once.
+        """
+        self._tasks = {task.name : task for task in tasks}
+        self._state_file = state_file
+        self._n_jobs = n_jobs
+        self._state = self.load_state()
+        self._lock = threading.Lock()
+
+        writers = {}
+        for task in tasks:
+            for fn in task.outputs:
+                if fn in writers:
+                    raise ValueError("%s is written by both %s and %s" \
+                        % (fn, writers[fn], task.name))
+                writers[fn] = task.name
+                continue
+            continue
+        self._deps = {
+            task.name : sorted({writers[fn] for fn in task.inputs
+                if fn in writers})
+            for task in tasks
+        }
+        return
+
+    @property
+    def tasks(self) -> dict[str, Task]:
+        return self._tasks
+
+    @property
+    def deps(self) -> dict[str, list[str]]:
+        return self._deps
+
+    def load_state(self) -> dict:
+        if not os.path.exists(self._state_file):
+            return {"digests" : {}, "tasks" : {}}
+        with open(self._state_file) as f:
+            return json.load(f)
+
+    def save_state(self):
+        os.makedirs(os.path.dirname(self._state_file), exist_ok=True)
+        tmp_fn = "%s.tmp" % self._state_file
+        with open(tmp_fn, "w") as f:
+            json.dump(self._state, f, indent=1, sort_keys=True)
+        os.replace(tmp_fn, self._state_file)
+        return
+
+    def digest(self, fn : str) -> str:
+        """
+        Content hash of @fn, None if it does not exist. Rehashed only when
+        the size or mtime changed since the last call.
+        """
+        if not os.path.exists(fn):
+            return None
+        stat = os.stat(fn)
+        cached = self._state["digests"].get(fn)
+        if cached is not None \
+                and cached[:2] == [stat.st_size, stat.st_mtime_ns]:
+            return cached[2]
+        digest = utils.file_digest(fn)
+        self._state["digests"][fn] = [stat.st_size, stat.st_mtime_ns, digest]
+        return digest
+
+    def digests(self, files : list[str]) -> dict[str, str]:
+        return {fn : self.digest(fn) for fn in files}
+
+    def stale_reason(self, task : Task) -> str:
+        """
+        Why @task has to be rebuilt, or None when it is up to date.
+        """
+        built = self._state["tasks"].get(task.name)
+        if built is None:
+            return "never built"
+        if built["command"] != task.command:
+            return "command changed"
+        for fn in task.outputs:
+            digest = self.digest(fn)
+            if digest is None:
+                return "%s is missing" % fn
+            if digest != built["outputs"].get(fn):
+                return "%s was modified" % fn
+            continue
+        inputs = self.digests(task.input_files())
+        for fn in sorted(inputs.keys() | built["inputs"].keys()):
+            if inputs.get(fn) != built["inputs"].get(fn):
+                return "%s changed" % fn
+            continue
+        return None
+
+    def select(self, targets : list[str] = None) -> list[str]:
+        """
+        @targets and every task they depend on, in dependency order.
+        """
+        if targets is None:
+            targets = list(self.tasks.keys())
+        order = []
+        def visit(name : str):
+            if name in order:
+                return
+            if not name in self.tasks:
+                raise KeyError("Unknown task %s" % name)
+            for dep in self.deps[name]:
+                visit(dep)
+                continue
+            order.append(name)
+            return
+        for name in targets:
+            visit(name)
+            continue
+        return order
+
+    def execute(self, task : Task, inputs : dict[str, str]) -> bool:
+        """
+        Runs @task, recording its hashes when it succeeds.
+        """
+        os.makedirs(LOG_DIR, exist_ok=True)
+        log_fn = os.path.join(LOG_DIR, "%s.log" % task.name)
+        with open(log_fn, "w") as log:
+            result = subprocess.run(task.command, cwd=ROOT,
+                stdout=log, stderr=subprocess.STDOUT)
+        if result.returncode != 0:
+            print("%s failed with exit code %d, see %s" \
+                % (task.name, result.returncode, log_fn))
+            return False
+
+        missing = [fn for fn in task.outputs if not os.path.exists(fn)]
+        if missing:
+            print("%s did not write %s, see %s" \
+                % (task.name, ", ".join(missing), log_fn))
+            return False
+
+        with self._lock:
+            self._state["tasks"][task.name] = {
+                "command" : task.command,
+                "inputs" : inputs,
+                "outputs" : self.digests(task.outputs)
+            }
+            self.save_state()
+        return True
+
+    def run(self,
+            targets : list[str] = None,
+            force : bool = False,
+            dry_run : bool = False
+        ) -> dict[str, str]:
+        """
+        Brings @targets (all tasks by default) up to date.
+
+        :: Parameters ::
+            targets : list[str]
+                Tasks to build, with the tasks they depend on.
+            force : bool
+                Rebuild even up-to-date tasks.
+            dry_run : bool
+                Only report which tasks are stale.
+
+        :: Return ::
+            The outcome of each task: built, up to date, stale (dry run),
+            failed or skipped (a dependency failed).
+        """
+        order = self.select(targets)
+        status = {}
+        running = {}
+        with ThreadPoolExecutor(self._n_jobs) as executor:
+            while len(status) < len(order):
+                for name in order:
+                    if name in status or name in running:
+                        continue
+                    deps = [status.get(dep) for dep in self.deps[name]]
+                    if None in deps:
+                        continue
+                    if any(s in ["failed", "skipped"] for s in deps):
+                        status[name] = "skipped"
+                        print("%s skipped, a dependency failed" % name)
+                        continue
+
+                    task = self.tasks[name]
+                    with self._lock:
+                        reason = "forced" if force \
+                            else self.stale_reason(task)
+                        inputs = self.digests(task.input_files())
+                    missing = [fn for fn, digest in inputs.items()
+                        if digest is None]
+                    if reason is None:
+                        status[name] = "up to date"
+                        continue
+                    if dry_run:
+                        # Dependents are judged on the current files
+                        status[name] = "stale"
+                        print("%s: %s" % (name, reason))
+                        continue
+                    if missing:
+                        status[name] = "failed"
+                        print("%s failed, missing input %s" \
+                            % (name, ", ".join(missing)))
+                        continue
+
+                    print("Building %s (%s)" % (name, reason))
+                    running[name] = (executor.submit(
+                        self.execute, task, inputs), time.perf_counter())
+                    continue
+
+                if not running:
+                    continue
+                done, _ = wait([future for future, _ in running.values()],
+                    return_when=FIRST_COMPLETED)
+                for name, (future, start) in list(running.items()):
+                    if not future in done:
+                        continue
+                    ok = future.result()
+                    status[name] = "built" if ok else "failed"
+                    if ok:
+                        print("Built %s in %.1fs" \
+                            % (name, time.perf_counter() - start))
+                    del running[name]
+                    continue
+                continue
+
+        with self._lock:
+            self.save_state()
+        return {name : status[name] for name in order}
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__.strip().splitlines()[0])
+    parser.add_argument("tasks", nargs="*",
+        help="Tasks to build with their dependencies; all by default.")
+    parser.add_argument("-j", "--jobs", type=int,
+        default=constants.pipeline.n_jobs)
+    parser.add_argument("--dry-run", action="store_true",
+        help="List the stale tasks and why, without building.")
+    parser.add_argument("--force", action="store_true",
+        help="Rebuild the selected tasks even when up to date.")
+    parser.add_argument("--list", action="store_true",
+        help="List the tasks and their dependencies.")
+    args = parser.parse_args()
+
+    os.chdir(ROOT)
+    pipeline = Pipeline(tasks(), n_jobs=args.jobs)
+    if args.list:
+        for name, task in pipeline.tasks.items():
+            print("%s <- %s" % (name, ", ".join(pipeline.deps[name]) or "-"))
+            continue
+        return
+
+    status = pipeline.run(args.tasks or None, args.force, args.dry_run)
+    for name, outcome in status.items():
+        print("%-24s %s" % (name, outcome))
+        continue
+    if "failed" in status.values():
+        sys.exit(1)
+    return
+
+if __name__ == "__main__":
+    main()
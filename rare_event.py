@@ -0,0 +1,393 @@
+"""
+Cross-entropy importance sampling of rare outcomes, such as a long DUT
+collision.
+
+Every feature of the spec lives on a grid, min + j * inc, and plain Monte
+Carlo draws grid point j with the probability that ScenarioManager.project()
+rounds a uniform sample to it. The proposal draws each feature from the same
+grid, reweighting a few contiguous bins of it, so likelihood ratios against
+that nominal distribution are exact. Only features whose elite tests differ
+significantly from the proposal are refit; with 62 features, refitting on
+noise alone would leave the final weights degenerate.
+
+Each cross-entropy stage samples from the proposal, scores the tests with a
+continuous performance function, and refits the proposal to the
+likelihood-weighted tests above the stage's (1 - rho) quantile, until that
+level reaches the rare-event threshold. A final stage from the learned
+proposal then gives unbiased reweighted estimates, with their variance,
+for every target.
+"""
+import json
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+import constants
+import monte_carlo
+import target_classifiers
+
+def collision_performance(score : pd.Series) -> float:
+    """
+    Closeness of a test to the collision target: its contact time, or
+    minus its closest distance to a collision when there was no contact.
+    """
+    contact = target_classifiers.CONTACT_TIME(score)
+    if contact > 0:
+        return contact
+    return -min(score["dtc (front)"], score["dtc (inter)"])
+
+class BinnedProposal:
+    def __init__(self, spec : pd.DataFrame, floor : float,
+            n_bins : int = constants.rare_event.n_bins):
+        """
+        Independent distributions over the grid of each feature, starting
+        at the nominal distribution of project(). Each feature's grid is cut
+        into @n_bins bins of equal nominal mass; the proposal sets the mass
+        of each bin and keeps the nominal shape within it.
+
+        :: Parameters ::
+            spec : pd.DataFrame
+                Parameter spec with feat, min, max and inc columns.
+            floor : float
+                No grid point gets less than this fraction of its nominal
+                probability, which bounds the likelihood ratios.
+            n_bins : int
+                Bins per feature, fewer when the grid is smaller.
+        """
+        self._feats = spec["feat"].tolist()
+        self._index = pd.Index(self._feats, name="feat")
+        self._floor = floor
+        self._values = []
+        self._nominal = []
+        self._bins = []
+        for feat, lo, hi, inc in spec[["feat", "min", "max", "inc"]]\
+                .itertuples(index=False):
+            n_inc = (hi - lo) / inc if inc > 0 else np.nan
+            if not (np.isfinite(n_inc) and n_inc == round(n_inc)):
+                raise ValueError("%s is not on an inc grid" % feat)
+            n_inc = int(round(n_inc))
+            # project() rounds n * n_inc, so the end points get half a cell
+            p = np.full(n_inc + 1, 1.0)
+            if n_inc > 0:
+                p[0] = p[-1] = 0.5
+            p = p / p.sum()
+            self._values.append(lo + np.arange(n_inc + 1) * inc)
+            self._nominal.append(p)
+            mid = np.cumsum(p) - p / 2
+            bins = np.minimum((mid * n_bins).astype(int), n_bins - 1)
+            self._bins.append(np.unique(bins, return_inverse=True)[1])
+            continue
+        self._q = [p.copy() for p in self._nominal]
+        return
+
+    @property
+    def feats(self) -> list[str]:
+        return self._feats
+
+    @property
+    def q(self) -> list[np.ndarray]:
+        return self._q
+
+    def sample(self, rng : np.random.Generator, n : int) -> np.ndarray:
+        """
+        Grid indices of @n samples, one column per feature.
+        """
+        u = rng.random((n, len(self._feats)))
+        codes = np.empty((n, len(self._feats)), dtype=np.int64)
+        for f, q in enumerate(self._q):
+            cdf = np.cumsum(q)
+            codes[:, f] = np.minimum(np.searchsorted(cdf, u[:, f] * cdf[-1],
+                side="right"), len(q) - 1)
+            continue
+        return codes
+
+    def log_weight(self, codes : np.ndarray) -> np.ndarray:
+        """
+        log(nominal / proposal) likelihood ratio of each sample.
+        """
+        logw = np.zeros(len(codes))
+        for f in range(len(self._feats)):
+            logw += np.log(self._nominal[f][codes[:, f]]) \
+                - np.log(self._q[f][codes[:, f]])
+            continue
+        return logw
+
+    def update(self, codes : np.ndarray, weights : np.ndarray,
+            smoothing : float, alpha : float) -> int:
+        """
+        Refits the bin masses of each feature to the weighted frequencies of
+        @codes, blended with the current proposal by @smoothing.
+
+        Only features whose bin frequencies differ from the proposal by a
+        G-test at level @alpha (Bonferroni over the features) are refit.
+
+        :: Return ::
+            Number of refit features.
+        """
+        n_eff = weights.sum()**2 / (weights**2).sum()
+        n_refit = 0
+        for f, q in enumerate(self._q):
+            bins = self._bins[f]
+            n_bins = bins[-1] + 1
+            if n_bins < 2:
+                continue
+            mass = np.bincount(bins, weights=q, minlength=n_bins)
+            freq = np.bincount(bins[codes[:, f]], weights=weights,
+                minlength=n_bins) / weights.sum()
+            seen = freq > 0
+            g = 2 * n_eff * np.sum(freq[seen] * np.log(freq[seen] / mass[seen]))
+            if stats.chi2.sf(g, n_bins - 1) > alpha / len(self._q):
+                continue
+            nominal = np.bincount(bins, weights=self._nominal[f],
+                minlength=n_bins)
+            new_mass = smoothing * freq + (1 - smoothing) * mass
+            new_mass = np.maximum(new_mass, self._floor * nominal)
+            new_mass /= new_mass.sum()
+            self._q[f] = self._nominal[f] * (new_mass / nominal)[bins]
+            n_refit += 1
+            continue
+        return n_refit
+
+    def params(self, codes : np.ndarray) -> list[pd.Series]:
+        """
+        Test parameters of @codes, with the values project() would give.
+        """
+        values = np.column_stack([self._values[f][codes[:, f]] \
+            for f in range(len(self._feats))])
+        return [pd.Series(row, index=self._index) for row in values]
+
+class Estimate:
+    def __init__(self, name : str, y : np.ndarray):
+        """
+        Importance sampling estimate of a rate from the reweighted
+        indicators @y = w * hit.
+        """
+        self.name = name
+        self.n = len(y)
+        self.rate = float(y.mean())
+        self.variance = float(y.var(ddof=1) / self.n) if self.n > 1 else np.inf
+        return
+
+    @property
+    def std_error(self) -> float:
+        return float(np.sqrt(self.variance))
+
+    @property
+    def rel_error(self) -> float:
+        return self.std_error / self.rate if self.rate > 0 else np.inf
+
+    def to_dict(self) -> dict:
+        return {
+            "rate" : self.rate,
+            "variance" : self.variance,
+            "std_error" : self.std_error,
+            "rel_error" : self.rel_error,
+            "n" : self.n
+        }
+
+class CrossEntropySampler:
+    def __init__(self,
+            spec : pd.DataFrame,
+            evaluate : Callable[[list[pd.Series]], list[pd.Series]],
+            performance : Callable[[pd.Series], float] = collision_performance,
+            threshold : float = constants.collision_target_contact_s,
+            targets : dict[str, Callable[[pd.Series], bool]] \
+                = monte_carlo.TARGETS,
+            seed : int = constants.seed,
+            n_per_stage : int = constants.rare_event.n_per_stage,
+            n_final : int = constants.rare_event.n_final,
+            rho : float = constants.rare_event.rho,
+            smoothing : float = constants.rare_event.smoothing,
+            floor : float = constants.rare_event.floor,
+            alpha : float = constants.rare_event.alpha,
+            max_stages : int = constants.rare_event.max_stages,
+            batch_size : int = constants.batch_size
+        ):
+        """
+        Learns an importance sampling proposal for performance >= threshold
+        and estimates target rates from it.
+
+        :: Parameters ::
+            spec : pd.DataFrame
+                Parameter spec, e.g. ScenarioManager.params.
+            evaluate : Callable[[list[pd.Series]], list[pd.Series]]
+                Runs a batch of tests, returning their scores in order.
+            performance : Callable[[pd.Series], float]
+                Continuous score the rare event is a level set of.
+            threshold : float
+                The rare event is performance >= threshold.
+            targets : dict[str, Callable[[pd.Series], bool]]
+                Rates estimated in the final stage.
+            seed : int
+                Root of the seed streams of the stages.
+            n_per_stage : int
+                Tests per cross-entropy stage.
+            n_final : int
+                Tests of the final estimation stage.
+            rho : float
+                Fraction of tests kept as elite in each stage.
+            smoothing : float
+                Weight of the new fit in each proposal update.
+            floor : float
+                Smallest proposal probability, relative to nominal.
+            alpha : float
+                Significance level at which a feature is refit.
+            max_stages : int
+                Cross-entropy stages before the final stage at most.
+            batch_size : int
+                Tests evaluated per call of @evaluate.
+        """
+        self._proposal = BinnedProposal(spec, floor)
+        self._evaluate = evaluate
+        self._performance = performance
+        self._threshold = threshold
+        self._targets = targets
+        self._seed = seed
+        self._n_per_stage = n_per_stage
+        self._n_final = n_final
+        self._rho = rho
+        self._smoothing = smoothing
+        self._alpha = alpha
+        self._max_stages = max_stages
+        self._batch_size = batch_size
+        self._levels = []
+        self._stages = []
+        self._estimates = {}
+        return
+
+    @property
+    def proposal(self) -> BinnedProposal:
+        return self._proposal
+
+    @property
+    def levels(self) -> list[float]:
+        """
+        Performance level reached by each cross-entropy stage.
+        """
+        return self._levels
+
+    @property
+    def estimates(self) -> dict[str, Estimate]:
+        return self._estimates
+
+    @property
+    def n_tests(self) -> int:
+        return sum(len(stage["scores"]) for stage in self._stages)
+
+    def _run_stage(self, i : int, n : int) -> dict:
+        rng = np.random.default_rng(
+            np.random.SeedSequence(self._seed, spawn_key=(i,)))
+        codes = self.proposal.sample(rng, n)
+        logw = self.proposal.log_weight(codes)
+        params = self.proposal.params(codes)
+        scores = []
+        for j in range(0, n, self._batch_size):
+            scores += self._evaluate(params[j:j+self._batch_size])
+            continue
+        stage = {
+            "stage" : i,
+            "codes" : codes,
+            "weights" : np.exp(logw),
+            "params" : params,
+            "scores" : scores,
+            "performance" : np.array([self._performance(s) for s in scores])
+        }
+        self._stages.append(stage)
+        return stage
+
+    def run(self, progress : bool = True) -> dict[str, Estimate]:
+        """
+        Cross-entropy stages, then the final estimation stage.
+        """
+        for i in range(self._max_stages):
+            stage = self._run_stage(i, self._n_per_stage)
+            s = stage["performance"]
+            level = min(self._threshold, np.quantile(s, 1 - self._rho))
+            self._levels.append(float(level))
+            elite = stage["weights"] * (s >= level)
+            n_refit = 0
+            if elite.sum() > 0:
+                n_refit = self.proposal.update(stage["codes"], elite,
+                    self._smoothing, self._alpha)
+            if progress:
+                print("CE stage %d: level %.3f of %.3f, %d elite tests, "
+                    "%d features refit" % (i, level, self._threshold,
+                    int((s >= level).sum()), n_refit))
+            if level >= self._threshold:
+                break
+            continue
+
+        final = self._run_stage(self._max_stages, self._n_final)
+        w = final["weights"]
+        self._estimates["performance >= %g" % self._threshold] = Estimate(
+            "performance >= %g" % self._threshold,
+            w * (final["performance"] >= self._threshold))
+        scores_df = pd.DataFrame(final["scores"])
+        for name, tsc in self._targets.items():
+            if isinstance(tsc, target_classifiers.Classifier):
+                hits = tsc.frame(scores_df)
+            else:
+                hits = np.array([bool(tsc(s)) for s in final["scores"]])
+            self._estimates[name] = Estimate(name, w * hits)
+            continue
+
+        if progress:
+            for e in self.estimates.values():
+                print("%-22s %.3e ± %.1e (rel. error %.2f)" % (
+                    e.name, e.rate, e.std_error, e.rel_error))
+                continue
+            print("Effective sample size %.0f of %d" % (
+                self.effective_sample_size, len(w)))
+        return self.estimates
+
+    @property
+    def effective_sample_size(self) -> float:
+        """
+        Kish effective sample size of the final stage's weights.
+        """
+        w = self._stages[-1]["weights"]
+        return float(w.sum()**2 / (w**2).sum())
+
+    def tests(self) -> tuple[pd.DataFrame, pd.DataFrame]:
+        """
+        Params and scores of every test, with their stage and likelihood
+        ratio weight.
+        """
+        params = []
+        scores = []
+        for stage in self._stages:
+            extra = {"stage" : stage["stage"], "weight" : stage["weights"]}
+            params.append(pd.DataFrame(stage["params"]).assign(**extra))
+            scores.append(pd.DataFrame(stage["scores"]).assign(**extra))
+            continue
+        return pd.concat(params).reset_index(drop=True), \
+            pd.concat(scores).reset_index(drop=True)
+
+    def save(self, prefix : str, schema = None):
+        """
+        Writes <prefix>_params.feather, <prefix>_scores.feather and the
+        estimates to <prefix>_estimates.json.
+
+        :: Parameters ::
+            schema : param_schema.ParamSchema
+                Compact params storage, when given.
+        """
+        params_df, scores_df = self.tests()
+        if schema is None:
+            params_df.to_feather("%s_params.feather" % prefix)
+        else:
+            schema.write_feather(params_df, "%s_params.feather" % prefix)
+        scores_df.to_feather("%s_scores.feather" % prefix)
+        with open("%s_estimates.json" % prefix, "w") as f:
+            json.dump({
+                "n_tests" : self.n_tests,
+                "seed" : self._seed,
+                "threshold" : self._threshold,
+                "levels" : self.levels,
+                "effective_sample_size" : self.effective_sample_size,
+                "estimates" : {name : e.to_dict() \
+                    for name, e in self.estimates.items()}
+            }, f, indent=2)
+        return
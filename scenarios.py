@@ -1,4 +1,3 @@
-import scenarioxp as sxp
 import pandas as pd
 import numpy as np
 from shapely.geometry import Polygon
@@ -7,17 +6,35 @@ from typing import Tuple, List
 import traci._simulation
 
 import constants
+import target_classifiers
+import tiled_net
+import tl_program
 import utils
 import traci
 
 class GammaCrossAI:
-    def __init__(self):
-        self.net = utils.parse_net(constants.traci.gamma_cross.net_file)
+    def __init__(self, net_file : str = constants.traci.gamma_cross.net_file):
+        self.net = utils.parse_net(net_file)
         self.sidVehicle = {} # vehicles that want to do side move
+        self._idle = True
         return
+
+    @property
+    def idle(self) -> bool:
+        """
+        True when the last step found no queue where a side move could start
+        and no side move is waiting for its second step.
+        """
+        return self._idle and len(self.sidVehicle) == 0
     
-    def on_step(self) -> bool:
-        dut_perform_side_move = False
+    def on_step(self) -> list[str]:
+        """
+        Applies the aggressive driver behaviour for one step.
+
+        Returns the IDs of vehicles that started a side move.
+        """
+        side_moves = []
+        self._idle = True
 
         # step2 of side move
         for v in self.sidVehicle:
@@ -37,50 +54,72 @@ class GammaCrossAI:
             for l in self.net[e]:
                 length = traci.lane.getLength(l)
                 if traci.lane.getLastStepHaltingNumber(l) >= 2:
+                    self._idle = False
                     for v1 in traci.lane.getLastStepVehicleIDs(l):
                         pos = traci.vehicle.getLanePosition(str(v1))
                         if traci.vehicle.getTypeID(v1) == "AggrCar" and length - pos < 12 and length - pos > 3:
-                            b = int(l[4]) # get the index of the lane
+                            b = int(l.rsplit("_", 1)[1]) # get the index of the lane
                             for l1 in self.net[e]:
-                                a = int(l1[4])
+                                a = int(l1.rsplit("_", 1)[1])
                                 if l1 != l and abs(b-a) == 1 and traci.lane.getLastStepHaltingNumber(l1) == 0:
                                     traci.vehicle.highlight(v1, (255, 0, 0, 255), -1, 1, 4,0)
                                     traci.vehicle.moveTo(v1,l1,pos+8)
                                     self.sidVehicle[v1] = (l, pos+8)
                                     
                                     # Added code to check if DUT performs side move.
-                                    if v1 == constants.DUT:
-                                        dut_perform_side_move = True
+                                    side_moves.append(v1)
                                     break
-        return dut_perform_side_move
+        return side_moves
 
 
 
 
-class GammaCrossScenario(sxp.Scenario):
-    def __init__(self, params : pd.Series):
-        traci.simulation.loadState(constants.sumo.init_state_file)
-        
+class Scenario:
+    """
+    What scenarioxp explorers need of a scenario: built from params, with a
+    score. Stands in for sxp.Scenario, whose import (scipy.stats,
+    sim_bug_tools, matplotlib) took most of a campaign worker's startup.
+    """
+    @property
+    def params(self) -> pd.Series:
+        raise NotImplementedError
+
+    @property
+    def score(self) -> pd.Series:
+        raise NotImplementedError
+
+class GammaCrossScenario(Scenario):
+    def __init__(self, params : pd.Series, prefix : str = "",
+            run : bool = True, init_state_fn : str = None):
+        """
+        One test on the gamma_cross intersection.
+
+        :: Parameters ::
+            params : pd.Series
+                Test parameters from the ScenarioManager.
+            prefix : str
+                Tile prefix of the intersection's ids in a tiled network.
+                Empty for the plain gamma_cross network.
+            run : bool
+                Run the test to the end. TiledGammaCrossScenario sets this
+                to False and drives the steps of many tests itself.
+            init_state_fn : str
+                SUMO state the test starts from, that of the client running
+                it. constants.sumo.init_state_file by default.
+        """
         self._params = params
+        self._prefix = prefix
+        self._dut = prefix + constants.DUT
+        self._tl_id = prefix + constants.traci.gamma_cross.tl_id
+        self._tl_program = tl_program.gamma_cross()
+        self._score = self.initial_score()
+        if not run:
+            return
+
+        if init_state_fn is None:
+            init_state_fn = constants.sumo.init_state_file
+        traci.simulation.loadState(init_state_fn)
         ai = GammaCrossAI()
-        
-        self._score = pd.Series({
-            "collisions" : [],
-            "speed (on enter)" : -1,
-            "braking force" : 0,
-            "braking force (norm)" : 0,
-            "dtc (front)" : 9999,
-            "ttc (front)" : 9999,
-            "dtc (inter)" : 9999,
-            "dtc (approach)" : 9999,
-            "tl state (on enter)" : "",
-            "foes in inter (on enter)" : [],
-            "time (on enter)" : -1,
-            "time (end)" : -1,
-            "n stops" : 0,
-            "side move" : -1,
-            "run red light" : False
-        })
 
         if constants.sumo.gui:
             traci.gui.setZoom(
@@ -92,71 +131,137 @@ class GammaCrossScenario(sxp.Scenario):
         self.add_vehicles()
         self.clear_polygons()
         self.add_passenger_polygons()
-
-        self._start_time = traci.simulation.getTime()
-        self._dut_speed_history = []
+        self.start()
 
         if constants.sumo.pause_after_initialze:
             input()
 
 
         # print("\n\n")
-        # w = traci.vehicle.getWidth(constants.DUT)
-        # l = traci.vehicle.getLength(constants.DUT)
-        # s = traci.vehicle.getMaxSpeed(constants.DUT)
+        # w = traci.vehicle.getWidth(self.dut)
+        # l = traci.vehicle.getLength(self.dut)
+        # s = traci.vehicle.getMaxSpeed(self.dut)
         # print(w, l, s)
         # quit()
 
         """
         Simulation Loop
         """
-        prev_dut_lane_id = None
+        coarse = False
         while traci.simulation.getMinExpectedNumber() > 0:
-            traci.simulationStep()
+            self.advance(coarse)
 
             # Exit if DUT doesn't exist.
-            if not constants.DUT in traci.vehicle.getIDList():
+            vehicle_ids = traci.vehicle.getIDList()
+            if not self.dut in vehicle_ids:
                 break
 
             # AI Logic
-            dut_perform_side_move = ai.on_step()
-            if dut_perform_side_move:
-                self.score["side move"] = self.get_time()
-
-            # Metrics
-            self.collision_metrics()                
-            self.check_for_new_stops()
-            self.foe_in_front_metrics()
-            self.braking_force_metrics()
-
-            # Find moment of entering/exiting intersection
-            dut_lane_id = traci.vehicle.getLaneID(constants.DUT)
-            if dut_lane_id[0] == "1":
-                self.dut_approach()
-            elif prev_dut_lane_id is None:
-                pass
-            elif prev_dut_lane_id[0] != ":" and dut_lane_id[0] == ":":
-                self.dut_enter_intersection()
-            elif prev_dut_lane_id[0] == ":" and dut_lane_id[0] != ":":
-                self.dut_exit_intersection()
-
-            # Logic within intersection
-            if dut_lane_id[0] == ":":
-                self.dut_isin_intersection()
-        
+            side_moves = ai.on_step()
 
-            # Dut complete
-            if "o" in traci.vehicle.getLaneID(constants.DUT) \
-                and traci.vehicle.getLanePosition(constants.DUT) > 20:
+            if not self.on_step(side_moves, vehicle_ids):
                 break
-
-            prev_dut_lane_id = traci.vehicle.getLaneID(constants.DUT)
+            coarse = constants.sumo.adaptive_step \
+                and ai.idle and self.can_step_coarse()
             continue
 
-        self.score["time (end)"] = self.get_time()
+        self.finish()
+        return
 
+    def start(self):
+        """
+        Marks the start of the test, once the vehicles are in place.
+        """
+        self._start_time = traci.simulation.getTime()
+        self._dut_speed_history = []
+        self._n_steps = 0
+        self._prev_dut_lane_id = None
+        self._contacts = {}
+        self._contact_time = 0
+        return
+
+    def on_step(self, side_moves : list[str], vehicle_ids : tuple,
+            collisions : list = None) -> bool:
+        """
+        Metrics for the step just simulated.
+
+        :: Parameters ::
+            side_moves : list[str]
+                Vehicles that started a side move in this step.
+            vehicle_ids : tuple
+                Vehicles in the simulation.
+            collisions : list
+                Collisions of this step, fetched once for all tiles. Queried
+                when None.
+
+        :: Return ::
+            False once the test is over.
+        """
+        # Exit if DUT doesn't exist.
+        if not self.dut in vehicle_ids:
+            return False
+
+        if self.dut in side_moves:
+            self.score["side move"] = self.get_time()
+
+        # Metrics
+        self.collision_metrics(collisions)
+        self.check_for_new_stops()
+        self.foe_in_front_metrics()
+        self.braking_force_metrics()
+
+        # Find moment of entering/exiting intersection
+        dut_lane_id = self.local(traci.vehicle.getLaneID(self.dut))
+        prev_dut_lane_id = self._prev_dut_lane_id
+        if dut_lane_id[0] == "1":
+            self.dut_approach()
+        elif prev_dut_lane_id is None:
+            pass
+        elif prev_dut_lane_id[0] != ":" and dut_lane_id[0] == ":":
+            self.dut_enter_intersection()
+        elif prev_dut_lane_id[0] == ":" and dut_lane_id[0] != ":":
+            self.dut_exit_intersection()
+
+        # Logic within intersection
+        if dut_lane_id[0] == ":":
+            self.dut_isin_intersection()
+
+        # Dut complete
+        if "o" in dut_lane_id \
+            and traci.vehicle.getLanePosition(self.dut) > 20:
+            return False
+
+        self._prev_dut_lane_id = dut_lane_id
+        return True
+
+    def finish(self):
+        self.score["time (end)"] = self.get_time()
         return
     
+    @staticmethod
+    def initial_score() -> pd.Series:
+        """
+        Score of a test before the simulation runs.
+        """
+        return pd.Series({
+            "collisions" : [],
+            "n collisions dropped" : 0,
+            "speed (on enter)" : -1,
+            "braking force" : 0,
+            "braking force (norm)" : 0,
+            "dtc (front)" : 9999,
+            "ttc (front)" : 9999,
+            "dtc (inter)" : 9999,
+            "dtc (approach)" : 9999,
+            "tl state (on enter)" : "",
+            "foes in inter (on enter)" : [],
+            "time (on enter)" : -1,
+            "time (end)" : -1,
+            "n stops" : 0,
+            "side move" : -1,
+            "run red light" : False
+        })
+
     @property
     def score(self) -> pd.Series:
         return self._score
@@ -164,6 +269,50 @@ class GammaCrossScenario(sxp.Scenario):
     @property
     def params(self) -> pd.Series:
         return self._params
+
+    @property
+    def prefix(self) -> str:
+        """
+        Tile prefix of this test's ids, empty outside tiled networks.
+        """
+        return self._prefix
+
+    @property
+    def dut(self) -> str:
+        """
+        Vehicle ID of the DUT.
+        """
+        return self._dut
+
+    @property
+    def tl_id(self) -> str:
+        return self._tl_id
+
+    @property
+    def tl_program(self) -> tl_program.TLProgram:
+        """
+        Static program of this test's TL.
+        """
+        return self._tl_program
+
+    def tl_time(self) -> float:
+        """
+        Time within the TL program. It is time0 when the test starts, as
+        idle_until_start_time() and sync_tl_to_start_time() leave the TL.
+        """
+        return self.params["time0"] + self.get_time()
+
+    def local(self, sumo_id : str) -> str:
+        """
+        @sumo_id without the tile prefix.
+        """
+        return tiled_net.local_id(self.prefix, sumo_id)
+
+    def in_tile(self, sumo_id : str) -> bool:
+        """
+        True if the vehicle or lane @sumo_id belongs to this test's tile.
+        """
+        return not self.prefix or sumo_id.startswith(self.prefix)
     
     @property
     def start_time(self) -> float:
@@ -179,21 +328,64 @@ class GammaCrossScenario(sxp.Scenario):
         """
         return self._dut_speed_history
 
+    @property
+    def n_steps(self) -> int:
+        """
+        Number of client steps in the simulation loop.
+        """
+        return self._n_steps
+
+    def advance(self, coarse : bool):
+        """
+        Advances the simulation by one step, or by the coarse step length
+        when @coarse. SUMO still simulates every fine step in between, but
+        the client skips its queries and metrics for them.
+        """
+        if coarse:
+            traci.simulationStep(
+                traci.simulation.getTime() + constants.sumo.coarse_step_length)
+        else:
+            traci.simulationStep()
+        self._n_steps += 1
+        return
+
+    def can_step_coarse(self) -> bool:
+        """
+        True when the DUT is on an approach lane far from the junction and
+        has no leader close by, other than in a standing queue.
+        """
+        dut_lane_id = self._prev_dut_lane_id
+        if dut_lane_id[0] == ":" or "o" in dut_lane_id:
+            return False
+
+        dist = traci.lane.getLength(self.prefix + dut_lane_id) \
+            - traci.vehicle.getLanePosition(self.dut)
+        if dist < constants.sumo.adaptive_junction_distance:
+            return False
+
+        leader = traci.vehicle.getLeader(
+            self.dut, constants.sumo.adaptive_leader_distance)
+        if leader is None or leader[0] == "":
+            return True
+
+        # Nothing changes while the DUT waits behind a stopped leader
+        return traci.vehicle.getSpeed(self.dut) < 0.1 \
+            and traci.vehicle.getSpeed(leader[0]) < 0.1
+
     def dut_approach(self):
         self.dtc_approach_metrics()
         return
 
     def dut_enter_intersection(self):
         traci.vehicle.setColor(
-            constants.DUT,
+            self.dut,
             constants.RGBA.cyan
         )
         self.score["time (on enter)"] = self.get_time()
-        self.score["speed (on enter)"] = traci.vehicle.getSpeed(constants.DUT)
+        self.score["speed (on enter)"] = traci.vehicle.getSpeed(self.dut)
 
-        # TL State
-        tl_id = traci.trafficlight.getIDList()[0]
-        tl_state = traci.trafficlight.getRedYellowGreenState(tl_id)
+        # TL State, from the static program instead of a TraCI query
+        tl_state = self.tl_program.state_at(self.tl_time())
         self.score["tl state (on enter)"] = tl_state
 
         # Does DUT run the red light?
@@ -208,13 +400,13 @@ class GammaCrossScenario(sxp.Scenario):
 
     def dut_isin_intersection(self):
         # Collect intesection metrics when moving.
-        if traci.vehicle.getSpeed(constants.DUT) > 0:
+        if traci.vehicle.getSpeed(self.dut) > 0:
             self.dtc_intersection_metrics()
         return
 
     def dut_exit_intersection(self):
         traci.vehicle.setColor(
-            constants.DUT,
+            self.dut,
             constants.RGBA.light_blue
         )
         return
@@ -223,12 +415,12 @@ class GammaCrossScenario(sxp.Scenario):
         """
         Get the vehicles within the intersection
         """
-        assert traci.vehicle.getLaneID(constants.DUT)[0] == ":"
+        assert traci.vehicle.getLaneID(self.dut)[0] == ":"
         # print()
 
         foe_polygons = []
         for vid in traci.vehicle.getIDList():
-            if vid == constants.DUT:
+            if vid == self.dut or not self.in_tile(vid):
                 continue
             lid = traci.vehicle.getLaneID(vid)
             if lid[0] == ":":
@@ -240,7 +432,7 @@ class GammaCrossScenario(sxp.Scenario):
             return 
         
         # Measure the distance from each foe to the DUT
-        dut_polygon = Polygon( traci.polygon.getShape(constants.DUT) )
+        dut_polygon = Polygon( traci.polygon.getShape(self.dut) )
         dist = min([dut_polygon.distance(poly) for poly in foe_polygons])
         
         self.score["dtc (inter)"] = min(self.score["dtc (inter)"],dist)
@@ -250,13 +442,13 @@ class GammaCrossScenario(sxp.Scenario):
         """
         Get vehicles within the approach OR the intersection
         """
-        assert traci.vehicle.getLaneID(constants.DUT)[0] == "1"
+        assert self.local(traci.vehicle.getLaneID(self.dut))[0] == "1"
 
         foe_polygons = []
         for vid in traci.vehicle.getIDList():
-            if vid == constants.DUT:
+            if vid == self.dut or not self.in_tile(vid):
                 continue
-            lid = traci.vehicle.getLaneID(vid)
+            lid = self.local(traci.vehicle.getLaneID(vid))
             if lid[0] in ":1":
                 poly = Polygon( traci.polygon.getShape(vid) )
                 foe_polygons.append(poly)
@@ -266,14 +458,14 @@ class GammaCrossScenario(sxp.Scenario):
             return 
         
         # Measure the distance from each foe to the DUT
-        dut_polygon = Polygon( traci.polygon.getShape(constants.DUT) )
+        dut_polygon = Polygon( traci.polygon.getShape(self.dut) )
         dist = min([dut_polygon.distance(poly) for poly in foe_polygons])
         
         self.score["dtc (approach)"] = min(self.score["dtc (approach)"],dist)
         return
 
     def braking_force_metrics(self):
-        accel = traci.vehicle.getAcceleration(constants.DUT)
+        accel = traci.vehicle.getAcceleration(self.dut)
         if accel >= 0:
             return
         
@@ -281,8 +473,8 @@ class GammaCrossScenario(sxp.Scenario):
         if brake > self.score["braking force"]:
             self.score["braking force"] = brake
 
-            decel = traci.vehicle.getDecel(constants.DUT)
-            e_decel = traci.vehicle.getEmergencyDecel(constants.DUT)
+            decel = traci.vehicle.getDecel(self.dut)
+            e_decel = traci.vehicle.getEmergencyDecel(self.dut)
             
             if brake <= decel:
                 brake_norm = brake/decel
@@ -302,14 +494,14 @@ class GammaCrossScenario(sxp.Scenario):
 
         # Distance to collission from shortest point on polygon
         foe_poly = Polygon( traci.polygon.getShape(foe) )
-        dut_poly = Polygon( traci.polygon.getShape(constants.DUT) )
+        dut_poly = Polygon( traci.polygon.getShape(self.dut) )
         dtc = dut_poly.distance(foe_poly)
         
         self.score["dtc (front)"] = min(self.score["dtc (front)"], dtc)
 
         # Time to collision
         foe_speed = traci.vehicle.getSpeed(foe)
-        dut_speed = traci.vehicle.getSpeed(constants.DUT)
+        dut_speed = traci.vehicle.getSpeed(self.dut)
         rel_speed = dut_speed - foe_speed
         if rel_speed > 0:
             ttc = dtc / rel_speed 
@@ -323,17 +515,17 @@ class GammaCrossScenario(sxp.Scenario):
         Returns vehicle ID or None.
         """
         # Get foes in front of DUT
-        dut_lane = traci.vehicle.getLaneID(constants.DUT)
+        dut_lane = traci.vehicle.getLaneID(self.dut)
 
         # No Other vehicles in lane
         if traci.lane.getLastStepVehicleNumber(dut_lane) <= 1:
             return None
 
         # Vehicle in front of DUT
-        dut_pos = traci.vehicle.getLanePosition(constants.DUT)
+        dut_pos = traci.vehicle.getLanePosition(self.dut)
         data = []
         for vid in traci.lane.getLastStepVehicleIDs(dut_lane):
-            if vid == constants.DUT:
+            if vid == self.dut:
                 continue
             pos = traci.vehicle.getLanePosition(vid)
             s = pd.Series({
@@ -349,7 +541,7 @@ class GammaCrossScenario(sxp.Scenario):
         return df.iloc[0]["vid"]
 
     def check_for_new_stops(self):
-        cur = traci.vehicle.getSpeed(constants.DUT)
+        cur = traci.vehicle.getSpeed(self.dut)
         if len(self.dut_speed_history) > 0:
             prev = self.dut_speed_history[-1]
             if prev != 0 and cur == 0:
@@ -357,49 +549,85 @@ class GammaCrossScenario(sxp.Scenario):
         self.dut_speed_history.append(cur)
         return
     
-    def collision_metrics(self):
-        collisions = traci.simulation.getCollisions()
+    def collision_metrics(self, collisions : list = None):
+        """
+        Tracks contacts of the DUT as events keyed by (collider, victim).
+        SUMO reports a contact on every step it lasts; a report in the step
+        after the last one extends the event, otherwise a new event starts.
+        At most constants.max_collision_events are kept per test, the rest
+        are counted in "n collisions dropped".
+        """
+        if collisions is None:
+            collisions = traci.simulation.getCollisions()
+        time = self.get_time()
+        dt = time - self._contact_time
+
+        contacts = {}
         for c in collisions:
             c : traci._simulation.Collision
-            if constants.DUT in [c.collider, c.victim]:
-                self.score["collisions"].append( self.collision2dict(c) )
+            if not self.dut in [c.collider, c.victim]:
+                continue
+            key = (c.collider, c.victim)
+            if key in contacts:
+                continue
+            if key in self._contacts:
+                event = self._contacts[key]
+                if event is not None:
+                    event["duration"] += dt
+                    event["n steps"] += 1
+            elif len(self.score["collisions"]) \
+                    < constants.max_collision_events:
+                event = self.collision2dict(c)
+                event["onset"] = time
+                event["duration"] = dt
+                event["n steps"] = 1
+                self.score["collisions"].append(event)
+            else:
+                event = None
+                self.score["n collisions dropped"] += 1
+            contacts[key] = event
             continue
+
+        # Contacts not reported in this step are over
+        self._contacts = contacts
+        self._contact_time = time
         return
 
-    def collision2dict(self, c : traci._simulation.Collision) -> dict:
-        assert constants.DUT in [c.collider, c.victim]
-        
-        # print(c)
-        # print()
-        # quit() 
+    @staticmethod
+    def contact_time(score : pd.Series) -> float:
+        """
+        Total time the DUT spent in contact with other vehicles, over the
+        kept collision events of @score.
+        """
+        return target_classifiers.CONTACT_TIME(score)
 
+    def collision2dict(self, c : traci._simulation.Collision) -> dict:
+        """
+        Fields of a collision event that are fixed at its onset.
+        """
+        assert self.dut in [c.collider, c.victim]
         data = {
-            "time" : self.get_time(),
             "pos" : c.pos,
-            "lane" : c.lane
+            "lane" : self.local(c.lane)
         }
-        if constants.DUT == c.collider:
+        if self.dut == c.collider:
             data["status"] = "collider"
             data["speed"] = c.colliderSpeed
-            data["other id"] = c.victim
+            data["other id"] = self.local(c.victim)
             data["other type"] = c.victimType
             data["other speed"] = c.victimSpeed
         else:
             data["status"] = "victim"
             data["speed"] = c.victimSpeed
-            data["other id"] = c.collider
+            data["other id"] = self.local(c.collider)
             data["other type"] = c.colliderType
             data["other speed"] = c.colliderSpeed
-
-        # print(data)
-        # print()
-
-        # quit()
         return data
     
     def get_foes_in_intersection(self) -> list[str]:
-        foes = [vid for vid in traci.vehicle.getIDList() if not \
-            ((vid == constants.DUT) \
+        foes = [self.local(vid) for vid in traci.vehicle.getIDList() if not \
+            ((vid == self.dut) \
+             or (not self.in_tile(vid)) \
              or (traci.vehicle.getLaneID(vid)[0] != ":"))]
         return foes
 
@@ -412,11 +640,13 @@ class GammaCrossScenario(sxp.Scenario):
     def add_passenger_polygons(self):
 
         for vid in traci.vehicle.getIDList():
+            if not self.in_tile(vid):
+                continue
             center = traci.vehicle.getPosition(vid)            
             rotation = traci.vehicle.getAngle(vid)
 
             # Adjust for SUMO axes
-            if vid[0] in "ns":
+            if self.local(vid)[0] in "ns":
                 rotation += 90
             else:
                 rotation -= 90
@@ -429,7 +659,7 @@ class GammaCrossScenario(sxp.Scenario):
                 if constants.sumo.override_polygon_color:
                     color = constants.sumo.polygon_color
                 else:
-                    if vid == constants.DUT:
+                    if vid == self.dut:
                         color = constants.RGBA.light_blue
                     elif traci.vehicle.getTypeID(vid) == "AggrCar":
                         color = constants.RGBA.red
@@ -459,30 +689,63 @@ class GammaCrossScenario(sxp.Scenario):
 
     def clear_polygons(self):
         for pid in traci.polygon.getIDList():
-            traci.polygon.remove(pid)
+            if self.in_tile(pid):
+                traci.polygon.remove(pid)
+        return
+
+    def sync_tl_to_start_time(self):
+        """
+        Puts this test's TL where idle_until_start_time() would leave it,
+        without stepping the simulation. Used when tests share one clock.
+        """
+        time0 = self.params["time0"]
+        traci.trafficlight.setPhase(self.tl_id,
+            self.tl_program.phase_index(time0))
+        traci.trafficlight.setPhaseDuration(self.tl_id,
+            self.tl_program.time_to_next_switch(time0))
         return
 
     def idle_until_start_time(self):
         start_time = self.params["time0"]
-        while traci.simulation.getTime() < start_time:
-            traci.simulationStep()
+        # SUMO steps up to the target time in one request
+        if traci.simulation.getTime() < start_time:
+            traci.simulationStep(start_time)
         return
 
     def add_vehicles(self):
+        self.depart_vehicles()
 
+        # Add vehicles to simulation
+        traci.simulationStep()
+
+        self.place_vehicles()
+        return
+
+    def depart_vehicles(self):
+        """
+        Adds the DUT and traffic to the warmup edge. They enter the
+        simulation with the next step.
+        """
         # Prepare the DUT
         traci.vehicle.add(
-            constants.DUT,
-            "warmup",
+            self.dut,
+            self.prefix + "warmup",
             typeID= constants.traci.gamma_cross.dut_type,
             departLane = 60,
             departSpeed = utils.kph2mps(self.params["dut_s0"])
         )
-        traci.vehicle.setColor(constants.DUT, constants.RGBA.light_blue)
-        traci.vehicle.setLaneChangeMode(constants.DUT,0)
+        traci.vehicle.setColor(self.dut, constants.RGBA.light_blue)
+        traci.vehicle.setLaneChangeMode(self.dut,0)
 
         # Add traffic
-        self.add_traffic()
+        self.depart_traffic()
+        return
+
+    def place_vehicles(self):
+        """
+        Moves the departed DUT and traffic to their test positions.
+        """
+        self.place_traffic()
 
         #  Move the DUT
         directions = {
@@ -493,6 +756,7 @@ class GammaCrossScenario(sxp.Scenario):
         }
         rid = constants.traci.gamma_cross.dut_route
         direction = directions[rid[:2]]
+        rid = self.prefix + rid
 
         """
         Move DUT to new route
@@ -500,9 +764,9 @@ class GammaCrossScenario(sxp.Scenario):
         """
         turn_lane_length = constants.traci.gamma_cross.turn_lane_length
         pos = turn_lane_length - 20 - 2*7 - 20
-        lid = "%dsi_1" % direction
+        lid = "%s%dsi_1" % (self.prefix, direction)
         traci.vehicle.moveTo(
-            constants.DUT,
+            self.dut,
             lid,
             pos
         )
@@ -510,18 +774,18 @@ class GammaCrossScenario(sxp.Scenario):
 
 
         # Restore route
-        traci.vehicle.setRouteID(constants.DUT, rid)
+        traci.vehicle.setRouteID(self.dut, rid)
 
         # Restore lane change properties
         traci.vehicle.setLaneChangeMode(
-            constants.DUT,
+            self.dut,
             constants.traci.default_lane_change_behavior
         )
 
         # Focus on DUT
         if constants.sumo.gui:
             if constants.sumo.track_dut:
-                traci.gui.trackVehicle(constants.sumo.default_view, constants.DUT)
+                traci.gui.trackVehicle(constants.sumo.default_view, self.dut)
             traci.gui.setZoom(
                 constants.sumo.default_view, 
                 constants.sumo.dut_zoom
@@ -529,7 +793,7 @@ class GammaCrossScenario(sxp.Scenario):
         # input("hhh")
         return
 
-    def add_traffic(self):
+    def depart_traffic(self):
         
         directions = {
             "eb" : 1,
@@ -563,13 +827,13 @@ class GammaCrossScenario(sxp.Scenario):
                     mps = utils.kph2mps(kph)
 
                     # Route ID
-                    rid = "%s_%s" % (dir, lane)
+                    rid = "%s%s_%s" % (self.prefix, dir, lane)
 
                     # Starting Lane
-                    lid = "%dsi_%d" % (directions[dir], lanes[lane])
+                    lid = "%s%dsi_%d" % (self.prefix, directions[dir], lanes[lane])
 
                     # Vehicle ID
-                    vid = "%s_%s%d" % (dir, lane, i)
+                    vid = "%s%s_%s%d" % (self.prefix, dir, lane, i)
                     
                     s = pd.Series ({
                         "vtype" : vtype,
@@ -583,6 +847,7 @@ class GammaCrossScenario(sxp.Scenario):
                 continue
             continue
         df = pd.DataFrame(vehicle_data)
+        self._traffic = df
 
         # Put on warmup edge
         for i in range(len(df.index)):
@@ -590,7 +855,7 @@ class GammaCrossScenario(sxp.Scenario):
 
             traci.vehicle.add(
                 s["vid"],
-                routeID = "warmup", 
+                routeID = self.prefix + "warmup", 
                 departSpeed = s["s0"],
                 departLane = i,
                 typeID = s["vtype"]
@@ -599,10 +864,10 @@ class GammaCrossScenario(sxp.Scenario):
             # Disable lane change
             traci.vehicle.setLaneChangeMode(s["vid"],0)
             continue
+        return
 
-        # Add vehicles to simulation
-        traci.simulationStep()
-
+    def place_traffic(self):
+        df = self._traffic
         pos_offset = {
             1 : 20,
             2 : 20 + 7,
@@ -630,3 +895,109 @@ class GammaCrossScenario(sxp.Scenario):
             )
             continue
         return
+
+
+
+class TiledGammaCrossScenario:
+    def __init__(self, params : list[pd.Series],
+            net_file : str = None):
+        """
+        Runs one gamma_cross test per tile of a network built by tiled_net,
+        stepping all of them together in one SUMO instance. Each test
+        scores the same as a GammaCrossScenario run on its own.
+
+        :: Parameters ::
+            params : list[pd.Series]
+                Test parameters, one row per tile.
+            net_file : str
+                The tiled network SUMO runs, which must have at least
+                len(@params) tiles.
+        """
+        if net_file is None:
+            net_file = constants.traci.tiled_gamma_cross.net_file \
+                % constants.traci.tiled_gamma_cross.n_tiles
+        traci.simulation.loadState(
+            constants.traci.tiled_gamma_cross.init_state_file)
+
+        ai = GammaCrossAI(net_file)
+        self._scenarios = [
+            GammaCrossScenario(p, tiled_net.tile_prefix(i), run=False) \
+                for i, p in enumerate(params)
+        ]
+        self._n_steps = 0
+
+        # Same set up as GammaCrossScenario, with one departure step for all
+        for scenario in self.scenarios:
+            scenario.sync_tl_to_start_time()
+            scenario.depart_vehicles()
+            continue
+        traci.simulationStep()
+        for scenario in self.scenarios:
+            scenario.place_vehicles()
+            scenario.clear_polygons()
+            scenario.add_passenger_polygons()
+            scenario.start()
+            continue
+
+        """
+        Simulation Loop
+        """
+        running = list(self.scenarios)
+        coarse = False
+        while running and traci.simulation.getMinExpectedNumber() > 0:
+            if coarse:
+                traci.simulationStep(traci.simulation.getTime() \
+                    + constants.sumo.coarse_step_length)
+            else:
+                traci.simulationStep()
+            self._n_steps += 1
+
+            vehicle_ids = traci.vehicle.getIDList()
+            side_moves = ai.on_step()
+            collisions = traci.simulation.getCollisions()
+            for scenario in list(running):
+                if scenario.on_step(side_moves, vehicle_ids, collisions):
+                    continue
+                scenario.finish()
+                running.remove(scenario)
+                self.remove_vehicles(scenario, vehicle_ids)
+                continue
+
+            coarse = constants.sumo.adaptive_step and ai.idle \
+                and all(scenario.can_step_coarse() for scenario in running)
+            continue
+
+        for scenario in running:
+            scenario.finish()
+            continue
+        return
+
+    @property
+    def scenarios(self) -> list[GammaCrossScenario]:
+        """
+        The test of each tile.
+        """
+        return self._scenarios
+
+    @property
+    def scores(self) -> list[pd.Series]:
+        return [scenario.score for scenario in self.scenarios]
+
+    @property
+    def n_steps(self) -> int:
+        """
+        Number of client steps in the simulation loop, shared by all tiles.
+        """
+        return self._n_steps
+
+    def remove_vehicles(self, scenario : GammaCrossScenario,
+            vehicle_ids : tuple):
+        """
+        Takes the vehicles of a finished test out of the simulation so they
+        stop costing simulation time.
+        """
+        for vid in vehicle_ids:
+            if scenario.in_tile(vid):
+                traci.vehicle.remove(vid)
+            continue
+        return
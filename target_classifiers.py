@@ -0,0 +1,275 @@
+"""
+Declarative target score classifiers, shared by dino, monte_carlo, eda,
+derived_stats and the explainability models.
+
+A Measure reads one score column, optionally reducing a list column (like
+"collisions") to its length or to the sum of a field of its records, plus
+an optional count column for records the list did not keep. A Classifier
+compares a Measure to a value. Both compile to three forms:
+
+    classifier(score)       per-Series, as a scenarioxp target_score_classifier
+    classifier.frame(df)    one vectorized pass over a scores DataFrame
+    classifier.arrow(table) one pyarrow.compute pass over a scores table
+"""
+import operator
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+import constants
+
+# List column reductions
+LENGTH = "len"
+SUM = "sum"
+
+# Comparison ops as (Python, numpy, pyarrow.compute)
+OPS = {
+    ">" : (operator.gt, np.greater, pc.greater),
+    ">=" : (operator.ge, np.greater_equal, pc.greater_equal),
+    "<" : (operator.lt, np.less, pc.less),
+    "<=" : (operator.le, np.less_equal, pc.less_equal),
+    "==" : (operator.eq, np.equal, pc.equal),
+    "!=" : (operator.ne, np.not_equal, pc.not_equal)
+}
+
+class Measure:
+    def __init__(self, column : str, reduce : str = None, field : str = None,
+            default : float = None, extra : str = None):
+        """
+        A numeric value of each test, read from a score column.
+
+        :: Parameters ::
+            column : str
+                Score column.
+            reduce : str
+                LENGTH or SUM to reduce a list column, None for a scalar one.
+            field : str
+                Record field summed by SUM.
+            default : float
+                Value SUM counts for each record of a column whose records
+                lack @field. None raises a ValueError for such columns.
+            extra : str
+                Scalar score column added to the value where the scores
+                have it, e.g. the records a capped list column dropped.
+        """
+        if not reduce in [None, LENGTH, SUM]:
+            raise ValueError("Unknown reduction %s" % reduce)
+        if (reduce == SUM) != (field is not None):
+            raise ValueError("SUM needs a field, and only SUM takes one")
+        self._column = column
+        self._reduce = reduce
+        self._field = field
+        self._default = default
+        self._extra = extra
+        return
+
+    @property
+    def column(self) -> str:
+        return self._column
+
+    @property
+    def reduce(self) -> str:
+        return self._reduce
+
+    @property
+    def field(self) -> str:
+        return self._field
+
+    @property
+    def default(self) -> float:
+        return self._default
+
+    @property
+    def extra(self) -> str:
+        return self._extra
+
+    @property
+    def columns(self) -> list[str]:
+        """
+        Score columns read, the extra one only where present.
+        """
+        return [self.column] if self.extra is None \
+            else [self.column, self.extra]
+
+    def missing_field(self) -> ValueError:
+        return ValueError("%s records have no %s field" \
+            % (self.column, self.field))
+
+    def __repr__(self) -> str:
+        if self.reduce == LENGTH:
+            s = "len(%s)" % self.column
+        elif self.reduce == SUM:
+            s = "sum(%s.%s)" % (self.column, self.field)
+        else:
+            s = self.column
+        if self.extra is not None:
+            s += " + %s" % self.extra
+        return s
+
+    def __call__(self, score : pd.Series):
+        value = self.reduced(score)
+        if self.extra is not None and self.extra in score.index:
+            value += score[self.extra]
+        return value
+
+    def reduced(self, score : pd.Series):
+        """
+        Value of @score, before the extra column is added.
+        """
+        value = score[self.column]
+        if self.reduce == LENGTH:
+            return len(value)
+        if self.reduce == SUM:
+            total = 0
+            for record in value:
+                if self.field in record:
+                    total += record[self.field]
+                elif self.default is not None:
+                    total += self.default
+                else:
+                    raise self.missing_field()
+                continue
+            return total
+        return value
+
+    def arrow(self, table : pa.Table) -> pa.Array:
+        """
+        Values of every row of @table, or of the column itself (without
+        the extra column).
+        """
+        values = self.reduced_arrow(table.column(self.column) \
+            if isinstance(table, pa.Table) else table)
+        if self.extra is not None and isinstance(table, pa.Table) \
+                and self.extra in table.column_names:
+            extra = table.column(self.extra).combine_chunks()
+            values = pc.add(values, extra.cast(values.type))
+        return values
+
+    def reduced_arrow(self, column : pa.Array) -> pa.Array:
+        """
+        Values of every row of @column, before the extra column is added.
+        """
+        if isinstance(column, pa.ChunkedArray):
+            column = column.combine_chunks()
+        if self.reduce == LENGTH:
+            return pc.fill_null(pc.list_value_length(column), 0)\
+                .cast(pa.int64())
+        if self.reduce == SUM:
+            records = pc.list_flatten(column)
+            parents = pc.list_parent_indices(column).to_numpy()
+            if len(records) == 0:
+                # Also list<null>, the type of a column with no records
+                weights = np.zeros(0)
+            elif pa.types.is_struct(records.type) \
+                    and records.type.get_field_index(self.field) >= 0:
+                weights = pc.struct_field(records, self.field)\
+                    .to_numpy(zero_copy_only=False)
+            elif self.default is not None:
+                weights = np.full(len(records), float(self.default))
+            else:
+                raise self.missing_field()
+            sums = np.bincount(parents, weights = weights,
+                minlength = len(column))
+            return pa.array(sums, type=pa.float64())
+        return column
+
+    def frame(self, df : pd.DataFrame) -> np.ndarray:
+        """
+        Values of every row of @df.
+        """
+        if self.reduce is None:
+            values = df[self.column].to_numpy()
+        elif self.reduce == LENGTH and pd.api.types.is_integer_dtype(
+                df[self.column]):
+            # Already summarized, e.g. by DerivedStats.read_scores()
+            values = df[self.column].to_numpy()
+        else:
+            column = pa.array(df[self.column], from_pandas=True)
+            values = self.reduced_arrow(column)\
+                .to_numpy(zero_copy_only=False)
+        if self.extra is not None and self.extra in df.columns:
+            values = values + df[self.extra].to_numpy()
+        return values
+
+class Classifier:
+    def __init__(self, name : str, measure : Measure, op : str, value):
+        """
+        Target when @measure @op @value, e.g. sum(collisions.duration) > 10.
+        """
+        if not op in OPS:
+            raise ValueError("Unknown op %s" % op)
+        self._name = name
+        self._measure = measure
+        self._op = op
+        self._value = value
+        return
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @property
+    def measure(self) -> Measure:
+        return self._measure
+
+    @property
+    def column(self) -> str:
+        return self._measure.column
+
+    @property
+    def columns(self) -> list[str]:
+        return self._measure.columns
+
+    @property
+    def op(self) -> str:
+        return self._op
+
+    @property
+    def value(self):
+        return self._value
+
+    def __repr__(self) -> str:
+        return "%s: %r %s %r" % (self.name, self.measure, self.op, self.value)
+
+    def __call__(self, score : pd.Series) -> bool:
+        return bool(OPS[self.op][0](self.measure(score), self.value))
+
+    def test(self, values : np.ndarray) -> np.ndarray:
+        """
+        Classifies measured @values, e.g. a column derived earlier.
+        """
+        return OPS[self.op][1](np.asarray(values), self.value)
+
+    def frame(self, df : pd.DataFrame) -> np.ndarray:
+        """
+        Boolean target labels of every row of @df.
+        """
+        return self.test(self.measure.frame(df))
+
+    def arrow(self, table : pa.Table) -> pa.Array:
+        """
+        Boolean target labels of every row of @table, or of the column
+        itself.
+        """
+        values = self.measure.arrow(table)
+        return pc.fill_null(OPS[self.op][2](values, self.value), False)
+
+# Collision records written before contact events had a duration are one
+# record per step of contact
+CONTACT_TIME = Measure("collisions", SUM, "duration",
+    default = constants.sumo.step_length)
+# Tests keep at most constants.max_collision_events contact events and count
+# the rest
+N_COLLISIONS = Measure("collisions", LENGTH, extra = "n collisions dropped")
+
+COLLISION = Classifier("collision", CONTACT_TIME, ">",
+    constants.collision_target_contact_s)
+RUN_RED_LIGHT = Classifier("run red light", Measure("run red light"), "==",
+    True)
+SIDE_MOVE = Classifier("side move", Measure("side move"), ">=", 0)
+MANY_COLLISIONS = Classifier("n collisions > 100", N_COLLISIONS, ">", 100)
+
+# Targets estimated by monte_carlo and rare_event by default
+TARGETS = {c.name : c for c in [COLLISION, RUN_RED_LIGHT, SIDE_MOVE]}
@@ -0,0 +1,281 @@
+"""
+Live telemetry of a campaign in the Prometheus text format.
+
+The campaign loop only records events into in-memory counters and bounded
+buffers, which takes a lock for a few microseconds. A background thread
+renders the metrics every constants.telemetry.interval_s and writes them
+atomically to constants.telemetry.file, e.g. for node_exporter's textfile
+collector, and optionally serves them at http://host:port/metrics.
+
+    watch cat temp/telemetry.prom
+"""
+import collections
+import http.server
+import os
+import threading
+import time
+
+import numpy as np
+
+import constants
+
+QUANTILES = [0.5, 0.9, 0.99]
+
+class Telemetry:
+    def __init__(self,
+            fn : str = constants.telemetry.file,
+            interval_s : float = constants.telemetry.interval_s,
+            window_s : float = constants.telemetry.window_s,
+            http_port : int = constants.telemetry.http_port
+        ):
+        """
+        Campaign metrics, rendered in the background.
+
+        :: Parameters ::
+            fn : str
+                Prometheus text file to write. None to only serve HTTP.
+            interval_s : float
+                Seconds between renders.
+            window_s : float
+                Window of the throughput and utilization gauges.
+            http_port : int
+                Serve /metrics on this port when given.
+        """
+        self._fn = fn
+        self._interval_s = interval_s
+        self._window_s = window_s
+        self._lock = threading.Lock()
+        self._start = time.monotonic()
+
+        self._steps = collections.Counter()
+        self._kept = collections.Counter()
+        self._targets = collections.Counter()
+        self._tests = collections.Counter()
+        self._busy_s = collections.Counter()
+        self._recent = collections.defaultdict(collections.deque)
+        n = constants.telemetry.reservoir_size
+        self._test_s = collections.deque(maxlen=n)
+        self._sim_step_s = collections.deque(maxlen=n)
+        self._n_test_s = 0
+        self._sum_test_s = 0.0
+        self._sources = []
+
+        self._text = ""
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+        self._server = None
+        if http_port is not None:
+            self._server = http.server.ThreadingHTTPServer(
+                ("127.0.0.1", http_port), self._handler())
+            threading.Thread(target=self._server.serve_forever,
+                daemon=True).start()
+        return
+
+    @property
+    def text(self) -> str:
+        """
+        The last rendered metrics.
+        """
+        return self._text
+
+    def observe_stage(self, stage : str, steps : int, kept : int,
+            targets : int):
+        """
+        Adds explorer progress of @stage: @steps explorer steps, of which
+        @kept ran a new test, @targets of them hitting the target.
+        """
+        with self._lock:
+            self._steps[stage] += steps
+            self._kept[stage] += kept
+            self._targets[stage] += targets
+        return
+
+    def observe_test(self, worker : str, elapsed_s : float, n_steps : int = 0):
+        """
+        A test that took @elapsed_s of wall time on @worker, over @n_steps
+        simulation steps when known.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._tests[worker] += 1
+            self._busy_s[worker] += elapsed_s
+            self._recent[worker].append((now, elapsed_s))
+            self._test_s.append(elapsed_s)
+            self._n_test_s += 1
+            self._sum_test_s += elapsed_s
+            if n_steps > 0:
+                self._sim_step_s.append(elapsed_s / n_steps)
+        return
+
+    def add_source(self, fn):
+        """
+        Adds a callable returning {name : value} gauges, read at every
+        render, e.g. the queue sizes of campaign.JobBoard.stats().
+        """
+        self._sources.append(fn)
+        return
+
+    def _snapshot(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            for recent in self._recent.values():
+                while recent and recent[0][0] < now - self._window_s:
+                    recent.popleft()
+                    continue
+                continue
+            return {
+                "now" : now,
+                "steps" : dict(self._steps),
+                "kept" : dict(self._kept),
+                "targets" : dict(self._targets),
+                "tests" : dict(self._tests),
+                "busy_s" : dict(self._busy_s),
+                "recent_s" : {w : sum(e for t, e in r) \
+                    for w, r in self._recent.items()},
+                "recent_n" : {w : len(r) for w, r in self._recent.items()},
+                "test_s" : np.array(self._test_s),
+                "sim_step_s" : np.array(self._sim_step_s),
+                "n_test_s" : self._n_test_s,
+                "sum_test_s" : self._sum_test_s
+            }
+
+    def render(self) -> str:
+        """
+        All metrics in the Prometheus text format.
+        """
+        snap = self._snapshot()
+        window = min(self._window_s, max(snap["now"] - self._start, 1e-9))
+        lines = []
+        def metric(name, kind, help, samples):
+            lines.append("# HELP %s %s" % (name, help))
+            lines.append("# TYPE %s %s" % (name, kind))
+            for labels, value in samples:
+                label = ",".join('%s="%s"' % kv for kv in labels.items())
+                lines.append("%s%s %s" % (name,
+                    "{%s}" % label if label else "", _format(value)))
+                continue
+            return
+
+        stages = sorted(snap["steps"])
+        metric("dino_explorer_steps_total", "counter",
+            "Explorer steps per stage.",
+            [({"stage" : s}, snap["steps"][s]) for s in stages])
+        metric("dino_tests_total", "counter",
+            "Tests kept per stage.",
+            [({"stage" : s}, snap["kept"][s]) for s in stages])
+        metric("dino_targets_total", "counter",
+            "Tests classified as targets per stage.",
+            [({"stage" : s}, snap["targets"][s]) for s in stages])
+        metric("dino_skip_ratio", "gauge",
+            "Skipped over total explorer steps per stage.",
+            [({"stage" : s}, 1 - snap["kept"][s] / snap["steps"][s]) \
+                for s in stages if snap["steps"][s] > 0])
+        metric("dino_target_hit_rate", "gauge",
+            "Targets over kept tests per stage.",
+            [({"stage" : s}, snap["targets"][s] / snap["kept"][s]) \
+                for s in stages if snap["kept"][s] > 0])
+
+        workers = sorted(snap["tests"])
+        metric("dino_tests_per_second", "gauge",
+            "Tests finished per second over the last window.",
+            [({}, sum(snap["recent_n"].values()) / window)])
+        metric("dino_worker_tests_total", "counter",
+            "Tests run per worker.",
+            [({"worker" : w}, snap["tests"][w]) for w in workers])
+        metric("dino_worker_busy_seconds_total", "counter",
+            "Seconds spent running tests per worker.",
+            [({"worker" : w}, snap["busy_s"][w]) for w in workers])
+        metric("dino_worker_utilization", "gauge",
+            "Busy fraction of each worker over the last window.",
+            [({"worker" : w}, min(1.0, snap["recent_s"].get(w, 0) / window)) \
+                for w in workers])
+
+        for name, key, help, count, total in [
+                ("dino_test_seconds", "test_s", "Wall time per test.",
+                    snap["n_test_s"], snap["sum_test_s"]),
+                ("dino_sim_step_seconds", "sim_step_s",
+                    "Wall time per simulation step.", None, None)]:
+            values = snap[key]
+            samples = []
+            if len(values) > 0:
+                samples = [({"quantile" : str(q)}, v) for q, v in \
+                    zip(QUANTILES, np.quantile(values, QUANTILES))]
+            metric(name, "summary", help + " Recent quantiles.", samples)
+            if count is not None:
+                lines.append("%s_count %d" % (name, count))
+                lines.append("%s_sum %s" % (name, _format(total)))
+            continue
+
+        for source in self._sources:
+            try:
+                gauges = source()
+            except Exception:
+                continue
+            for name, value in gauges.items():
+                metric("dino_%s" % name, "gauge", name.replace("_", " ") + ".",
+                    [({}, value)])
+                continue
+            continue
+
+        metric("dino_uptime_seconds", "gauge", "Seconds since start.",
+            [({}, snap["now"] - self._start)])
+        return "\n".join(lines) + "\n"
+
+    def flush(self):
+        """
+        Renders now and writes the file.
+        """
+        self._text = self.render()
+        if self._fn is not None:
+            os.makedirs(os.path.dirname(self._fn) or ".", exist_ok=True)
+            tmp_fn = "%s.%d.tmp" % (self._fn, os.getpid())
+            with open(tmp_fn, "w") as f:
+                f.write(self._text)
+            os.replace(tmp_fn, self._fn)
+        return
+
+    def _run(self):
+        while not self._stop.wait(self._interval_s):
+            self.flush()
+            continue
+        return
+
+    def close(self):
+        """
+        Stops the background thread and the server after a last render.
+        """
+        self._stop.set()
+        self._thread.join()
+        self.flush()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+        return
+
+    def _handler(self):
+        telemetry = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                body = telemetry.text.encode()
+                self.send_response(200)
+                self.send_header("Content-Type",
+                    "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                return
+
+            def log_message(self, format, *args):
+                return
+        return Handler
+
+def _format(value) -> str:
+    if isinstance(value, (int, np.integer)):
+        return str(int(value))
+    return "%.6g" % value
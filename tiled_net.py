@@ -0,0 +1,166 @@
+"""
+Tiles K disconnected copies of a SUMO network, and its routes, into one
+network so that one SUMO instance can run K tests side by side.
+
+Tile i has every edge, lane, junction, TL, route and vehicle id prefixed
+with tile_prefix(i), e.g. "1si_0" -> "t1_1si_0" and ":0_11_0" ->
+":t1_0_11_0", and is shifted by i * spacing meters along x.
+"""
+import copy
+import os
+import xml.etree.ElementTree as ET
+
+import constants
+
+# Attributes holding one id, or a space separated list of ids
+ID_ATTRIBUTES = {
+    "edge" : ["id", "from", "to"],
+    "lane" : ["id"],
+    "junction" : ["id"],
+    "connection" : ["from", "to", "via", "tl"],
+    "tlLogic" : ["id"],
+}
+ID_LIST_ATTRIBUTES = {
+    "junction" : ["incLanes", "intLanes"],
+}
+SHAPE_ATTRIBUTES = ["shape"]
+
+def tile_prefix(i : int) -> str:
+    return "t%d_" % i
+
+def prefix_id(prefix : str, sumo_id : str) -> str:
+    """
+    @sumo_id inside the tile with @prefix. Internal ids keep their leading
+    ":", which the scenario code relies on.
+    """
+    if sumo_id.startswith(":"):
+        return ":%s%s" % (prefix, sumo_id[1:])
+    return prefix + sumo_id
+
+def local_id(prefix : str, sumo_id : str) -> str:
+    """
+    Inverse of prefix_id(). Ids from other tiles are returned unchanged.
+    """
+    if not prefix:
+        return sumo_id
+    if sumo_id.startswith(":" + prefix):
+        return ":" + sumo_id[len(prefix) + 1:]
+    if sumo_id.startswith(prefix):
+        return sumo_id[len(prefix):]
+    return sumo_id
+
+def _shift_shape(shape : str, dx : float) -> str:
+    points = []
+    for xy in shape.split():
+        x, y = xy.split(",")[:2]
+        points.append("%.2f,%s" % (float(x) + dx, y))
+        continue
+    return " ".join(points)
+
+def _tile_element(el : ET.Element, prefix : str, dx : float):
+    """
+    Prefixes the ids and shifts the shapes of @el and its children in place.
+    """
+    for node in el.iter():
+        for attr in ID_ATTRIBUTES.get(node.tag, []):
+            if attr in node.attrib:
+                node.attrib[attr] = prefix_id(prefix, node.attrib[attr])
+            continue
+        for attr in ID_LIST_ATTRIBUTES.get(node.tag, []):
+            if attr in node.attrib:
+                node.attrib[attr] = " ".join(
+                    prefix_id(prefix, x) for x in node.attrib[attr].split())
+            continue
+        for attr in SHAPE_ATTRIBUTES:
+            if attr in node.attrib:
+                node.attrib[attr] = _shift_shape(node.attrib[attr], dx)
+            continue
+        if node.tag == "junction":
+            node.attrib["x"] = "%.2f" % (float(node.attrib["x"]) + dx)
+        continue
+    return
+
+def tile_net(net_file : str, out_file : str, k : int, spacing : float):
+    """
+    Writes @k tiles of the network @net_file to @out_file.
+    """
+    tree = ET.parse(net_file)
+    root = tree.getroot()
+    elements = [el for el in root if el.tag != "location"]
+    for el in elements:
+        root.remove(el)
+        continue
+
+    for i in range(k):
+        prefix = tile_prefix(i)
+        for el in elements:
+            tiled = copy.deepcopy(el)
+            _tile_element(tiled, prefix, i * spacing)
+            root.append(tiled)
+            continue
+        continue
+
+    # Grow the boundary to cover every tile
+    location = root.find("location")
+    x0, y0, x1, y1 = [float(v) for v in location.attrib["convBoundary"].split(",")]
+    location.attrib["convBoundary"] = "%.2f,%.2f,%.2f,%.2f" % (
+        x0, y0, x1 + (k - 1) * spacing, y1)
+
+    tree.write(out_file, encoding="UTF-8", xml_declaration=True)
+    return
+
+def tile_routes(route_file : str, out_file : str, k : int):
+    """
+    Writes @k tiles of the routes in @route_file to @out_file. Vehicle types
+    are shared by all tiles and written once.
+    """
+    tree = ET.parse(route_file)
+    root = tree.getroot()
+    routes = [el for el in root if el.tag == "route"]
+    for el in routes:
+        root.remove(el)
+        continue
+
+    for i in range(k):
+        prefix = tile_prefix(i)
+        for el in routes:
+            tiled = copy.deepcopy(el)
+            tiled.attrib["id"] = prefix + el.attrib["id"]
+            tiled.attrib["edges"] = " ".join(
+                prefix_id(prefix, e) for e in el.attrib["edges"].split())
+            root.append(tiled)
+            continue
+        continue
+
+    tree.write(out_file, encoding="UTF-8", xml_declaration=True)
+    return
+
+def build(k : int = constants.traci.tiled_gamma_cross.n_tiles,
+        spacing : float = constants.traci.tiled_gamma_cross.tile_spacing
+    ) -> dict:
+    """
+    Generates the tiled gamma_cross network and routes for @k tiles, unless
+    they are newer than the gamma_cross files already.
+
+    :: Return ::
+        SUMO arguments for the tiled files, like
+        constants.traci.gamma_cross.config.
+    """
+    net_file = constants.traci.tiled_gamma_cross.net_file % k
+    route_files = constants.traci.tiled_gamma_cross.route_files % k
+    sources = [constants.traci.gamma_cross.net_file,
+        constants.traci.gamma_cross.route_files]
+    outputs = [net_file, route_files]
+    if not all(os.path.exists(fn) for fn in outputs) \
+            or max(map(os.path.getmtime, sources)) \
+                > min(map(os.path.getmtime, outputs)):
+        os.makedirs(os.path.dirname(net_file), exist_ok=True)
+        tile_net(constants.traci.gamma_cross.net_file, net_file, k, spacing)
+        tile_routes(constants.traci.gamma_cross.route_files, route_files, k)
+    return {
+        "--net-file" : net_file,
+        "--route-files" : route_files,
+    }
+
+if __name__ == "__main__":
+    print(build())
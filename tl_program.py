@@ -0,0 +1,215 @@
+"""
+Analytic model of a static SUMO traffic light program.
+
+The gamma_cross TL runs a fixed tlLogic, so its state at any time follows
+from the phase durations alone. TLProgram parses the tlLogic once and
+answers state_at(), phase_index() and time_to_next_switch() by table
+lookup, without TraCI. It also gives the share of a time window in which a
+signal is red, which pre-screens red light exposure from time0 before a
+test is simulated.
+
+Program time is SUMO time minus the tlLogic offset. A GammaCrossScenario
+starts at program time time0 (see GammaCrossScenario.tl_time()), which
+reproduces the "tl state (on enter)" SUMO reported for every test of the
+out/mc campaigns.
+"""
+import functools
+import math
+import xml.etree.ElementTree as ET
+from fractions import Fraction
+
+import numpy as np
+
+import constants
+
+# Signal states that count as red, as in GammaCrossScenario's run red light
+RED = "r"
+
+# Guards the phase lookup against sums like 45.1 - 12.1 = 32.99999...
+EPS = 1e-6
+
+class TLProgram:
+    def __init__(self,
+            tl_id : str,
+            phases : list[tuple[float, str]],
+            offset : float = 0.
+        ):
+        """
+        A static TL program.
+
+        :: Parameters ::
+            tl_id : str
+                TL id in the network.
+            phases : list[tuple[float, str]]
+                (duration, state) of each phase, in order.
+            offset : float
+                tlLogic offset (s).
+        """
+        self._tl_id = tl_id
+        self._phases = phases
+        self._offset = offset
+
+        durations = np.array([duration for duration, _ in phases])
+        self._ends = np.cumsum(durations)
+        self._starts = self._ends - durations
+        self._cycle = float(self._ends[-1])
+
+        # Phase of each slot of the cycle, slots being the largest step
+        # that divides every phase boundary
+        boundaries = [Fraction(float(end)).limit_denominator(1000) \
+            for end in self._ends]
+        quantum = functools.reduce(math.gcd, [b.numerator for b in boundaries]) \
+            / functools.reduce(math.lcm, [b.denominator for b in boundaries])
+        slot_starts = np.arange(round(self._cycle / quantum)) * quantum
+        self._quantum = quantum
+        self._slot_phase = np.searchsorted(self._ends, slot_starts + EPS,
+            side="right")
+
+        self._state_index = {}
+        for i, (_, state) in enumerate(phases):
+            self._state_index.setdefault(state, i)
+            continue
+        return
+
+    @staticmethod
+    def from_net(net_file : str, tl_id : str = None) -> "TLProgram":
+        """
+        The tlLogic @tl_id (the first one by default) of @net_file.
+        """
+        root = ET.parse(net_file).getroot()
+        for tl in root.iter("tlLogic"):
+            if tl_id is None or tl.attrib["id"] == tl_id:
+                return TLProgram(
+                    tl.attrib["id"],
+                    [(float(p.attrib["duration"]), p.attrib["state"]) \
+                        for p in tl.iter("phase")],
+                    float(tl.attrib.get("offset", 0.))
+                )
+            continue
+        raise KeyError("No tlLogic %s in %s" % (tl_id, net_file))
+
+    @property
+    def tl_id(self) -> str:
+        return self._tl_id
+
+    @property
+    def phases(self) -> list[tuple[float, str]]:
+        return self._phases
+
+    @property
+    def offset(self) -> float:
+        return self._offset
+
+    @property
+    def cycle(self) -> float:
+        """
+        Cycle length (s).
+        """
+        return self._cycle
+
+    @property
+    def state_index(self) -> dict[str, int]:
+        """
+        Phase index of each state string.
+        """
+        return self._state_index
+
+    def cycle_time(self, t):
+        """
+        Position of program time @t (scalar or array) within the cycle.
+        """
+        return np.mod(np.asarray(t, dtype=float) - self.offset + EPS,
+            self.cycle)
+
+    def phase_index(self, t):
+        """
+        Index of the phase running at time @t (scalar or array).
+        """
+        n_slots = len(self._slot_phase)
+        if np.ndim(t) == 0:
+            # Per-step calls skip numpy's scalar overhead
+            ct = (float(t) - self.offset + EPS) % self.cycle
+            return int(self._slot_phase[min(int(ct // self._quantum), n_slots - 1)])
+        slot = (self.cycle_time(t) // self._quantum).astype(int)
+        return self._slot_phase[np.minimum(slot, n_slots - 1)]
+
+    def state_at(self, t : float) -> str:
+        """
+        Signal state string at time @t.
+        """
+        return self.phases[self.phase_index(t)][1]
+
+    def time_to_next_switch(self, t):
+        """
+        Time (s) from @t (scalar or array) until the next phase starts.
+        """
+        remaining = self._ends[self.phase_index(t)] - self.cycle_time(t) + EPS
+        return float(remaining) if np.ndim(remaining) == 0 else remaining
+
+    def red_time(self, t0, t1, link_index : int):
+        """
+        Seconds in [@t0, @t1] (scalars or arrays) during which signal
+        @link_index is red.
+        """
+        red = np.array([state[link_index] == RED \
+            for _, state in self.phases], dtype=float)
+        durations = self._ends - self._starts
+        # Red time from the cycle start to the start of each phase
+        prefix = np.concatenate([[0.], np.cumsum(red * durations)])
+
+        def cumulative(t):
+            n_cycles = np.floor(
+                (np.asarray(t, dtype=float) - self.offset + EPS) / self.cycle)
+            i = self.phase_index(t)
+            return n_cycles * prefix[-1] + prefix[i] \
+                + (self.cycle_time(t) - self._starts[i]) * red[i]
+        return cumulative(t1) - cumulative(t0)
+
+    def red_exposure(self,
+            time0,
+            link_index : int,
+            window : tuple[float, float] = None
+        ):
+        """
+        Share of the arrival window after @time0 (scalar or array) during
+        which signal @link_index is red, an estimate of red light exposure
+        that needs no simulation.
+
+        :: Parameters ::
+            time0 : float or np.ndarray
+                Program time at the start of the test.
+            link_index : int
+                Signal index, e.g. constants.traci.gamma_cross.tl_order.
+            window : tuple[float, float]
+                Earliest and latest arrival (s after time0), by default
+                constants.tl_program.arrival_window.
+
+        :: Return ::
+            Red share in [0, 1], per time0.
+        """
+        if window is None:
+            window = constants.tl_program.arrival_window
+        a, b = window
+        time0 = np.asarray(time0, dtype=float)
+        return self.red_time(time0 + a, time0 + b, link_index) / (b - a)
+
+@functools.lru_cache(maxsize=None)
+def gamma_cross() -> TLProgram:
+    """
+    The TL program of the gamma_cross network, shared by all tiles of a
+    tiled network.
+    """
+    return TLProgram.from_net(
+        constants.traci.gamma_cross.net_file,
+        constants.traci.gamma_cross.tl_id
+    )
+
+def dut_red_exposure(time0, window : tuple[float, float] = None):
+    """
+    TLProgram.red_exposure() of the DUT's signal on its route
+    (constants.traci.gamma_cross.dut_route).
+    """
+    i_tl = constants.traci.gamma_cross.tl_order[
+        constants.traci.gamma_cross.dut_route
+    ]
+    return gamma_cross().red_exposure(time0, i_tl, window)
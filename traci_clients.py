@@ -1,4 +1,5 @@
 import shutil
+import socket
 import warnings
 if shutil.which("sumo") is None:
     warnings.warn("Cannot find sumo/tools in the system path. Please verify that the lastest SUMO is installed from https://www.eclipse.org/sumo/")
@@ -91,7 +92,8 @@ class TraCIClient:
         return    
 
 class GenericClient(TraCIClient):
-    def __init__(self, new_config : dict):
+    def __init__(self, new_config : dict,
+            init_state_fn : str = constants.sumo.init_state_file):
         config = {
             "gui" : constants.sumo.gui,
             "--error-log" : constants.sumo.error_log_file,
@@ -115,11 +117,38 @@ class GenericClient(TraCIClient):
         for key, val in new_config.items():
             config[key] = val
 
-        self._init_state_fn = constants.sumo.init_state_file
+        self._init_state_fn = init_state_fn
         super().__init__(config)
         traci.simulation.saveState(self._init_state_fn)
         return
 
     @property
     def init_state_fn(self) -> str:
-        return self._init_state_fn
\ No newline at end of file
+        return self._init_state_fn
+
+def free_port() -> int:
+    """
+    A TCP port on this host that is free right now.
+    """
+    with socket.socket() as s:
+        s.bind(("", 0))
+        return s.getsockname()[1]
+
+class WorkerClient(GenericClient):
+    def __init__(self, new_config : dict, name : str):
+        """
+        GenericClient for one of several SUMO processes on the same host.
+        Each gets a free port and its own initial state file (init_state_fn),
+        which the scenarios it runs must be given.
+
+        --- Parameters ---
+        new_config : dict
+            SUMO arguments, as for GenericClient.
+        name : str
+            Unique name of the process, used in the state file name.
+        """
+        config = dict(new_config)
+        config["--remote-port"] = free_port()
+        init_state_fn = "%s/init-state-%s.xml" % (constants.output_dir, name)
+        super().__init__(config, init_state_fn)
+        return
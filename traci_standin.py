@@ -0,0 +1,769 @@
+"""
+SUMO-free stand-ins for the traci module.
+
+ScriptedTraCI is a small kinematic world built from the gamma_cross net and
+route files. Vehicles follow their routes lane by lane at a speed that
+ramps up to the vehicle type's max speed. There is no car following, and
+collisions come only from a script. That is enough to drive
+GammaCrossScenario end to end and measure the client-side cost of the
+scenario loop and its metrics without a SUMO process.
+
+TraCIRecorder wraps a real connection (or a ScriptedTraCI) and logs every
+request with its response. TraCIReplay serves a saved log back with no
+simulation behind it, checking that the client asks the same questions.
+
+Use install() to swap any of them in for the traci module that scenarios
+and traci_clients talk to:
+
+    with traci_standin.install(traci_standin.ScriptedTraCI()):
+        scenarios.GammaCrossScenario(params)
+"""
+import contextlib
+import math
+import pickle
+import xml.etree.ElementTree as ET
+
+import constants
+
+try:
+    from traci._simulation import Collision
+except ImportError:
+    class Collision:
+        def __init__(self, collider, victim, colliderType, victimType,
+                colliderSpeed, victimSpeed, collisionType, lane, pos):
+            self.collider = collider
+            self.victim = victim
+            self.colliderType = colliderType
+            self.victimType = victimType
+            self.colliderSpeed = colliderSpeed
+            self.victimSpeed = victimSpeed
+            self.type = collisionType
+            self.lane = lane
+            self.pos = pos
+            return
+
+HALTING_SPEED = 0.1 # m/s, same threshold SUMO uses
+
+# TraCI domains scenarios and traci_clients use
+DOMAINS = ["simulation", "vehicle", "edge", "lane", "polygon", "trafficlight",
+    "gui"]
+
+# Module-level traci functions
+CONTROL = ["simulationStep", "start", "init", "setOrder", "close"]
+
+class ReplayMismatch(Exception):
+    def __init__(self, i_call : int, expected : tuple, actual : tuple):
+        """
+        The client sent a request the replayed log does not have.
+        """
+        self.i_call = i_call
+        self.expected = expected
+        self.actual = actual
+        super().__init__("Call %d: recorded %s, requested %s" % (
+            i_call, _format_call(expected), _format_call(actual)))
+        return
+
+def _format_call(call : tuple) -> str:
+    if call is None:
+        return "end of log"
+    domain, method, args, kwargs = call[:4]
+    name = method if not domain else "%s.%s" % (domain, method)
+    params = [repr(a) for a in args] + \
+        ["%s=%r" % (k, v) for k, v in sorted(kwargs.items())]
+    return "%s(%s)" % (name, ", ".join(params))
+
+class Network:
+    def __init__(self, net_file : str, route_files : str):
+        """
+        Lanes, connections, routes, vehicle types and the TL program of a
+        SUMO network, parsed once.
+        """
+        self.lanes = {}          # lane id -> (length, shape, speed)
+        self.edges = {}          # edge id -> [lane id]
+        self.connections = {}    # (from edge, to edge) -> [(from lane, via, to lane)]
+        self.routes = {}         # route id -> [edge id]
+        self.vtypes = {}         # type id -> attributes
+        self.tl_programs = {}    # tl id -> [(duration, state)]
+
+        root = ET.parse(net_file).getroot()
+        for e in root.iter("edge"):
+            lanes = []
+            for l in e.iter("lane"):
+                shape = [tuple(float(v) for v in xy.split(",")) \
+                    for xy in l.attrib["shape"].split()]
+                self.lanes[l.attrib["id"]] = (
+                    float(l.attrib["length"]),
+                    shape,
+                    float(l.attrib["speed"])
+                )
+                lanes.append(l.attrib["id"])
+                continue
+            self.edges[e.attrib["id"]] = lanes
+            continue
+
+        for c in root.iter("connection"):
+            key = (c.attrib["from"], c.attrib["to"])
+            self.connections.setdefault(key, []).append((
+                int(c.attrib["fromLane"]),
+                c.attrib.get("via"),
+                int(c.attrib["toLane"])
+            ))
+            continue
+
+        for tl in root.iter("tlLogic"):
+            self.tl_programs[tl.attrib["id"]] = [
+                (float(p.attrib["duration"]), p.attrib["state"]) \
+                    for p in tl.iter("phase")
+            ]
+            continue
+
+        for fn in route_files.split(","):
+            root = ET.parse(fn).getroot()
+            for r in root.iter("route"):
+                self.routes[r.attrib["id"]] = r.attrib["edges"].split()
+                continue
+            for t in root.iter("vType"):
+                self.vtypes[t.attrib["id"]] = t.attrib
+                continue
+            continue
+        return
+
+    @staticmethod
+    def edge_of(lane_id : str) -> str:
+        return lane_id.rsplit("_", 1)[0]
+
+    @staticmethod
+    def index_of(lane_id : str) -> int:
+        return int(lane_id.rsplit("_", 1)[1])
+
+    def next_lane(self, lane_id : str, to_edge : str) -> str:
+        """
+        The lane following @lane_id towards @to_edge, or None.
+        """
+        edge = self.edge_of(lane_id)
+        conns = self.connections.get((edge, to_edge))
+        if not conns:
+            return None
+        index = self.index_of(lane_id)
+        matches = [c for c in conns if c[0] == index] or conns
+        from_lane, via, to_lane = matches[0]
+        if via is not None:
+            return via
+        return "%s_%d" % (to_edge, to_lane)
+
+    def position(self, lane_id : str, pos : float) -> tuple:
+        """
+        (x, y, angle) at @pos meters along @lane_id.
+        SUMO angles are in degrees, clockwise from north.
+        """
+        length, shape, speed = self.lanes[lane_id]
+        if len(shape) == 1:
+            return shape[0] + (0.0,)
+        # Lane lengths and shape lengths differ in internal lanes
+        shape_len = sum(math.dist(a, b) for a, b in zip(shape, shape[1:]))
+        target = pos * shape_len / length if length > 0 else 0
+        for a, b in zip(shape, shape[1:]):
+            seg = math.dist(a, b)
+            if target <= seg or b == shape[-1]:
+                f = min(target / seg, 1) if seg > 0 else 0
+                x = a[0] + f * (b[0] - a[0])
+                y = a[1] + f * (b[1] - a[1])
+                angle = (90 - math.degrees(math.atan2(b[1]-a[1], b[0]-a[0]))) % 360
+                return (x, y, angle)
+            target -= seg
+            continue
+        raise AssertionError("unreachable")
+
+class _Vehicle:
+    __slots__ = ["vid", "type_id", "route", "i_route", "lane", "pos", "speed",
+        "max_speed", "accel", "decel", "e_decel", "color", "speed_mode",
+        "lane_change_mode"]
+
+class _Polygon:
+    __slots__ = ["shape", "color", "vid", "anchor", "anchor_angle"]
+
+class _Domain:
+    def __init__(self, world):
+        self._world = world
+        return
+
+class _Simulation(_Domain):
+    def getTime(self) -> float:
+        return self._world.time
+
+    def getMinExpectedNumber(self) -> int:
+        return len(self._world.vehicles)
+
+    def getCollisions(self) -> list:
+        return self._world.collisions.get(round(self._world.time, 3), [])
+
+    def loadState(self, fn : str):
+        self._world.reset()
+        return
+
+    def saveState(self, fn : str):
+        return
+
+class _Vehicle_Domain(_Domain):
+    def getIDList(self) -> tuple:
+        return tuple(self._world.vehicles.keys())
+
+    def add(self, vehID, routeID, typeID="DEFAULT_VEHTYPE", depart=None,
+            departLane="first", departPos="base", departSpeed="0", **kwargs):
+        w = self._world
+        v = _Vehicle()
+        vtype = w.net.vtypes.get(typeID, {})
+        v.vid = vehID
+        v.type_id = typeID
+        v.route = w.net.routes[routeID]
+        v.i_route = 0
+        lanes = w.net.edges[v.route[0]]
+        index = departLane if isinstance(departLane, int) else 0
+        v.lane = lanes[min(index, len(lanes)-1)]
+        v.pos = 0.0
+        v.speed = float(departSpeed)
+        v.max_speed = float(vtype.get("maxSpeed", 13.89))
+        v.accel = float(vtype.get("accel", 2.6))
+        v.decel = float(vtype.get("decel", 4.5))
+        v.e_decel = float(vtype.get("emergencyDecel", 9.0))
+        v.color = None
+        v.speed_mode = 31
+        v.lane_change_mode = constants.traci.default_lane_change_behavior
+        w.pending[vehID] = v
+        return
+
+    def _get(self, vid : str) -> _Vehicle:
+        # Vehicles added this step are not departed yet but can be configured
+        if vid in self._world.pending:
+            return self._world.pending[vid]
+        return self._world.vehicles[vid]
+
+    def getLaneID(self, vid : str) -> str:
+        return self._get(vid).lane
+
+    def getLanePosition(self, vid : str) -> float:
+        return self._get(vid).pos
+
+    def getTypeID(self, vid : str) -> str:
+        return self._get(vid).type_id
+
+    def getSpeed(self, vid : str) -> float:
+        return self._get(vid).speed
+
+    def getAcceleration(self, vid : str) -> float:
+        return 0.0
+
+    def getDecel(self, vid : str) -> float:
+        return self._get(vid).decel
+
+    def getEmergencyDecel(self, vid : str) -> float:
+        return self._get(vid).e_decel
+
+    def getPosition(self, vid : str) -> tuple:
+        v = self._get(vid)
+        return self._world.net.position(v.lane, v.pos)[:2]
+
+    def getAngle(self, vid : str) -> float:
+        v = self._get(vid)
+        return self._world.net.position(v.lane, v.pos)[2]
+
+    def getLeader(self, vid : str, dist : float = 100.0):
+        v = self._get(vid)
+        ahead = [(o.pos - v.pos, o.vid) for o in self._world.on_lane(v.lane) \
+            if o.pos > v.pos]
+        if not ahead:
+            return None
+        gap, leader = min(ahead)
+        if gap > dist:
+            return None
+        return (leader, gap)
+
+    def moveTo(self, vid : str, laneID : str, pos : float, reason : int = 0):
+        v = self._get(vid)
+        v.lane = laneID
+        v.pos = float(pos)
+        self._world.lane_index = None
+        edge = Network.edge_of(laneID)
+        if edge in v.route:
+            v.i_route = v.route.index(edge)
+        return
+
+    def setRouteID(self, vid : str, routeID : str):
+        v = self._get(vid)
+        v.route = self._world.net.routes[routeID]
+        edge = Network.edge_of(v.lane)
+        v.i_route = v.route.index(edge) if edge in v.route else 0
+        return
+
+    def setColor(self, vid : str, color : tuple):
+        self._get(vid).color = color
+        return
+
+    def setSpeedMode(self, vid : str, speedMode : int):
+        self._get(vid).speed_mode = speedMode
+        return
+
+    def setLaneChangeMode(self, vid : str, laneChangeMode : int):
+        v = self._get(vid)
+        v.lane_change_mode = laneChangeMode
+        return
+
+    def highlight(self, vid : str, *args, **kwargs):
+        return
+
+    def remove(self, vid : str, reason : int = 3):
+        self._world.vehicles.pop(vid, None)
+        self._world.pending.pop(vid, None)
+        self._world.lane_index = None
+        return
+
+class _Edge(_Domain):
+    def getLastStepVehicleIDs(self, edgeID : str) -> tuple:
+        return tuple(v.vid for lane in self._world.net.edges.get(edgeID, []) \
+            for v in self._world.on_lane(lane))
+
+class _Lane(_Domain):
+    def getLength(self, laneID : str) -> float:
+        return self._world.net.lanes[laneID][0]
+
+    def getLastStepVehicleIDs(self, laneID : str) -> tuple:
+        return tuple(v.vid for v in self._world.on_lane(laneID))
+
+    def getLastStepVehicleNumber(self, laneID : str) -> int:
+        return len(self.getLastStepVehicleIDs(laneID))
+
+    def getLastStepHaltingNumber(self, laneID : str) -> int:
+        return sum(1 for v in self._world.on_lane(laneID) \
+            if v.speed < HALTING_SPEED)
+
+class _PolygonDomain(_Domain):
+    def getIDList(self) -> tuple:
+        return tuple(self._world.polygons.keys())
+
+    def add(self, polygonID, shape, color, fill=False, polygonType="",
+            layer=0, lineWidth=1):
+        p = _Polygon()
+        p.shape = [tuple(xy) for xy in shape]
+        p.color = color
+        p.vid = None
+        p.anchor = None
+        p.anchor_angle = 0.0
+        self._world.polygons[polygonID] = p
+        return
+
+    def addDynamics(self, polygonID, trackedObjectID="", timeSpan=(),
+            alphaSpan=(), looped=False, rotate=True):
+        p = self._world.polygons[polygonID]
+        x, y, angle = self._world.vehicle_pose(trackedObjectID)
+        p.vid = trackedObjectID
+        p.anchor = (x, y)
+        p.anchor_angle = angle
+        return
+
+    def remove(self, polygonID, layer=0):
+        del self._world.polygons[polygonID]
+        return
+
+    def getShape(self, polygonID) -> tuple:
+        p = self._world.polygons[polygonID]
+        if p.vid is None or not p.vid in self._world.vehicles:
+            return tuple(p.shape)
+        x, y, angle = self._world.vehicle_pose(p.vid)
+        # SUMO angles turn clockwise
+        rad = math.radians(p.anchor_angle - angle)
+        c, s = math.cos(rad), math.sin(rad)
+        ax, ay = p.anchor
+        return tuple(
+            (x + c*(px-ax) - s*(py-ay), y + s*(px-ax) + c*(py-ay)) \
+                for px, py in p.shape
+        )
+
+class _TrafficLight(_Domain):
+    def getIDList(self) -> tuple:
+        return tuple(self._world.net.tl_programs.keys())
+
+    def _cycle_time(self, tlsID : str) -> tuple:
+        """
+        Phases of @tlsID and the current time within its cycle.
+        """
+        phases = self._world.net.tl_programs[tlsID]
+        cycle = sum(d for d, _ in phases)
+        shift = self._world.tl_shift.get(tlsID, 0.0)
+        return phases, (self._world.time + shift) % cycle
+
+    def _phase(self, tlsID : str) -> tuple:
+        """
+        Index of the current phase and the time spent in it.
+        """
+        phases, t = self._cycle_time(tlsID)
+        for i, (duration, state) in enumerate(phases):
+            if t < duration:
+                return i, t
+            t -= duration
+            continue
+        return len(phases) - 1, phases[-1][0]
+
+    def _shift_to(self, tlsID : str, cycle_t : float):
+        """
+        Shifts the program of @tlsID so that it is at @cycle_t now.
+        """
+        phases = self._world.net.tl_programs[tlsID]
+        cycle = sum(d for d, _ in phases)
+        self._world.tl_shift[tlsID] = (cycle_t - self._world.time) % cycle
+        return
+
+    def getRedYellowGreenState(self, tlsID : str) -> str:
+        i, t = self._phase(tlsID)
+        return self._world.net.tl_programs[tlsID][i][1]
+
+    def setPhase(self, tlsID : str, index : int):
+        phases = self._world.net.tl_programs[tlsID]
+        self._shift_to(tlsID, sum(d for d, _ in phases[:index]))
+        return
+
+    def setPhaseDuration(self, tlsID : str, phaseDuration : float):
+        phases = self._world.net.tl_programs[tlsID]
+        i, t = self._phase(tlsID)
+        end = sum(d for d, _ in phases[:i + 1])
+        self._shift_to(tlsID, end - phaseDuration)
+        return
+
+class _Gui(_Domain):
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+class ScriptedTraCI:
+    def __init__(self,
+            net_file : str = constants.traci.gamma_cross.net_file,
+            route_files : str = constants.traci.gamma_cross.route_files,
+            step_length : float = constants.sumo.step_length,
+            collisions : dict = None
+        ):
+        """
+        A module-like stand-in for traci backed by a scripted world.
+
+        :: Parameters ::
+            net_file, route_files : str
+                SUMO network and route files the world is built from.
+            step_length : float
+                Simulated seconds per simulationStep().
+            collisions : dict
+                Scripted collisions, {time : [Collision]}, reported by
+                simulation.getCollisions() at that simulation time.
+        """
+        self.net = Network(net_file, route_files)
+        self.step_length = step_length
+        self.collisions = {round(t, 3) : c for t, c in (collisions or {}).items()}
+
+        self.simulation = _Simulation(self)
+        self.vehicle = _Vehicle_Domain(self)
+        self.edge = _Edge(self)
+        self.lane = _Lane(self)
+        self.polygon = _PolygonDomain(self)
+        self.trafficlight = _TrafficLight(self)
+        self.gui = _Gui(self)
+
+        self.n_steps = 0
+        self.polygons = {}
+        self.reset()
+        return
+
+    def reset(self):
+        """
+        Back to the initial state: time 0 and no vehicles.
+        """
+        self.time = 0.0
+        self.vehicles = {}
+        self.pending = {}
+        self.tl_shift = {}
+        self.lane_index = None
+        return
+
+    def on_lane(self, lane_id : str) -> list:
+        """
+        Vehicles on @lane_id, from an index rebuilt after vehicles move.
+        """
+        if self.lane_index is None:
+            self.lane_index = {}
+            for v in self.vehicles.values():
+                self.lane_index.setdefault(v.lane, []).append(v)
+                continue
+        return self.lane_index.get(lane_id, [])
+
+    def vehicle_pose(self, vid : str) -> tuple:
+        v = self.vehicles[vid]
+        return self.net.position(v.lane, v.pos)
+
+    def simulationStep(self, step : float = 0.0):
+        """
+        Advance one step, or until time @step when it is given.
+        """
+        target = step if step > 0 else self.time + self.step_length
+        while True:
+            self._step()
+            if self.time >= target - 1e-9:
+                break
+            continue
+        return
+
+    def _step(self):
+        self.n_steps += 1
+        self.time = round(self.time + self.step_length, 6)
+        self.vehicles.update(self.pending)
+        self.pending = {}
+        self.lane_index = None
+
+        dt = self.step_length
+        arrived = []
+        for v in self.vehicles.values():
+            limit = min(v.max_speed, self.net.lanes[v.lane][2])
+            v.speed = min(limit, v.speed + v.accel * dt)
+            v.pos += v.speed * dt
+
+            # Follow the route through the lanes
+            while v.pos > self.net.lanes[v.lane][0]:
+                overflow = v.pos - self.net.lanes[v.lane][0]
+                edge = Network.edge_of(v.lane)
+                if edge == v.route[v.i_route]:
+                    if v.i_route + 1 >= len(v.route):
+                        arrived.append(v.vid)
+                        break
+                    to_edge = v.route[v.i_route + 1]
+                else:
+                    # On an internal lane
+                    to_edge = v.route[v.i_route + 1]
+                nxt = self.net.next_lane(v.lane, to_edge)
+                if nxt is None:
+                    arrived.append(v.vid)
+                    break
+                if Network.edge_of(nxt) == to_edge:
+                    v.i_route += 1
+                v.lane = nxt
+                v.pos = overflow
+                continue
+            continue
+
+        for vid in arrived:
+            del self.vehicles[vid]
+            continue
+        return
+
+    def start(self, cmd, port=None, **kwargs):
+        return
+
+    def init(self, port=None, **kwargs):
+        return
+
+    def setOrder(self, order : int):
+        return
+
+    def close(self):
+        return
+
+class _RecordingDomain:
+    def __init__(self, recorder, name : str, domain):
+        self._recorder = recorder
+        self._name = name
+        self._domain = domain
+        return
+
+    def __getattr__(self, method : str):
+        fn = getattr(self._domain, method)
+        def call(*args, **kwargs):
+            return self._recorder.call(self._name, method, fn, args, kwargs)
+        # Cache the wrapper so later lookups skip __getattr__
+        setattr(self, method, call)
+        return call
+
+class TraCIRecorder:
+    def __init__(self, backend):
+        """
+        Passes every TraCI request to @backend and logs it with its response.
+
+        :: Parameters ::
+            backend : module or ScriptedTraCI
+                The traci module of a live connection, or a stand-in.
+        """
+        self._backend = backend
+        self._calls = []
+        for name in DOMAINS:
+            setattr(self, name,
+                _RecordingDomain(self, name, getattr(backend, name)))
+            continue
+        for method in CONTROL:
+            setattr(self, method, self._control(method))
+            continue
+        return
+
+    @property
+    def calls(self) -> list:
+        """
+        Logged requests, as (domain, method, args, kwargs, response).
+        Module-level functions have an empty domain.
+        """
+        return self._calls
+
+    def _control(self, method : str):
+        fn = getattr(self._backend, method)
+        def call(*args, **kwargs):
+            return self.call("", method, fn, args, kwargs)
+        return call
+
+    def call(self, domain : str, method : str, fn, args : tuple,
+            kwargs : dict):
+        response = fn(*args, **kwargs)
+        self._calls.append((domain, method, args, kwargs, response))
+        return response
+
+    def save(self, fn : str, meta : dict = None):
+        """
+        Writes the log to @fn with any @meta data, such as the parameter rows
+        and scores of the recorded tests.
+        """
+        with open(fn, "wb") as f:
+            pickle.dump({"meta" : meta or {}, "calls" : self.calls}, f,
+                protocol=pickle.HIGHEST_PROTOCOL)
+        return
+
+class _ReplayDomain:
+    def __init__(self, replay, name : str):
+        self._replay = replay
+        self._name = name
+        return
+
+    def __getattr__(self, method : str):
+        def call(*args, **kwargs):
+            return self._replay.call(self._name, method, args, kwargs)
+        setattr(self, method, call)
+        return call
+
+class TraCIReplay:
+    def __init__(self, calls : list, strict : bool = True):
+        """
+        Answers TraCI requests from a recorded log.
+
+        :: Parameters ::
+            calls : list
+                The calls of a TraCIRecorder.
+            strict : bool
+                When True, requests must arrive in exactly the recorded order.
+                When False, requests between two simulation steps may come
+                in any order and be repeated, so refactors that reorder or
+                drop queries still replay; setters are accepted and ignored.
+                Repeats of a request get its recorded answers in order.
+        """
+        self._calls = calls
+        self._strict = strict
+        self._i = 0
+        self._step_answers = None
+        for name in DOMAINS:
+            setattr(self, name, _ReplayDomain(self, name))
+            continue
+        for method in CONTROL:
+            setattr(self, method, self._control(method))
+            continue
+        return
+
+    @classmethod
+    def load(cls, fn : str, strict : bool = True):
+        """
+        Replay of the log saved at @fn, and that log's meta data.
+        """
+        with open(fn, "rb") as f:
+            data = pickle.load(f)
+        return cls(data["calls"], strict), data["meta"]
+
+    @property
+    def n_replayed(self) -> int:
+        """
+        Log entries consumed so far.
+        """
+        return self._i
+
+    def rewind(self, i_call : int = 0):
+        """
+        Replay again from log entry @i_call.
+        """
+        self._i = i_call
+        self._step_answers = None
+        return
+
+    def _control(self, method : str):
+        def call(*args, **kwargs):
+            return self.call("", method, args, kwargs)
+        return call
+
+    def call(self, domain : str, method : str, args : tuple, kwargs : dict):
+        request = (domain, method, args, kwargs)
+        if self._strict:
+            if self._i >= len(self._calls):
+                raise ReplayMismatch(self._i, None, request)
+            recorded = self._calls[self._i]
+            if recorded[:4] != request:
+                raise ReplayMismatch(self._i, recorded, request)
+            self._i += 1
+            return recorded[4]
+        return self._lenient(request)
+
+    def _lenient(self, request : tuple):
+        if self._step_answers is None:
+            self._index_step()
+
+        domain, method = request[:2]
+        if not domain and method == "simulationStep":
+            # Move on to the requests following the next recorded step
+            while self._i < len(self._calls):
+                recorded = self._calls[self._i]
+                self._i += 1
+                if recorded[:4] == request:
+                    self._index_step()
+                    return recorded[4]
+                continue
+            raise ReplayMismatch(self._i, None, request)
+
+        key = _freeze(request)
+        if key in self._step_answers:
+            # Repeated requests get the recorded answers in order, then
+            # the last one again
+            answers = self._step_answers[key]
+            if len(answers) > 1:
+                return answers.pop(0)
+            return answers[0]
+        if method.startswith(("set", "add", "move", "remove", "highlight")) \
+                or domain == "gui" or not domain:
+            return None
+        raise ReplayMismatch(self._i, None, request)
+
+    def _index_step(self):
+        """
+        Answers recorded between the current position and the next step.
+        """
+        self._step_answers = {}
+        for recorded in self._calls[self._i:]:
+            if not recorded[0] and recorded[1] == "simulationStep":
+                break
+            self._step_answers.setdefault(_freeze(recorded[:4]), []) \
+                .append(recorded[4])
+            continue
+        return
+
+def _freeze(request : tuple) -> tuple:
+    domain, method, args, kwargs = request
+    return (domain, method, repr(args), repr(sorted(kwargs.items())))
+
+@contextlib.contextmanager
+def install(standin):
+    """
+    Temporarily replace the traci module used by scenarios and traci_clients
+    with @standin.
+    """
+    import scenarios
+    import traci_clients
+    prev = (scenarios.traci, traci_clients.traci)
+    scenarios.traci = standin
+    traci_clients.traci = standin
+    try:
+        yield standin
+    finally:
+        scenarios.traci, traci_clients.traci = prev
+    return
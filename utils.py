@@ -1,10 +1,13 @@
+from __future__ import annotations
 import xml.etree.ElementTree as ET
-from typing import List, Tuple
-import numpy as np
-from shapely.geometry import Polygon
-import matplotlib.pyplot as plt
-import pandas as pd
-import pickle
+from typing import List, Tuple, TYPE_CHECKING
+import hashlib
+
+# numpy, shapely, matplotlib, pandas and pickle are imported where they are
+# used, so headless workers and short CLI runs do not pay for them on import.
+if TYPE_CHECKING:
+	from shapely.geometry import Polygon
+	import pandas as pd
 
 def mps2kph(mps : float) -> float:
     return 3.6 * mps
@@ -38,6 +41,9 @@ def passenger_polygon(
 	:: RETURN ::
 	A Shapely Polygon which marks the boundary of a sumo passenger vehicle.
 	"""
+	import numpy as np
+	from shapely.geometry import Polygon
+
 	rad = np.deg2rad(deg)
 	points = np.array([
 		(0.5, -0.31063829787234043),
@@ -76,6 +82,8 @@ def passenger_polygon(
 	return Polygon(final_points)
 
 def plot_polygon(polygon : Polygon):
+	import matplotlib.pyplot as plt
+
 	# Extract the x and y coordinates of the Polygon
 	x, y = polygon.exterior.xy
 
@@ -91,6 +99,8 @@ def plot_polygon(polygon : Polygon):
 	return 
 
 def plot_car_polygons(dut_polygon : Polygon, foe_polygon : Polygon):
+	import matplotlib.pyplot as plt
+
 	# plt.clf()
 	plt.figure()
 
@@ -160,6 +170,7 @@ def save(data, fn : str):
 	"""
 	Saves a python @data to file @fn
 	"""
+	import pickle
 	with open(fn, "wb") as f:
 		pickle.dump(data, f)
 	return
@@ -168,6 +179,27 @@ def load(fn : str):
 	"""
 	Loads data from filename @fn
 	"""
+	import pickle
 	with open(fn, "rb") as f:
 		data = pickle.load(f)
-	return data
\ No newline at end of file
+	return data
+
+def file_digest(fn : str, chunk_size : int = 1 << 20) -> str:
+	"""
+	Content hash (sha256) of the file @fn
+	"""
+	digest = hashlib.sha256()
+	with open(fn, "rb") as f:
+		for chunk in iter(lambda: f.read(chunk_size), b""):
+			digest.update(chunk)
+	return digest.hexdigest()
+
+def files_digest(fns : list[str]) -> str:
+	"""
+	Short hash of the contents of @fns, e.g. the code a cache derives from
+	"""
+	digest = hashlib.sha256()
+	for fn in fns:
+		digest.update(file_digest(fn).encode())
+		continue
+	return digest.hexdigest()[:16]